@@ -1 +1 @@
-from .json_server import start_server
+from .json_server import start_server
@@ -0,0 +1,469 @@
+from typing import Dict, List, Optional, Tuple
+from http.client import HTTPConnection
+from threading import Thread, Lock
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+import subprocess
+import platform
+import tempfile
+import random
+import shlex
+import shutil
+import click
+import json
+import time
+import sys
+import os
+
+COLUMN_KINDS = ("int", "float", "category", "text", "date")
+OPERATIONS = ("page", "filter", "write", "bulk")
+WORDS = ("lorem ipsum dolor sit amet consectetur adipiscing elit sed do "
+         "eiusmod tempor incididunt ut labore et dolore magna aliqua").split()
+
+
+def column_names(kinds: List[str]) -> List[str]:
+    """
+    Names of the generated columns, <kind>_<position>
+    :param kinds:
+    :return:
+    """
+    return [f"{kind}_{position}" for position, kind in enumerate(kinds, 1)]
+
+
+def random_columns(rng: np.random.Generator, kinds: List[str],
+                   rows: int) -> Dict[str, np.ndarray]:
+    """
+    Random values of each column kind
+    :param rng:
+    :param kinds:
+    :param rows:
+    :return:
+    """
+    columns = dict()
+    for name, kind in zip(column_names(kinds), kinds):
+        if kind == "int":
+            columns[name] = rng.integers(0, 1000000, rows)
+        elif kind == "float":
+            columns[name] = np.round(rng.random(rows) * 1000, 2)
+        elif kind == "category":
+            columns[name] = np.array([f"c{i}" for i in range(8)])[
+                rng.integers(0, 8, rows)]
+        elif kind == "text":
+            words = np.array(WORDS)[rng.integers(0, len(WORDS), (rows, 6))]
+            columns[name] = np.array([" ".join(row) for row in words])
+        elif kind == "date":
+            columns[name] = (pd.Timestamp("2020-01-01") + pd.to_timedelta(
+                rng.integers(0, 3650, rows), unit="D")).strftime("%Y-%m-%d")
+        else:
+            raise ValueError(f"Unknown column kind {kind}")
+    return columns
+
+
+def generate_data(file_path: str, rows: int, kinds: List[str],
+                  seed: int = 0, chunk_rows: int = 100000):
+    """
+    Write a synthetic collection of rows records (ids 1..rows), a chunk at
+    a time so ten million rows do not have to fit in memory twice
+    :param file_path:
+    :param rows:
+    :param kinds:
+    :param seed:
+    :param chunk_rows:
+    :return:
+    """
+    rng = np.random.default_rng(seed)
+    with open(file_path, "w", encoding="utf-8") as f:
+        f.write("[")
+        separator = "\n"
+        for start in range(0, rows, chunk_rows):
+            size = min(chunk_rows, rows - start)
+            chunk = pd.DataFrame({"id": np.arange(start + 1, start + size + 1),
+                                  **random_columns(rng, kinds, size)})
+            f.write(separator)
+            f.write(chunk.to_json(orient="records", lines=True)
+                    .strip().replace("\n", ",\n"))
+            separator = ",\n"
+        f.write("\n]\n")
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    """
+    Weights of the operations of a workload ("page=40,filter=30,...")
+    :param mix:
+    :return:
+    """
+    weights = dict()
+    for part in mix.split(","):
+        name, _, weight = part.strip().partition("=")
+        if name not in OPERATIONS:
+            raise ValueError(f"Unknown operation {name}")
+        weights[name] = float(weight or 1)
+    if sum(weights.values()) <= 0:
+        raise ValueError("The workload has no operations")
+    return weights
+
+
+def percentile(latencies: List[float], percent: float) -> float:
+    """
+    Nearest rank percentile of sorted latencies
+    :param latencies:
+    :param percent:
+    :return:
+    """
+    if len(latencies) == 0:
+        return 0.0
+    rank = max(0, int(np.ceil(percent / 100 * len(latencies))) - 1)
+    return latencies[rank]
+
+
+def summary(latencies: List[float], errors: int, seconds: float) -> Dict:
+    """
+    Throughput and latency (ms) of a set of requests
+    :param latencies: seconds, sorted
+    :param errors:
+    :param seconds:
+    :return:
+    """
+    return {"requests": len(latencies), "errors": errors,
+            "throughput_rps": round(len(latencies) / seconds, 2),
+            "latency_ms": {
+                "mean": round(float(np.mean(latencies)) * 1000, 3)
+                if len(latencies) != 0 else 0.0,
+                "p50": round(percentile(latencies, 50) * 1000, 3),
+                "p95": round(percentile(latencies, 95) * 1000, 3),
+                "p99": round(percentile(latencies, 99) * 1000, 3),
+                "max": round(max(latencies, default=0.0) * 1000, 3)}}
+
+
+def _graphql_value(value) -> str:
+    if isinstance(value, dict):
+        return "{%s}" % ", ".join(f"{key}: {_graphql_value(item)}"
+                                  for key, item in value.items())
+    if isinstance(value, list):
+        return "[%s]" % ", ".join(_graphql_value(item) for item in value)
+    return json.dumps(value)
+
+
+def _camel(name: str) -> str:
+    first, *rest = name.split("_")
+    return first + "".join(part.title() for part in rest)
+
+
+class Workload:
+    """
+    Requests of the mixed workload against the samples collection: random
+    pages, filtered GETs, point updates and bulk writes, over REST or
+    GraphQL
+    """
+
+    def __init__(self, server_type: str, kinds: List[str], rows: int,
+                 page_size: int = 20, bulk_size: int = 100):
+        self.server_type = server_type
+        self.kinds = kinds
+        self.columns = column_names(kinds)
+        self.rows = rows
+        self.page_size = page_size
+        self.bulk_size = bulk_size
+
+    def records(self, rng: random.Random, count: int = 1) -> List[Dict]:
+        """
+        Random records (without id)
+        :param rng:
+        :param count:
+        :return:
+        """
+        values = random_columns(np.random.default_rng(rng.getrandbits(32)),
+                                self.kinds, count)
+        return [dict(zip(self.columns, row)) for row in zip(
+            *[values[col].tolist() for col in self.columns])]
+
+    def _filters(self, rng: random.Random) -> List[Tuple[str, object]]:
+        filters = list()
+        for col, kind in zip(self.columns, self.kinds):
+            if kind == "category":
+                filters.append((col, f"c{rng.randrange(8)}"))
+            elif kind == "int" and len(filters) < 2:
+                low = rng.randrange(1000000)
+                filters.append((f"{col}_gte", low))
+                filters.append((f"{col}_lte", low + 10000))
+        return filters[:3]
+
+    def request(self, op: str, rng: random.Random) -> Tuple[str, str,
+                                                            Optional[str]]:
+        """
+        Method, path and body of an operation
+        :param op:
+        :param rng:
+        :return:
+        """
+        page = rng.randint(1, max(1, self.rows // self.page_size))
+        id = rng.randint(1, self.rows)
+        if self.server_type == "graph_ql":
+            return self._graphql(op, rng, page, id)
+        if op == "page":
+            return ("GET", f"/api/v1/samples/?page_num={page}&"
+                           f"page_size={self.page_size}", None)
+        if op == "filter":
+            query = "&".join(f"{col}={value}"
+                             for col, value in self._filters(rng))
+            return ("GET", f"/api/v1/samples/?{query}&"
+                           f"page_size={self.page_size}", None)
+        if op == "write":
+            return ("PUT", f"/api/v1/samples/{id}",
+                    json.dumps(self.records(rng)[0]))
+        return ("POST", "/api/v1/samples/_bulk",
+                json.dumps(self._bulk_items(rng)))
+
+    def _bulk_items(self, rng: random.Random) -> List[Dict]:
+        # half updates of existing records, half creates
+        return [{"op": "update", "id": rng.randint(1, self.rows),
+                 "record": record} if i % 2 == 0
+                else {"op": "create", "record": record}
+                for i, record in enumerate(self.records(rng,
+                                                        self.bulk_size))]
+
+    def _graphql(self, op: str, rng: random.Random, page: int,
+                 id: int) -> Tuple[str, str, str]:
+        fields = " ".join(["id"] + [_camel(col) for col in self.columns])
+        if op in ("page", "filter"):
+            args = {"pageNum": page, "pageSize": self.page_size} \
+                if op == "page" else dict(
+                    [(_camel(col), value) for col, value
+                     in self._filters(rng)], pageSize=self.page_size)
+            query = "{ samples(%s) { totalItems pageData { items { %s } } } " \
+                    "}" % (_graphql_value(args)[1:-1], fields)
+        elif op == "write":
+            record = {_camel(col): value
+                      for col, value in self.records(rng)[0].items()}
+            query = "mutation { updateSamples(id: %d, updateRecord: %s) " \
+                    "{ message } }" % (id, _graphql_value(record))
+        else:
+            items = [dict(item, record={_camel(col): value for col, value
+                                        in item["record"].items()})
+                     for item in self._bulk_items(rng)]
+            query = "mutation { bulkSamples(items: %s) { message } }" \
+                % _graphql_value(items)
+        return "POST", "/api/v1/graphql", json.dumps({"query": query})
+
+
+def drive(host: str, port: int, workload: Workload, mix: Dict[str, float],
+          concurrency: int, seconds: float, seed: int = 0) -> Dict:
+    """
+    Run the mixed workload from concurrency keep-alive connections for
+    seconds
+    :param host:
+    :param port:
+    :param workload:
+    :param mix:
+    :param concurrency:
+    :param seconds:
+    :param seed:
+    :return: per operation latencies (seconds) and error counts
+    """
+    lock = Lock()
+    latencies: Dict[str, List[float]] = {op: list() for op in mix}
+    errors: Dict[str, int] = {op: 0 for op in mix}
+    ops, weights = list(mix), list(mix.values())
+    deadline = time.perf_counter() + seconds
+
+    def client(number: int):
+        rng = random.Random(seed * 1000 + number)
+        connection = HTTPConnection(host, port, timeout=60)
+        own = {op: list() for op in mix}
+        failed = {op: 0 for op in mix}
+        while time.perf_counter() < deadline:
+            op = rng.choices(ops, weights)[0]
+            method, path, body = workload.request(op, rng)
+            started = time.perf_counter()
+            try:
+                connection.request(method, path, body=body, headers={
+                    "Content-Type": "application/json"})
+                response = connection.getresponse()
+                content = response.read()
+                # an empty page or filter is a 404
+                ok = (response.status < 400 or (
+                    method == "GET" and response.status == 404)) and not (
+                    workload.server_type == "graph_ql" and
+                    b'"errors"' in content)
+            except Exception:
+                connection.close()
+                ok = False
+            own[op].append(time.perf_counter() - started)
+            if not ok:
+                failed[op] += 1
+        connection.close()
+        with lock:
+            for op in mix:
+                latencies[op].extend(own[op])
+                errors[op] += failed[op]
+
+    threads = [Thread(target=client, args=(number,), daemon=True)
+               for number in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {"latencies": latencies, "errors": errors}
+
+
+def wait_for(host: str, port: int, process: subprocess.Popen,
+             timeout: float) -> float:
+    """
+    Wait for the server to answer
+    :param host:
+    :param port:
+    :param process:
+    :param timeout:
+    :return: seconds it took
+    """
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        if process.poll() is not None:
+            raise RuntimeError("The server exited while starting")
+        try:
+            connection = HTTPConnection(host, port, timeout=5)
+            connection.request("GET", "/api/v1")
+            connection.getresponse().read()
+            connection.close()
+            return time.perf_counter() - started
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("The server did not start in time")
+
+
+def run(rows: int, kinds: List[str], server_type: str, mix: Dict[str, float],
+        concurrency: int, seconds: float, warmup: float, port: int,
+        server_args: List[str], data_path: str, startup_timeout: float,
+        page_size: int = 20, bulk_size: int = 100, seed: int = 0) -> Dict:
+    """
+    Generate a collection, start a server on it and drive the workload
+    :return: the report of this dataset size
+    """
+    os.makedirs(data_path, exist_ok=True)
+    started = time.perf_counter()
+    generate_data(os.path.join(data_path, "samples.json"), rows, kinds, seed)
+    generate_seconds = time.perf_counter() - started
+    host = "127.0.0.1"
+    log_path = os.path.join(data_path, "server.log")
+    with open(log_path, "w") as log:
+        process = subprocess.Popen(
+            [sys.executable, "-m", "fast_json_server.json_server",
+             "--data_path", data_path, "--host", host, "--port", str(port),
+             "--log_level", "warning", "--server_type", server_type,
+             *server_args], stdout=log, stderr=subprocess.STDOUT)
+    try:
+        startup_seconds = wait_for(host, port, process, startup_timeout)
+        workload = Workload(server_type, kinds, rows, page_size, bulk_size)
+        if warmup > 0:
+            drive(host, port, workload, mix, concurrency, warmup, seed + 1)
+        started = time.perf_counter()
+        result = drive(host, port, workload, mix, concurrency, seconds, seed)
+        elapsed = time.perf_counter() - started
+    except Exception:
+        with open(log_path) as log:
+            print(log.read())
+        raise
+    finally:
+        process.terminate()
+        try:
+            process.wait(startup_timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    latencies = {op: sorted(values)
+                 for op, values in result["latencies"].items()}
+    total = sorted(value for values in latencies.values() for value in values)
+    return {"rows": rows,
+            "generate_seconds": round(generate_seconds, 3),
+            "startup_seconds": round(startup_seconds, 3),
+            **summary(total, sum(result["errors"].values()), elapsed),
+            "operations": {op: summary(latencies[op], result["errors"][op],
+                                       elapsed) for op in latencies}}
+
+
+@click.command()
+@click.option('--rows', '-r',
+              help='Dataset sizes to run, comma separated (1e3,1e5,1e7)',
+              default="1e3,1e5")
+@click.option('--columns', '-c',
+              help=f'Column kinds of the samples collection '
+                   f'({", ".join(COLUMN_KINDS)})',
+              default="int,float,category,text,date")
+@click.option('--server_type', '-st',
+              help='Server Type (rest_api or graph_ql)', default="rest_api")
+@click.option('--mix', '-m',
+              help='Operation weights of the workload',
+              default="page=40,filter=40,write=15,bulk=5")
+@click.option('--concurrency', '-cc',
+              help='Concurrent client connections', default=8)
+@click.option('--duration', '-d',
+              help='Seconds each dataset is driven for', default=10.0)
+@click.option('--warmup', '-wu',
+              help='Seconds of unrecorded requests first', default=2.0)
+@click.option('--page_size', '-ps',
+              help='Records per page and filtered GET', default=20)
+@click.option('--bulk_size', '-bs',
+              help='Items per bulk write', default=100)
+@click.option('--port', '-p',
+              help='Port of the benchmarked server', default=3999)
+@click.option('--server_args', '-sa',
+              help='Extra server options ("--storage sqlite --workers 2")',
+              default="")
+@click.option('--data_path', '-dp',
+              help='Directory of the generated data (default: a temporary '
+                   'one, removed afterwards)', default="")
+@click.option('--startup_timeout', '-t',
+              help='Seconds to wait for the server to load the data',
+              default=600.0)
+@click.option('--seed', '-s',
+              help='Seed of the data and the workload', default=0)
+@click.option('--output', '-o',
+              help='JSON report path', default="bench.json")
+def __start_cli_bench(rows: str, columns: str, server_type: str, mix: str,
+                      concurrency: int, duration: float, warmup: float,
+                      page_size: int, bulk_size: int, port: int,
+                      server_args: str, data_path: str,
+                      startup_timeout: float, seed: int, output: str):
+    kinds = [kind.strip() for kind in columns.split(",") if kind.strip()]
+    unknown = [kind for kind in kinds if kind not in COLUMN_KINDS]
+    if len(unknown) != 0:
+        raise click.BadParameter(f"Unknown column kinds {unknown}")
+    if server_type not in ("rest_api", "graph_ql"):
+        raise click.BadParameter("rest_api or graph_ql are allowed")
+    try:
+        weights = parse_mix(mix)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    sizes = [int(float(size)) for size in rows.split(",") if size.strip()]
+    root = data_path or tempfile.mkdtemp(prefix="fast_json_bench_")
+    report = {"started": datetime.now(timezone.utc).isoformat(),
+              "server_type": server_type, "columns": kinds, "mix": weights,
+              "concurrency": concurrency, "duration": duration,
+              "page_size": page_size, "bulk_size": bulk_size,
+              "server_args": server_args, "seed": seed,
+              "python": platform.python_version(),
+              "pandas": pd.__version__, "platform": platform.platform(),
+              "cpus": os.cpu_count(), "runs": list()}
+    try:
+        for size in sizes:
+            print(f"Benchmarking {size} rows....")
+            result = run(size, kinds, server_type, weights, concurrency,
+                         duration, warmup, port, shlex.split(server_args),
+                         os.path.join(root, str(size)), startup_timeout,
+                         page_size, bulk_size, seed)
+            report["runs"].append(result)
+            latency = result["latency_ms"]
+            print(f"{size} rows: {result['throughput_rps']} req/s, "
+                  f"p50 {latency['p50']} ms, p95 {latency['p95']} ms, "
+                  f"p99 {latency['p99']} ms, {result['errors']} errors")
+            # written after every size, a long run keeps what it measured
+            with open(output, "w") as f:
+                json.dump(report, f, indent=2)
+    finally:
+        if data_path == "":
+            shutil.rmtree(root, ignore_errors=True)
+    print(f"Report written to {output}")
+
+
+if __name__ == "__main__":
+    __start_cli_bench()
@@ -0,0 +1,89 @@
+from typing import Optional, Tuple
+from collections import OrderedDict
+from threading import Lock
+from hashlib import blake2b
+from uuid import uuid4
+
+
+class ResponseCache:
+    """
+    Bounded LRU of encoded GET responses. Entries are keyed by their ETag,
+    which hashes the collection, its version and the normalized request,
+    so a mutation makes every older entry unreachable and it ages out.
+    The tags also carry a per-process epoch, as versions restart at 0.
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self.epoch = uuid4().hex
+        self.lock = Lock()
+        self.entries: OrderedDict = OrderedDict()
+
+    def tag(self, collection, request, version: Optional[int] = None) -> str:
+        """
+        ETag of a request against the current collection version (call
+        under collection.read()) or a given one
+        :param collection:
+        :param request: normalized request parameters
+        :param version: default collection.version
+        :return:
+        """
+        version = collection.version if version is None else version
+        key = repr((self.epoch, collection.name, version,
+                    request)).encode("utf-8")
+        return '"%s"' % blake2b(key, digest_size=16).hexdigest()
+
+    def get(self, tag: str) -> Optional[Tuple[int, bytes]]:
+        """
+        Cached (status code, body) of a tag
+        :param tag:
+        :return:
+        """
+        with self.lock:
+            entry = self.entries.get(tag)
+            if entry is not None:
+                self.entries.move_to_end(tag)
+            return entry
+
+    def put(self, tag: str, status_code: int, content: bytes):
+        """
+        Cache a response, evicting the least recently used ones
+        :param tag:
+        :param status_code:
+        :param content:
+        :return:
+        """
+        if self.max_entries <= 0:
+            return
+        with self.lock:
+            self.entries[tag] = (status_code, content)
+            self.entries.move_to_end(tag)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Drop every entry (a collection was added or removed, and a new one
+        of the same name starts again at version 0)
+        :return:
+        """
+        with self.lock:
+            self.entries.clear()
+
+
+def not_modified(if_none_match: Optional[str], tag: str) -> bool:
+    """
+    Whether an If-None-Match header matches an ETag
+    :param if_none_match:
+    :param tag:
+    :return:
+    """
+    if if_none_match is None:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == "*" or candidate == tag:
+            return True
+    return False
@@ -0,0 +1,1566 @@
+from typing import Dict, Optional, Any, List, Set, Tuple, Iterator, Callable
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_numeric_dtype, is_datetime64_any_dtype, \
+    is_object_dtype, is_string_dtype, is_integer_dtype, is_float_dtype
+import json
+import base64
+from bisect import bisect_right
+from itertools import islice
+from threading import Lock, Thread, Condition, Event
+from contextlib import contextmanager, nullcontext
+import os
+import time
+from .journal import Journal, Flusher, replace_file
+from .indexes import SortedIndex, TextIndex, tokenize, TOKEN_PATTERN
+from .snapshot import write_snapshot, file_signature, sniff_data
+from .metrics import timed, scanned
+
+
+def select_columns(columns: List[str], option: Optional[str]) -> List[str]:
+    """
+    Columns picked by a comma separated option ("all" / "none" / "a,b")
+    :param columns:
+    :param option:
+    :return:
+    """
+    if option is None or option == "all":
+        return list(columns)
+    if option == "none":
+        return list()
+    picked = [col.strip() for col in option.split(",")]
+    return [col for col in columns if col in picked]
+
+
+def is_text(series: pd.Series) -> bool:
+    """
+    Whether a column holds strings (plain or categorical)
+    :param series:
+    :return:
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return is_string_dtype(series.cat.categories.dtype) or \
+            is_object_dtype(series.cat.categories.dtype)
+    return (is_object_dtype(series) or is_string_dtype(series)) and \
+        not is_datetime64_any_dtype(series)
+
+
+def column_kinds(data: pd.DataFrame) -> List[Tuple[str, str]]:
+    """
+    Columns with the kind of values the routes and types are generated for
+    (int, float, date or other), to tell whether a new file changes them
+    :param data:
+    :return:
+    """
+    kinds = list()
+    for col in data.columns:
+        if is_integer_dtype(data[col]):
+            kind = "int"
+        elif is_float_dtype(data[col]):
+            kind = "float"
+        elif is_datetime64_any_dtype(data[col]):
+            kind = "date"
+        else:
+            kind = "other"
+        kinds.append((col, kind))
+    return kinds
+
+
+def plain(series: pd.Series) -> pd.Series:
+    """
+    A categorical column as plain values, for order comparisons
+    :param series:
+    :return:
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.astype(series.cat.categories.dtype)
+    return series
+
+
+class RWLock:
+    """
+    Readers share the lock, a writer holds it alone. Waiting writers keep
+    new readers out so a steady read load cannot starve writes: a read
+    waits for the write in progress and for the writes queued before it.
+    The readers waiting when a write ends go before the next one, so
+    back-to-back writes (the chunks of a bulk) cannot starve reads either.
+    """
+
+    def __init__(self):
+        self._cond = Condition(Lock())
+        self._readers = 0
+        self._writing = False
+        self._waiting_writers = 0
+        self._waiting_readers = 0
+        # readers let in ahead of the waiting writers
+        self._admitted = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            self._waiting_readers += 1
+            while self._writing or \
+                    (self._waiting_writers != 0 and self._admitted == 0):
+                self._cond.wait()
+            self._waiting_readers -= 1
+            if self._admitted != 0:
+                self._admitted -= 1
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writing or self._readers != 0 or \
+                    self._admitted != 0:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writing = False
+                self._admitted = self._waiting_readers
+                self._cond.notify_all()
+
+
+class Collection:
+    """
+    JSON collection held in a DataFrame, with an id -> row label index and
+    optional per-column value -> row labels and sorted indexes and a token
+    index for full-text search, all kept in sync on create / update /
+    delete.
+
+    Writers are serialized and bump version; readers take the shared side
+    of the lock only while they resolve and slice their page, which is
+    their immutable snapshot, so no request copies the whole frame. Reads
+    are not lock-free: the frame and the indexes are updated in place, so
+    a read waits while a write is applied, a bulk one chunk at a time.
+    Slow work is kept out of the exclusive side: journal commits happen
+    after it is released and compaction writes its copy of the frame
+    unlocked.
+
+    A shared collection is one copy among worker processes: each worker
+    writes through the journal lock and replays the others' journal
+    entries before it reads or writes, and its version is its journal
+    offset.
+    """
+
+    def __init__(self, name: str, path: str, data: Optional[pd.DataFrame],
+                 journal: Optional[Journal] = None,
+                 compact_bytes: int = 64 * 1024 * 1024,
+                 flusher: Optional[Flusher] = None,
+                 max_encoded_rows: int = 100000,
+                 loader: Optional[Callable[[], pd.DataFrame]] = None,
+                 schema: Optional[pd.DataFrame] = None,
+                 shared: bool = False):
+        self.name = name
+        self.path = path
+        self.ids: Dict[Any, int] = dict()
+        self.indexes: Dict[str, Dict[Any, Set[int]]] = dict()
+        self.sorted: Dict[str, SortedIndex] = dict()
+        self.text: Optional[TextIndex] = None
+        self.encoded: Dict[int, bytes] = dict()
+        self.max_encoded_rows = max_encoded_rows
+        self.journal = journal
+        self.compact_bytes = compact_bytes
+        self.flusher = flusher
+        self._compacting = Lock()
+        self.lock = RWLock()
+        # held by a writer for its whole mutation, so a bulk can release
+        # the lock between its chunks
+        self._writer = Lock()
+        self.version = 0
+        self.last_id = 0
+        self._next_label = 0
+        self.loader = loader
+        self.index_columns: Optional[List[str]] = None
+        self.search_columns: Optional[List[str]] = None
+        self._data: Optional[pd.DataFrame] = None
+        # rows of _data in use (alive or dead), the rest are spare
+        self._used = 0
+        self._alive = np.zeros(0, dtype=bool)
+        self._dead = 0
+        self._loading = Lock()
+        self.last_access = time.monotonic()
+        self.shared = shared
+        self.written = None
+        self._memory: Optional[Tuple[int, int]] = None
+        self.schema = schema if data is None else data.iloc[:0]
+        if data is not None:
+            self._load(data)
+
+    @property
+    def data(self) -> pd.DataFrame:
+        """
+        Records of the collection, loaded on first access when lazy. The
+        frame holds more rows: a deleted row is only marked dead until
+        enough of them are vacuumed away, and records are appended into
+        spare rows at its end, so a write does not copy the frame. Reads
+        that scan take _in_use() and leave the dead rows out themselves.
+        :return:
+        """
+        self.load()
+        data, alive = self._in_use()
+        return data if alive is None else data[alive]
+
+    @data.setter
+    def data(self, data: pd.DataFrame):
+        self._data = data
+        self._used = len(data.index)
+        self._alive = np.ones(self._used, dtype=bool)
+        self._dead = 0
+
+    def _in_use(self) -> Tuple[pd.DataFrame, Optional[np.ndarray]]:
+        """
+        Rows of the frame in use (a view) and which of them are alive, None
+        when all of them are
+        """
+        data = self._data.iloc[:self._used]
+        return data, None if self._dead == 0 else self._alive[:self._used]
+
+    def load(self):
+        """
+        Load the records of a lazy collection if they are not in memory
+        :return:
+        """
+        if self._data is None:
+            with self._loading:
+                if self._data is None:
+                    self._load(self.loader())
+
+    def _load(self, data: pd.DataFrame):
+        # built aside and swapped in, the frame last: a reader that sees
+        # the frame sees its indexes and the replayed journal too, and one
+        # that does not waits on _loading
+        stage = Collection(self.name, self.path, None, self.journal,
+                           max_encoded_rows=self.max_encoded_rows,
+                           schema=self.schema, shared=self.shared)
+        stage.index_columns = self.index_columns
+        stage.search_columns = self.search_columns
+        stage.last_id = self.last_id
+        stage._build(data)
+        self.ids, self.indexes, self.sorted = \
+            stage.ids, stage.indexes, stage.sorted
+        self.text, self.encoded = stage.text, stage.encoded
+        self.last_id, self._next_label = stage.last_id, stage._next_label
+        self._used, self._alive, self._dead = \
+            stage._used, stage._alive, stage._dead
+        if self.shared:
+            self.version = stage.version
+        self._data = stage._data
+
+    def _build(self, data: pd.DataFrame):
+        self.data = data.reset_index(drop=True)
+        self._next_label = self._used
+        self.build_index()
+        if self.journal is not None:
+            for op in self.journal.replay():
+                self.apply(op)
+            if self.shared:
+                self.version = self.journal.position
+        if self.index_columns is not None:
+            self.build_indexes(self.index_columns)
+        if self.search_columns is not None:
+            self.build_search_index(self.search_columns)
+
+    def _reset(self):
+        self.ids = dict()
+        self.indexes = dict()
+        self.sorted = dict()
+        self.text = None
+        self.encoded = dict()
+
+    def loaded(self) -> bool:
+        """
+        Whether the records are in memory
+        :return:
+        """
+        return self._data is not None
+
+    def memory_usage(self) -> int:
+        """
+        Bytes held by the records (strings included), measured again only
+        after a change
+        :return:
+        """
+        with self.lock.read():
+            if self._data is None:
+                return 0
+            if self._memory is None or self._memory[0] != self.version:
+                self._memory = (self.version, int(
+                    self._data.memory_usage(deep=True).sum()))
+            return self._memory[1]
+
+    def evict(self, ttl: float) -> bool:
+        """
+        Persist and drop the records of a lazy collection not accessed for
+        ttl seconds; the next access loads them again
+        :param ttl:
+        :return: whether the records were dropped
+        """
+        if self.loader is None or self._data is None or self.shared or \
+                time.monotonic() - self.last_access < ttl:
+            return False
+        # fold the journal into the JSON file (and its snapshot) first
+        with self._compacting:
+            pass
+        if self.journal is None:
+            with self.lock.read():
+                self.write()
+        elif self.journal.size != 0 or os.path.exists(self.journal.old_path):
+            self.compact()
+        with self._writer, self.lock.write():
+            if self._data is None or \
+                    time.monotonic() - self.last_access < ttl or \
+                    (self.journal is not None and self.journal.size != 0):
+                # touched while persisting
+                return False
+            self._data = None
+            self._reset()
+            return True
+
+    def reload(self) -> bool:
+        """
+        Take in the JSON file after it changed on disk. The file wins: the
+        journal (mutations not compacted into it yet) is discarded. Only
+        the difference is applied, by id: rows that are gone are deleted,
+        new ones inserted and changed ones updated, so the indexes and the
+        encoded rows of the others are kept. A file whose columns (or their
+        kinds) changed is loaded from scratch.
+        :return: whether the columns changed
+        """
+        loaded = self._data is not None
+        # parsed before taking the locks, readers go on meanwhile
+        data = self.loader() if loaded else sniff_data(self.path)
+        with self._compacting, self._writer:
+            with self.lock.write():
+                changed = column_kinds(data) != column_kinds(
+                    self._data if loaded else self.schema)
+                if self.journal is not None:
+                    self.journal.rotate()
+                    self.journal.discard_rotated()
+                if not loaded:
+                    # read from the new file when first accessed
+                    self.schema = data
+                elif changed or "id" not in data.columns:
+                    self.schema = data.iloc[:0]
+                    self._load(data)
+                else:
+                    self._apply_changes(data.reset_index(drop=True))
+                self.version += 1
+        return changed
+
+    def _apply_changes(self, data: pd.DataFrame):
+        before = dict(zip(self.ids, self._data.loc[list(self.ids.values())]
+                          .to_json(orient="records", lines=True)
+                          .splitlines()))
+        after = data.to_json(orient="records", lines=True).splitlines()
+        positions = dict(zip(data["id"].tolist(), range(len(after))))
+        deleted = [id for id in before if id not in positions]
+        created = [position for id, position in positions.items()
+                   if id not in before]
+        updated = {id: position for id, position in positions.items()
+                   if id in before and before[id] != after[position]}
+        if len(deleted) + len(created) + len(updated) == 0:
+            return
+        rebuild = list()
+        if (len(created) + len(updated) + len(deleted)) * 16 >= \
+                self.count():
+            # re-sorting beats shifting the sorted lists row by row
+            rebuild, self.sorted = list(self.sorted), dict()
+        try:
+            if len(deleted) != 0:
+                self._delete_many([self.ids.pop(id) for id in deleted])
+            if len(updated) != 0:
+                records = data.iloc[list(updated.values())] \
+                    .drop(columns="id").to_dict("records")
+                self._update_many({self.ids[id]: record for id, record
+                                   in zip(updated, records)})
+            if len(created) != 0:
+                self._insert_many(self._frame(
+                    data.iloc[created].to_dict("records")))
+        finally:
+            for col in rebuild:
+                self.sorted[col] = SortedIndex(self.data[col])
+        if len(self.ids) != 0:
+            self.last_id = max(self.last_id, int(max(self.ids)))
+
+    def discard(self):
+        """
+        Close and remove the journal of a collection whose JSON file was
+        deleted
+        :return:
+        """
+        if self.journal is None:
+            return
+        with self._compacting:
+            self.journal.close()
+            for path in (self.journal.path, self.journal.old_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def build_index(self):
+        """
+        Build the id index from the current data
+        :return:
+        """
+        data = self.data
+        if "id" in data.columns:
+            self.ids = dict(zip(data["id"].tolist(), data.index.tolist()))
+            if len(self.ids) != 0:
+                self.last_id = int(max(self.ids))
+
+    def build_indexes(self, columns: List[str]):
+        """
+        Build equality indexes (value -> row labels) for filter columns,
+        and sorted indexes for the numeric and date ones
+        :param columns:
+        :return:
+        """
+        self.index_columns = list(columns)
+        if self._data is None:
+            # built when the records are loaded
+            return
+        data = self.data
+        labels = data.index
+        for col in columns:
+            if col not in data.columns:
+                continue
+            if is_numeric_dtype(data[col]) or \
+                    is_datetime64_any_dtype(data[col]):
+                self.sorted[col] = SortedIndex(data[col])
+            if col == "id":
+                continue
+            try:
+                groups = data.groupby(col, sort=False).indices
+            except TypeError:
+                # unhashable values (nested lists / objects)
+                continue
+            self.indexes[col] = {value: set(labels[positions].tolist())
+                                 for value, positions in groups.items()}
+
+    def text_columns(self) -> List[str]:
+        """
+        String columns, the ones searched by _q / _search
+        :return:
+        """
+        self.load()
+        return [col for col in self._data.columns
+                if is_text(self._data[col])]
+
+    def build_search_index(self, columns: List[str]):
+        """
+        Build the token index used by full-text search
+        :param columns:
+        :return:
+        """
+        self.search_columns = list(columns)
+        if self._data is None:
+            return
+        columns = [col for col in self.text_columns() if col in columns]
+        if len(columns) != 0:
+            self.text = TextIndex(self.data, columns)
+
+    def _text_values(self, label: int) -> List:
+        return self._data.loc[label, self.text.columns].tolist()
+
+    def _index_add(self, label: int, values: Dict):
+        for col, value in values.items():
+            if col in self.sorted:
+                self.sorted[col].add(label, value)
+            if col in self.indexes and value == value:
+                self.indexes[col].setdefault(value, set()).add(label)
+
+    def _index_remove(self, label: int, values: Dict):
+        for col, value in values.items():
+            if col in self.sorted:
+                self.sorted[col].remove(label, value)
+            labels = self.indexes.get(col, dict()).get(value)
+            if labels is not None:
+                labels.discard(label)
+                if len(labels) == 0:
+                    del self.indexes[col][value]
+
+    def _indexed_columns(self, columns=None) -> List[str]:
+        indexed = [col for col in self._data.columns
+                   if col in self.indexes or col in self.sorted]
+        if columns is None:
+            return indexed
+        return [col for col in indexed if col in columns]
+
+    def _indexed_values(self, label: int, columns: List[str]) -> Dict:
+        if len(columns) == 0:
+            return dict()
+        return dict(zip(columns, self._data.loc[label, columns].tolist()))
+
+    @contextmanager
+    def read(self):
+        """
+        Shared lock for reading data, indexes and the encoded cache
+        :return:
+        """
+        self.last_access = time.monotonic()
+        self.sync()
+        with self.lock.read():
+            self.load()
+            yield
+
+    @contextmanager
+    def _writing(self):
+        """
+        Exclusive lock for a mutation. Shared collections also hold the
+        journal lock, apply what other workers wrote first and publish the
+        mutation before it is released.
+        """
+        self.last_access = time.monotonic()
+        with self._writer, self.lock.write():
+            self.load()
+            if not self.shared:
+                yield
+                return
+            with self.journal.locked():
+                self._catch_up()
+                try:
+                    yield
+                finally:
+                    self.journal.publish(self.flusher is None)
+                    self.version = self.journal.position
+
+    def sync(self):
+        """
+        Apply the mutations other worker processes appended to a shared
+        journal since the last call (a stat when there are none)
+        :return:
+        """
+        if not self.shared or self._data is None or \
+                os.path.getsize(self.journal.path) == self.journal.position:
+            return
+        with self.lock.write():
+            self._catch_up()
+
+    def _catch_up(self):
+        for op in self.journal.tail():
+            self.apply(op)
+        # the same journal offset is the same state in every worker
+        self.version = self.journal.position
+
+    def current_version(self) -> Optional[int]:
+        """
+        Version without taking the lock (a writer bumps it once its
+        mutation is done), or None while a shared journal has entries of
+        other workers to apply
+        :return:
+        """
+        if self.shared and (self._data is None or os.path.getsize(
+                self.journal.path) != self.journal.position):
+            return None
+        return self.version
+
+    def cached_row(self, id) -> Optional[bytes]:
+        """
+        JSON bytes of a record from the per-row cache without taking the
+        lock; only valid if current_version() is the same before and after
+        :param id:
+        :return:
+        """
+        label = self.ids.get(int(id))
+        return None if label is None else self.encoded.get(label)
+
+    def label(self, id) -> Optional[int]:
+        """
+        Row label of a record
+        :param id:
+        :return:
+        """
+        return self.ids.get(int(id))
+
+    def count(self) -> int:
+        """
+        Number of records (call under read())
+        :return:
+        """
+        return self._used - self._dead
+
+    def rows(self, labels: List[int]) -> pd.DataFrame:
+        """
+        Rows by label (call under read())
+        :param labels:
+        :return:
+        """
+        return self._data.loc[labels]
+
+    @timed("filter", rows=True)
+    def lookup(self, col: str, values: List) -> pd.DataFrame:
+        """
+        Rows whose col is one of values, in label order, through the id or
+        value index when there is one, else one isin() scan (call under
+        read())
+        :param col:
+        :param values:
+        :return:
+        """
+        if col not in self._data.columns:
+            raise ValueError(f"Unknown column {col}")
+        if col == "id":
+            labels = [self.ids[value] for value in set(values)
+                      if value in self.ids]
+        elif col in self.indexes:
+            labels = set()
+            for value in set(values):
+                labels.update(self.indexes[col].get(value, ()))
+        else:
+            data, alive = self._in_use()
+            mask = data[col].isin(values).to_numpy()
+            return data[mask if alive is None else mask & alive]
+        return self._data.loc[sorted(labels)]
+
+    def get(self, id) -> Optional[Dict]:
+        """
+        Return a record by id
+        :param id:
+        :return:
+        """
+        with self.read():
+            label = self.label(id)
+            if label is None:
+                return None
+            return json.loads(
+                self._data.loc[[label]].to_json(orient="records"))[0]
+
+    @timed("serialize")
+    def encode(self, data: pd.DataFrame, cache: bool = True,
+               columns: Optional[List[str]] = None) -> List[bytes]:
+        """
+        JSON bytes of each row of data (a slice of this collection, taken
+        under read()). Rows missing from the per-row cache are encoded
+        together in one to_json call and cached until they are mutated.
+        :param data:
+        :param cache: False to leave the cache as it is (bulk reads)
+        :param columns: only these columns, encoded without the cache
+        :return:
+        """
+        if columns is not None:
+            lines = data[columns].to_json(orient="records", lines=True,
+                                          force_ascii=False)
+            return [line.encode("utf-8") for line in lines.split("\n")
+                    if line != ""]
+        labels = data.index.tolist()
+        rows = [self.encoded.get(label) for label in labels]
+        missing = [label for label, row in zip(labels, rows) if row is None]
+        if len(missing) != 0:
+            lines = data.loc[missing].to_json(orient="records", lines=True,
+                                              force_ascii=False)
+            fresh = dict(zip(missing, [line.encode("utf-8")
+                                       for line in lines.split("\n")
+                                       if line != ""]))
+            if not cache:
+                return [fresh[label] if row is None else row
+                        for label, row in zip(labels, rows)]
+            overflow = len(self.encoded) + len(fresh) - self.max_encoded_rows
+            if overflow > 0:
+                for label in list(islice(self.encoded, overflow)):
+                    self.encoded.pop(label, None)
+            self.encoded.update(fresh)
+            rows = [fresh[label] if row is None else row
+                    for label, row in zip(labels, rows)]
+        return rows
+
+    def encoded_row(self, id) -> Optional[bytes]:
+        """
+        JSON bytes of a record by id
+        :param id:
+        :return:
+        """
+        with self.read():
+            label = self.label(id)
+            if label is None:
+                return None
+            return self.encode(self._data.loc[[label]])[0]
+
+    def _candidates(self, filters: Dict[str, Any], conditions: List[Tuple],
+                    search: Optional[str] = None) -> Tuple[Optional[Set[int]],
+                                                           List[Tuple]]:
+        """
+        Labels matching the indexed filters and search terms (None when
+        nothing narrowed them), intersected smallest first, plus the
+        conditions left to be applied as masks
+        """
+        postings = list()
+        masks = list()
+        if search is not None:
+            if self.text is not None:
+                labels = self.text.search(search)
+                if labels is not None:
+                    postings.append(labels)
+            elif len(tokenize(search)) != 0:
+                masks.append((None, "search", search))
+        for col, value in filters.items():
+            if col == "id":
+                label = self.ids.get(value)
+                postings.append(set() if label is None else {label})
+            elif col in self.indexes:
+                postings.append(self.indexes[col].get(value, set()))
+            else:
+                masks.append((col, "eq", value))
+        ranges = dict()
+        for col, op, value in conditions:
+            if col in self.sorted and op in ("gte", "lte"):
+                ranges.setdefault(col, dict())[op] = value
+            else:
+                masks.append((col, op, value))
+        for col, bounds in ranges.items():
+            postings.append(self.sorted[col].range(**bounds))
+        if len(postings) == 0:
+            return None, masks
+        postings.sort(key=len)
+        labels = set(postings[0])
+        for other in postings[1:]:
+            if len(labels) == 0:
+                break
+            labels &= other
+        return labels, masks
+
+    @staticmethod
+    def _mask(data: pd.DataFrame, col: str, op: str, value) -> pd.Series:
+        if op == "eq":
+            return data[col] == value
+        if op == "ne":
+            return data[col] != value
+        if op == "gte":
+            return plain(data[col]) >= value
+        if op == "lte":
+            return plain(data[col]) <= value
+        if op == "like":
+            return data[col].astype(str).str.contains(value, case=False,
+                                                      regex=True, na=False)
+        if op == "search":
+            # the rule of TextIndex.search: whole tokens, the last term
+            # also as a prefix
+            terms = tokenize(value)
+            tokens = [data[c].dropna().astype(str).str.lower()
+                      .str.findall(TOKEN_PATTERN)
+                      for c in data.columns if is_text(data[c])]
+            mask = pd.Series(True, index=data.index)
+            for i, term in enumerate(terms):
+                found = pd.Series(False, index=data.index)
+                for values in tokens:
+                    if i == len(terms) - 1:
+                        hits = values.map(lambda row: any(
+                            token.startswith(term) for token in row))
+                    else:
+                        hits = values.map(lambda row: term in row)
+                    found |= hits.reindex(data.index, fill_value=False) \
+                        .astype(bool)
+                mask &= found
+            return mask
+        raise ValueError(f"Unknown operator {op}")
+
+    def _match(self, data: pd.DataFrame, masks: List[Tuple]) -> pd.Series:
+        scanned(len(data.index))
+        mask = self._mask(data, *masks[0])
+        for condition in masks[1:]:
+            mask &= self._mask(data, *condition)
+        return mask
+
+    @staticmethod
+    def _key_value(value):
+        try:
+            if pd.isna(value):
+                return None
+        except ValueError:
+            pass
+        if isinstance(value, pd.Timestamp):
+            return value.isoformat()
+        if hasattr(value, "item"):
+            return value.item()
+        return value
+
+    def cursors(self, data: pd.DataFrame, sort: Optional[str] = None,
+                order: str = "asc") -> List[str]:
+        """
+        Opaque keyset cursors of the rows of a page (a slice of this
+        collection, taken under read()), each one pointing just past its row
+        :param data:
+        :param sort:
+        :param order:
+        :return:
+        """
+        labels = data.index.tolist()
+        ids = data["id"].tolist() if "id" in data.columns \
+            else [None] * len(labels)
+        values = [None] * len(labels) if sort is None \
+            else data[sort].tolist()
+        cursors = list()
+        for value, label, id in zip(values, labels, ids):
+            key = {"s": sort, "o": order, "v": self._key_value(value),
+                   "l": label, "i": self._key_value(id)}
+            cursors.append(base64.urlsafe_b64encode(
+                json.dumps(key, separators=(",", ":")).encode("utf-8"))
+                           .decode("ascii").rstrip("="))
+        return cursors
+
+    def _after(self, cursor: str, sort: Optional[str],
+               order: str) -> Tuple[Any, int]:
+        """
+        (sort value, row label) key of a cursor. The label of a record that
+        still exists is looked up by id, so cursors survive a restart.
+        """
+        try:
+            key = json.loads(base64.urlsafe_b64decode(
+                cursor + "=" * (-len(cursor) % 4)))
+            cursor_sort, cursor_order = key["s"], key["o"]
+            value, label = key["v"], int(key["l"])
+            if key["i"] is not None:
+                label = self.ids.get(key["i"], label)
+        except (ValueError, KeyError, TypeError):
+            raise ValueError("Invalid cursor")
+        if cursor_sort != sort or cursor_order != order:
+            raise ValueError("Cursor does not match the sort order")
+        if value is not None and sort is not None and \
+                is_datetime64_any_dtype(self._data[sort]):
+            value = pd.Timestamp(value)
+        return value, label
+
+    def _walk(self, ordered: Iterator[int], masks: List[Tuple], offset: int,
+              limit: Optional[int]) -> List[int]:
+        """
+        Labels of a page taken from ordered labels, testing the masks a
+        chunk at a time so a page costs the rows it scans
+        """
+        stop = None if limit is None else offset + limit
+        if len(masks) == 0:
+            return list(islice(ordered, offset, stop))
+        page = list()
+        while stop is None or len(page) < stop:
+            wanted = 1024 if stop is None else stop - len(page)
+            chunk = list(islice(ordered, max(2 * wanted, 256)))
+            if len(chunk) == 0:
+                break
+            rows = self._data.loc[chunk]
+            page.extend(rows.index[self._match(rows, masks).to_numpy()]
+                        .tolist())
+        return page[offset:stop]
+
+    def _seek(self, labels: Optional[Set[int]], masks: List[Tuple],
+              sort: Optional[str], order: str, after: Tuple[Any, int],
+              offset: int, limit: Optional[int]) -> pd.DataFrame:
+        """
+        Page of rows just past a cursor key: a seek into the row order or
+        the sorted index of the sort column, scanning only as far as the
+        page needs
+        """
+        value, label = after
+        if sort is None:
+            if labels is None:
+                data, alive = self._in_use()
+                index = data.index if alive is None else data.index[alive]
+                start = int(index.searchsorted(label, side="right"))
+                ordered = iter(index[start:])
+            else:
+                index = sorted(labels)
+                ordered = islice(index, bisect_right(index, label), None)
+            return self._data.loc[self._walk(ordered, masks, offset, limit)]
+        if sort in self.sorted and \
+                (labels is None or len(labels) * 8 >= self.count()):
+            ordered = self.sorted[sort].ordered(order == "desc", labels,
+                                                after)
+            return self._data.loc[self._walk(ordered, masks, offset, limit)]
+        data, alive = self._in_use() if labels is None \
+            else (self._data.loc[sorted(labels)], None)
+        column = plain(data[sort])
+        past = data.index > label
+        if value is None:
+            mask = column.isna() & past
+        else:
+            beyond = column > value if order == "asc" else column < value
+            mask = beyond | ((column == value) & past) | column.isna()
+        if len(masks) != 0:
+            mask &= self._match(data, masks)
+        if alive is not None:
+            mask &= alive
+        data = data[mask].sort_values(sort, ascending=order == "asc",
+                                      kind="mergesort", na_position="last")
+        stop = None if limit is None else offset + limit
+        return data.iloc[offset:stop]
+
+    @timed("filter", rows=True)
+    def select(self, filters: Dict[str, Any], conditions: List[Tuple] = (),
+               sort: Optional[str] = None, order: str = "asc",
+               offset: int = 0, limit: Optional[int] = None,
+               search: Optional[str] = None,
+               after: Optional[str] = None) -> pd.DataFrame:
+        """
+        Page of rows matching the equality filters, the (column, op,
+        value) conditions, op one of gte / lte / ne / like, and the search
+        terms, optionally sorted by a column (call under read()). Indexed
+        filters, ranges and search terms are resolved through posting
+        lists; a sort on a column with a sorted index walks the index only
+        as far as the page needs. With a cursor from cursors() the page
+        starts just past the row it points to instead of at an offset.
+        :param filters:
+        :param conditions:
+        :param sort:
+        :param order:
+        :param offset:
+        :param limit:
+        :param search:
+        :param after:
+        :return:
+        """
+        self.load()
+        if sort is not None and sort not in self._data.columns:
+            raise ValueError(f"Unknown sort column {sort}")
+        if order not in ("asc", "desc"):
+            raise ValueError(f"Unknown sort order {order}")
+        if limit is not None and limit < 0:
+            raise ValueError("limit must not be negative")
+        stop = None if limit is None else offset + limit
+        labels, masks = self._candidates(filters, conditions, search)
+        if after is not None:
+            return self._seek(labels, masks, sort, order,
+                              self._after(after, sort, order), offset, limit)
+        if len(masks) == 0 and sort in self.sorted and \
+                (labels is None or len(labels) * 8 >= self.count()):
+            page = list(islice(self.sorted[sort].ordered(order == "desc",
+                                                         labels),
+                               offset, stop))
+            return self._data.loc[page]
+        if len(masks) == 0 and sort is None:
+            if labels is None:
+                data, alive = self._in_use()
+                if alive is None:
+                    return data.iloc[offset:stop]
+                return data.iloc[np.flatnonzero(alive)[offset:stop]]
+            return self._data.loc[sorted(labels)[offset:stop]]
+        data, alive = self._in_use() if labels is None \
+            else (self._data.loc[sorted(labels)], None)
+        if len(masks) != 0:
+            mask = self._match(data, masks).to_numpy()
+            data = data[mask if alive is None else mask & alive]
+        elif alive is not None:
+            data = data[alive]
+        if sort is not None:
+            data = data.sort_values(sort, ascending=order == "asc",
+                                    kind="mergesort", na_position="last")
+        return data.iloc[offset:stop]
+
+    def export(self, filters: Dict[str, Any], conditions: List[Tuple] = (),
+               sort: Optional[str] = None, order: str = "asc",
+               search: Optional[str] = None,
+               chunk_size: int = 1000) -> Iterator[List[bytes]]:
+        """
+        All rows matching a select() as chunks of JSON encoded rows. The
+        chunks are walked with keyset cursors, so the read lock is held for
+        one chunk at a time and memory stays flat however big the result.
+        :param filters:
+        :param conditions:
+        :param sort:
+        :param order:
+        :param search:
+        :param chunk_size:
+        :return:
+        """
+        after = None
+        while True:
+            with self.read():
+                data = self.select(filters, conditions, sort, order, 0,
+                                   chunk_size + 1, search, after)
+                more = data.shape[0] > chunk_size
+                data = data.iloc[:chunk_size]
+                rows = self.encode(data, cache=False)
+                if more:
+                    after = self.cursors(data.iloc[-1:], sort, order)[0]
+            if len(rows) != 0:
+                yield rows
+            if not more:
+                return
+
+    def create(self, record: Dict) -> int:
+        """
+        Append a record and return its id
+        :param record:
+        :return:
+        """
+        with self._writing():
+            record["id"] = self.last_id + 1
+            # the id is taken once the values are converted, a rejected
+            # record does not use it up
+            frame = self._frame([record])
+            self.last_id += 1
+            self._insert_many(frame)
+            self._log({"op": "create", "record": record})
+            self.version += 1
+            return self.last_id
+
+    def update(self, id, record: Dict) -> bool:
+        """
+        Update a record in place
+        :param id:
+        :param record:
+        :return:
+        """
+        with self._writing():
+            label = self.label(id)
+            if label is None:
+                return False
+            record.pop("id", None)
+            if len(record) != 0:
+                self._update(label, record)
+                self._log({"op": "update", "id": int(id), "record": record})
+                self.version += 1
+            return True
+
+    def delete(self, id) -> bool:
+        """
+        Delete a record
+        :param id:
+        :return:
+        """
+        with self._writing():
+            label = self.ids.pop(int(id), None)
+            if label is None:
+                return False
+            self._delete(label)
+            self._log({"op": "delete", "id": int(id)})
+            self.version += 1
+            return True
+
+    def bulk(self, items: List[Dict],
+             chunk_size: int = 10000) -> List[Dict]:
+        """
+        Apply a batch of {"op": "create", "record": ...}, {"op": "update",
+        "id": ..., "record": ...} and {"op": "delete", "id": ...} items in
+        order as a single write: all deletes are marked dead together, all
+        updates are one assignment per column and all creates are written
+        into the spare rows (or one concat growing them). Items carrying an
+        "error" (failed validation) are reported and skipped; a value that
+        does not fit its column raises and leaves the collection unchanged.
+
+        The batch is checked and its values converted first; the rows are
+        then changed chunk_size at a time, the lock released in between so
+        reads go on (each chunk bumps version), while other writers wait
+        for the whole batch. A shared collection applies it at once: its
+        version is the journal offset the workers agree on.
+        :param items:
+        :param chunk_size:
+        :return: per item op, id, status and message
+        """
+        if self.shared:
+            with self._writing():
+                return self._bulk(items, None, nullcontext)
+        self.last_access = time.monotonic()
+        with self._writer:
+            return self._bulk(items, chunk_size, self.lock.write)
+
+    def _bulk(self, items: List[Dict], chunk_size: Optional[int],
+              exclusive: Callable) -> List[Dict]:
+        # planned without the lock: it only reads the id index, which the
+        # other writers, waiting on _writer, are the ones to change
+        self.load()
+        last_id = self.last_id
+        results = list()
+        ops = list()
+        created: Dict[int, Dict] = dict()
+        updated: Dict[int, Dict] = dict()
+        deleted: Set[int] = set()
+        columns = [col for col in self._data.columns if col != "id"]
+        for item in items:
+            op, id = item.get("op"), item.get("id")
+            if "error" in item:
+                results.append(self._result(op, id, 422, item["error"]))
+                continue
+            if op == "create":
+                record = dict(item.get("record") or dict())
+                missing = [col for col in columns if col not in record]
+                if len(missing) != 0:
+                    results.append(self._result(
+                        op, id, 422, f"Missing fields {missing}"))
+                    continue
+                self.last_id += 1
+                id = record["id"] = self.last_id
+                created[id] = record
+                ops.append({"op": "create", "record": dict(record)})
+            elif op in ("update", "delete"):
+                try:
+                    id = int(id)
+                except (TypeError, ValueError):
+                    results.append(self._result(op, id, 422, "Invalid id"))
+                    continue
+                if id not in created and \
+                        (id not in self.ids or id in deleted):
+                    results.append(self._result(op, id, 404,
+                                                "No Data Found"))
+                    continue
+                if op == "update":
+                    record = dict(item.get("record") or dict())
+                    record.pop("id", None)
+                    if id in created:
+                        created[id].update(record)
+                    else:
+                        updated.setdefault(id, dict()).update(record)
+                    ops.append({"op": "update", "id": id,
+                                "record": record})
+                else:
+                    if id in created:
+                        del created[id]
+                    else:
+                        deleted.add(id)
+                        updated.pop(id, None)
+                    ops.append({"op": "delete", "id": id})
+            else:
+                results.append(self._result(op, id, 422,
+                                            f"Unknown operation {op}"))
+                continue
+            results.append(self._result(op, id, 200, "success"))
+        with exclusive():
+            # convert the updated values and build the new rows first, so
+            # a bad value fails the batch before any row is changed
+            frame = None
+            dtypes = self._data.dtypes
+            try:
+                updates = self._updates({self.ids[id]: record for id, record
+                                         in updated.items()})
+                if len(created) != 0:
+                    frame = self._frame(list(created.values()))
+            except Exception:
+                self.last_id = last_id
+                # undo the columns widened for the values
+                for col, dtype in dtypes.items():
+                    if self._data[col].dtype != dtype:
+                        self._data[col] = self._data[col].astype(dtype)
+                raise
+            rebuild = list()
+            if (len(created) + len(updated) + len(deleted)) * 16 >= \
+                    self.count():
+                # re-sorting beats shifting the sorted lists row by row
+                rebuild, self.sorted = list(self.sorted), dict()
+        deleted = list(deleted)
+        updated = {self.ids[id]: record for id, record in updated.items()}
+        labels = list(updated)
+        rows = 0 if frame is None else len(frame.index)
+        step = chunk_size or max(len(deleted), len(labels), rows, 1)
+        try:
+            for start in range(0, len(deleted), step):
+                with exclusive():
+                    self._delete_many([self.ids.pop(id)
+                                       for id in deleted[start:start + step]])
+                    self.version += 1
+            for start in range(0, len(labels), step):
+                chunk = labels[start:start + step]
+                with exclusive():
+                    self._update_many(
+                        {label: updated[label] for label in chunk},
+                        {col: series[series.index.isin(chunk)]
+                         for col, series in updates.items()})
+                    self.version += 1
+            for start in range(0, rows, step):
+                with exclusive():
+                    self._insert_many(frame.iloc[start:start + step])
+                    self.version += 1
+        finally:
+            with exclusive():
+                for col in rebuild:
+                    self.sorted[col] = SortedIndex(self.data[col])
+        with exclusive():
+            for op in ops:
+                self._log(op)
+            if len(ops) != 0:
+                self.version += 1
+            return results
+
+    @staticmethod
+    def _result(op, id, status: int, message: str) -> Dict:
+        return {"op": op, "id": id, "status": status, "message": message}
+
+    def _convert(self, col: str, values: List) -> List:
+        """
+        Values to write into a column, widening a compact column first
+        when they do not fit it: a narrow integer column to int64, a
+        float32 one to float64 and a categorical one to the new categories
+        (to plain values when they cannot be ordered together)
+        """
+        series = self._data[col]
+        if is_datetime64_any_dtype(series):
+            return pd.to_datetime(pd.Series(values, dtype=object)).tolist()
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            categories = series.cat.categories
+            new = [value for value in dict.fromkeys(
+                value for value in values if not pd.isna(value))
+                if value not in categories]
+            if len(new) != 0:
+                try:
+                    self._data[col] = series.cat.set_categories(
+                        sorted(categories.tolist() + new))
+                except TypeError:
+                    # values of mixed types: unordered categories would sort
+                    # the column by category order, not by value
+                    self._data[col] = series.astype(object)
+            return values
+        if is_integer_dtype(series) and series.dtype != np.int64:
+            info = np.iinfo(series.dtype)
+            if all(isinstance(value, (int, np.integer)) and
+                   not isinstance(value, bool) and
+                   info.min <= value <= info.max for value in values):
+                return np.array(values, dtype=series.dtype)
+            self._data[col] = series.astype(np.int64)
+        elif series.dtype == np.float32:
+            if not all(value is None or (
+                    isinstance(value, (int, float, np.number)) and
+                    not isinstance(value, bool) and
+                    (value != value or float(np.float32(value)) == value))
+                    for value in values):
+                self._data[col] = series.astype(np.float64)
+        return values
+
+    def _frame(self, records: List[Dict]) -> pd.DataFrame:
+        labels = range(self._next_label, self._next_label + len(records))
+        columns = dict()
+        for col in self._data.columns:
+            values = self._convert(col, [record[col] for record in records])
+            try:
+                # in the column's dtype, so it fits the spare rows and the
+                # concat keeps it compact
+                columns[col] = pd.Series(values, index=labels,
+                                         dtype=self._data[col].dtype)
+            except (TypeError, ValueError, OverflowError):
+                columns[col] = pd.Series(values, index=labels)
+        return pd.DataFrame(columns, index=labels, columns=self._data.columns)
+
+    def apply(self, op: Dict):
+        """
+        Replay a journaled mutation. Replays are idempotent, so entries
+        already covered by the JSON file are harmless.
+        :param op:
+        :return:
+        """
+        if op["op"] == "create":
+            record = dict(op["record"])
+            label = self.ids.get(record["id"])
+            if label is None:
+                self._insert(record)
+            else:
+                record.pop("id")
+                self._update(label, record)
+            self.last_id = max(self.last_id, int(op["record"]["id"]))
+        elif op["op"] == "update":
+            label = self.ids.get(op["id"])
+            if label is not None:
+                self._update(label, dict(op["record"]))
+        elif op["op"] == "delete":
+            label = self.ids.pop(op["id"], None)
+            if label is not None:
+                self._delete(label)
+
+    def _insert(self, record: Dict):
+        # a frame in the columns' dtypes rather than a loc enlargement,
+        # which would widen compact dtypes back to int64 / float64 / str
+        self._insert_many(self._frame([record]))
+
+    def _update(self, label: int, record: Dict):
+        self.encoded.pop(label, None)
+        indexed = self._indexed_columns(record)
+        old = self._indexed_values(label, indexed)
+        searched = self.text is not None and \
+            any(col in record for col in self.text.columns)
+        if searched:
+            old_text = self._text_values(label)
+        self._data.loc[label, list(record.keys())] = [
+            self._convert(col, [value])[0] if col in self._data.columns
+            else value for col, value in record.items()]
+        new = self._indexed_values(label, indexed)
+        if searched:
+            self.text.replace(label, old_text, self._text_values(label))
+        changed = [col for col in indexed if old[col] != new[col]]
+        self._index_remove(label, {col: old[col] for col in changed})
+        self._index_add(label, {col: new[col] for col in changed})
+
+    def _delete(self, label: int):
+        self._index_remove(label,
+                           self._indexed_values(label,
+                                                self._indexed_columns()))
+        if self.text is not None:
+            self.text.remove(label, self._text_values(label))
+        self._bury([label])
+
+    def _rows(self, labels: List[int], columns: List[str]) -> List[List]:
+        if len(columns) == 0:
+            return [list() for _ in labels]
+        return self._data.loc[labels, columns].astype(object).to_numpy() \
+            .tolist()
+
+    def _insert_many(self, frame: pd.DataFrame):
+        labels = frame.index.tolist()
+        self._next_label = labels[-1] + 1
+        start, stop = self._used, self._used + len(labels)
+        if len(self._data.index) >= stop and all(
+                frame[col].dtype == dtype
+                for col, dtype in self._data.dtypes.items()):
+            # the spare rows are labelled from _next_label on
+            for position, col in enumerate(self._data.columns):
+                self._data.iloc[start:stop, position] = frame[col].to_numpy()
+            self._alive[start:stop] = True
+        else:
+            # grown by a quarter with spare rows (copies of the last one,
+            # so the columns keep their dtypes), or by the concat widening
+            # a column for a value that does not fit it
+            spare = max(stop // 4, 64)
+            pieces = [frame, frame.iloc[[-1] * spare].set_axis(
+                range(self._next_label, self._next_label + spare))]
+            if start != 0:
+                pieces.insert(0, self._data.iloc[:start])
+            self._data = pd.concat(pieces)
+            self._alive = np.concatenate([
+                self._alive[:start], np.ones(len(labels), dtype=bool),
+                np.zeros(spare, dtype=bool)])
+        self._used = stop
+        self.ids.update(zip(frame["id"].tolist(), labels))
+        indexed = self._indexed_columns()
+        if len(indexed) != 0:
+            for label, values in zip(labels, self._rows(labels, indexed)):
+                self._index_add(label, dict(zip(indexed, values)))
+        if self.text is not None:
+            for label, values in zip(labels,
+                                     self._rows(labels, self.text.columns)):
+                self.text.add(label, values)
+
+    def _updates(self, records: Dict[int, Dict]) -> Dict[str, pd.Series]:
+        """
+        New values of each column the records touch, by row label,
+        converted and checked against the column's dtype without writing
+        them, so a value that does not fit raises before a row is changed
+        """
+        updates = dict()
+        for col in self._data.columns:
+            rows = [label for label, record in records.items()
+                    if col in record]
+            if len(rows) == 0:
+                continue
+            values = self._convert(col, [records[label][col]
+                                         for label in rows])
+            series = self._data.loc[rows, col]
+            series.loc[rows] = values
+            updates[col] = series
+        return updates
+
+    def _update_many(self, records: Dict[int, Dict],
+                     updates: Optional[Dict[str, pd.Series]] = None):
+        if updates is None:
+            updates = self._updates(records)
+        labels = list(records)
+        touched = list(updates)
+        indexed = self._indexed_columns(touched)
+        old = self._rows(labels, indexed)
+        searched = self.text is not None and \
+            any(col in touched for col in self.text.columns)
+        if searched:
+            old_text = self._rows(labels, self.text.columns)
+        for col, series in updates.items():
+            self._data.loc[series.index, col] = series
+        for label in labels:
+            self.encoded.pop(label, None)
+        if len(indexed) != 0:
+            new = self._rows(labels, indexed)
+            for label, before, after in zip(labels, old, new):
+                changed = [i for i in range(len(indexed))
+                           if before[i] != after[i]]
+                self._index_remove(label, {indexed[i]: before[i]
+                                           for i in changed})
+                self._index_add(label, {indexed[i]: after[i]
+                                        for i in changed})
+        if searched:
+            new_text = self._rows(labels, self.text.columns)
+            for label, before, after in zip(labels, old_text, new_text):
+                self.text.replace(label, before, after)
+
+    def _delete_many(self, labels: List[int]):
+        indexed = self._indexed_columns()
+        if len(indexed) != 0:
+            for label, values in zip(labels, self._rows(labels, indexed)):
+                self._index_remove(label, dict(zip(indexed, values)))
+        if self.text is not None:
+            for label, values in zip(labels,
+                                     self._rows(labels, self.text.columns)):
+                self.text.remove(label, values)
+        self._bury(labels)
+
+    def _bury(self, labels: List[int]):
+        """
+        Mark deleted rows dead (their labels are already out of the
+        indexes) and vacuum the frame once a quarter of its rows are dead,
+        so a delete costs the frame copy only that often
+        """
+        positions = self._data.index.get_indexer(labels)
+        self._alive[positions] = False
+        self._dead += len(labels)
+        for label in labels:
+            self.encoded.pop(label, None)
+        if self._dead * 4 >= self._used:
+            self._vacuum()
+
+    def _vacuum(self):
+        """
+        Drop the dead rows from the frame, keeping the labels of the others
+        (and the spare rows)
+        """
+        keep = self._alive.copy()
+        keep[self._used:] = True
+        self._data = self._data[keep]
+        self._alive = self._alive[keep]
+        self._used -= self._dead
+        self._dead = 0
+
+    def _log(self, op: Dict):
+        if self.journal is not None:
+            self.journal.write(op)
+
+    def save(self):
+        """
+        Persist pending mutations: hand them to the group-commit flusher,
+        or commit the journal right away when there is none (fsync=always).
+        Without a journal the JSON file is rewritten.
+        :return:
+        """
+        if self.journal is None:
+            self.write()
+        elif self.flusher is None:
+            self.flush(True)
+        else:
+            self.flusher.mark(self)
+
+    @timed("persist")
+    def flush(self, fsync: bool = True):
+        """
+        Commit the journal, compacting it in the background once it
+        outgrows compact_bytes
+        :param fsync:
+        :return:
+        """
+        self.journal.commit(fsync)
+        # other workers tail the log, it is compacted once they are gone
+        if not self.shared and self.journal.size >= self.compact_bytes:
+            self.compact(background=True)
+
+    @timed("persist")
+    def write(self, data: Optional[pd.DataFrame] = None):
+        """
+        Atomically replace the JSON file with data (default: current data)
+        :param data:
+        :return:
+        """
+        data = self.data if data is None else data
+        tmp_path = f"{self.path}.tmp"
+        data.to_json(tmp_path, orient="records", indent=4)
+        # the journal may be rotated away once this returns
+        replace_file(tmp_path, self.path)
+        # told apart from an edit by the file watcher
+        self.written = file_signature(self.path)
+
+    def compact(self, background: bool = False):
+        """
+        Fold the journal back into the JSON file
+        :param background:
+        :return:
+        """
+        if self.journal is None or not self._compacting.acquire(False):
+            return
+        try:
+            # no writer may slip in between the snapshot and the rotation
+            with self.lock.read():
+                snapshot = self.data.copy()
+                self.journal.rotate()
+        except Exception:
+            self._compacting.release()
+            raise
+        if background:
+            Thread(target=self._compact, args=(snapshot,),
+                   name=f"compact-{self.name}", daemon=True).start()
+        else:
+            self._compact(snapshot)
+
+    def _compact(self, snapshot: pd.DataFrame):
+        try:
+            self.write(snapshot)
+            self.journal.discard_rotated()
+            # the next start loads the binary snapshot instead of the JSON
+            write_snapshot(self.path, snapshot)
+        except Exception as e:
+            print(e)
+        finally:
+            self._compacting.release()
+
+    def close(self):
+        """
+        Compact and close the journal on shutdown
+        :return:
+        """
+        if self.journal is None:
+            return
+        if self.shared:
+            self.journal.close()
+            return
+        # wait for a running background compaction
+        with self._compacting:
+            pass
+        # the file size also counts what other workers wrote
+        if self.journal.size != 0 or os.path.getsize(self.journal.path) != 0 \
+                or os.path.exists(self.journal.old_path):
+            self.compact()
+        self.journal.close()
+
+
+class Evictor:
+    """
+    Background eviction of lazily loaded collections that were not accessed
+    for ttl seconds: they are persisted and dropped from memory
+    """
+
+    def __init__(self, collections: Dict[str, Collection], ttl: float):
+        self.collections = collections
+        self.ttl = ttl
+        self.stopped = Event()
+        self.thread = None
+
+    def evict(self):
+        """
+        Evict all idle collections now
+        :return:
+        """
+        for collection in list(self.collections.values()):
+            try:
+                if collection.evict(self.ttl):
+                    print(f"Evicted {collection.name}")
+            except Exception as e:
+                print(e)
+
+    def _run(self):
+        while not self.stopped.wait(min(self.ttl, 60)):
+            self.evict()
+
+    def start(self):
+        """
+        Start the eviction thread
+        :return:
+        """
+        self.stopped.clear()
+        self.thread = Thread(target=self._run, name="collection-evictor",
+                             daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stop the eviction thread
+        :return:
+        """
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
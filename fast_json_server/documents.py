@@ -0,0 +1,102 @@
+from typing import FrozenSet, List, Optional
+from collections import OrderedDict
+from threading import Lock
+from hashlib import sha256
+from graphql import parse
+from graphql.error import GraphQLError
+from graphql.language import ast
+from graphql.validation import validate
+
+
+def query_hash(query: str) -> str:
+    """
+    Hash of a query document, as sent by persisted query clients
+    :param query:
+    :return:
+    """
+    return sha256(query.encode("utf-8")).hexdigest()
+
+
+def _field_names(node) -> List[str]:
+    names = list()
+    selection_set = getattr(node, "selection_set", None)
+    if selection_set is None:
+        return names
+    for selection in selection_set.selections:
+        if isinstance(selection, ast.Field):
+            names.append(selection.name.value)
+        names.extend(_field_names(selection))
+    return names
+
+
+class Document:
+    """
+    Parsed query document with its validation errors, the names of the
+    fields it selects (fragments included) and whether it mutates
+    """
+
+    def __init__(self, hash: str, document: Optional[ast.Document],
+                 errors: Optional[List[GraphQLError]] = None):
+        self.hash = hash
+        self.document = document
+        self.errors = errors
+        definitions = document.definitions if document is not None else ()
+        self.fields: FrozenSet[str] = frozenset(
+            name for definition in definitions
+            for name in _field_names(definition))
+        self.mutation = any(
+            isinstance(definition, ast.OperationDefinition) and
+            definition.operation != "query" for definition in definitions)
+
+
+class DocumentCache:
+    """
+    Bounded LRU of parsed and validated documents keyed by the sha256 of
+    their text, so a repeated query is neither parsed nor validated again.
+    The same keys serve persisted queries: a client that sent a document
+    once can send its hash alone until the document ages out.
+    """
+
+    def __init__(self, schema, max_entries: int = 1024):
+        self.schema = schema
+        self.max_entries = max_entries
+        self.lock = Lock()
+        self.entries: OrderedDict = OrderedDict()
+
+    def get(self, hash: str) -> Optional[Document]:
+        """
+        Cached document of a hash
+        :param hash:
+        :return:
+        """
+        with self.lock:
+            document = self.entries.get(hash)
+            if document is not None:
+                self.entries.move_to_end(hash)
+            return document
+
+    def document(self, query: str) -> Document:
+        """
+        Parsed and validated document of a query, from the cache when seen
+        before
+        :param query:
+        :return:
+        """
+        hash = query_hash(query)
+        document = self.get(hash)
+        if document is not None:
+            return document
+        try:
+            parsed = parse(query)
+        except GraphQLError as e:
+            document = Document(hash, None, [e])
+        else:
+            document = Document(hash, parsed,
+                                validate(self.schema, parsed) or None)
+        if self.max_entries > 0:
+            with self.lock:
+                self.entries[hash] = document
+                self.entries.move_to_end(hash)
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+        return document
@@ -0,0 +1,105 @@
+from typing import Callable, Optional
+from concurrent.futures import ThreadPoolExecutor, Future
+from threading import Lock
+from fastapi.responses import JSONResponse
+import asyncio
+import os
+
+
+class Busy(Exception):
+    """
+    An executor has as many tasks running and queued as it accepts
+    """
+
+
+class Executor:
+    """
+    Bounded thread pool that keeps blocking work (locks, pandas, encoding,
+    disk) off the event loop. At most threads + max_queued tasks are
+    running or waiting; past that run() raises Busy right away, so an
+    overloaded server answers 503 instead of queueing without bound
+    (max_queued None never refuses). The threads are started on first use,
+    after the workers are forked.
+    """
+
+    def __init__(self, name: str, threads: int = 0,
+                 max_queued: Optional[int] = 1024):
+        self.name = name
+        self.threads = threads
+        self.max_queued = max_queued
+        self.lock = Lock()
+        self.pending = 0
+        # tasks refused with Busy
+        self.rejected = 0
+        self.pool: Optional[ThreadPoolExecutor] = None
+
+    def _size(self) -> int:
+        return self.threads if self.threads > 0 \
+            else min(32, (os.cpu_count() or 1) + 4)
+
+    def _done(self, future: Future):
+        with self.lock:
+            self.pending -= 1
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """
+        Queue a call on the pool
+        :param fn:
+        :param args:
+        :param kwargs:
+        :return:
+        """
+        with self.lock:
+            if self.pool is None:
+                self.pool = ThreadPoolExecutor(
+                    self._size(), thread_name_prefix=self.name)
+            if self.max_queued is not None and \
+                    self.pending >= self._size() + self.max_queued:
+                self.rejected += 1
+                raise Busy(f"{self.name} executor is full")
+            self.pending += 1
+        try:
+            future = self.pool.submit(fn, *args, **kwargs)
+        except Exception:
+            with self.lock:
+                self.pending -= 1
+            raise
+        future.add_done_callback(self._done)
+        return future
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        """
+        Run a call on the pool and await its result
+        :param fn:
+        :param args:
+        :param kwargs:
+        :return:
+        """
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def queued(self) -> int:
+        """
+        Tasks waiting for a thread
+        :return:
+        """
+        with self.lock:
+            return max(0, self.pending - self._size())
+
+    def shutdown(self):
+        """
+        Wait for the queued tasks and stop the threads
+        :return:
+        """
+        with self.lock:
+            pool, self.pool = self.pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+
+def busy_response() -> JSONResponse:
+    """
+    503 response of a request refused by a full executor
+    :return:
+    """
+    return JSONResponse(status_code=503, content={"message": "Server Busy"},
+                        headers={"Retry-After": "1"})
@@ -1,493 +1,1196 @@
-import uvicorn
-from fastapi import FastAPI, Request
-from fastapi import APIRouter
-from typing import Dict, Optional, Any, Tuple, List
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from fastapi.encoders import jsonable_encoder
-from pydantic import BaseModel
-from graphene import Schema
-from glob import glob
-from pathlib import Path
-import pandas as pd
-import json
-from math import ceil
-from os import sep
-import graphene
-from starlette.graphql import GraphQLApp
-from graphql import GraphQLError
-
-
-class ProjectSettings:
-    PROJECT_NAME = "FAST JSON GraphQL SERVER"
-    PROJECT_DESCRIPTION = "Simple GraphQL Application using JSON data and FASTAPI"
-    API_VERSION = "1.0.0"
-    API_VERSION_PATH = "/api/v1"
-
-
-# REST API Settings
-app = FastAPI(title=ProjectSettings.PROJECT_NAME,
-              description=ProjectSettings.PROJECT_DESCRIPTION,
-              version=ProjectSettings.API_VERSION,
-              # docs_url=None,
-              # redoc_url=None,
-              openapi_url=f"{ProjectSettings.API_VERSION_PATH}/openapi.json",
-              docs_url=f"{ProjectSettings.API_VERSION_PATH}/docs",
-              redoc_url=f"{ProjectSettings.API_VERSION_PATH}/redoc")
-
-# Middleware Settings
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-base_responses = {
-    400: {"description": "Bad Request"},
-    401: {"description": "Unauthorized"},
-    404: {"description": "Not Found"},
-    422: {"description": "Validation Error"},
-    500: {"description": "Internal Server Error"}
-}
-
-general_responses = {
-    **base_responses,
-    200: {
-        "content": {
-            "application/json": {
-                "example": {"message": "success"}
-            }
-        },
-    }
-}
-
-pagination_responses = {
-    **base_responses,
-    200: {
-        "content": {
-            "application/json": {
-                "example": {"total_pages": 0,
-                            "total_items": 0,
-                            "page_data": {"page_num": 0,
-                                          "items_count": 0,
-                                          "items": []}}
-            }
-        },
-    }
-}
-
-api_router = APIRouter()
-
-
-def create_routes(name: str) -> str:
-    """
-    Mutations Routes
-    :param name:
-    :return:
-    """
-    routes = '''
-class Create%s(graphene.Mutation):
-    """
-    Create %s Record
-    """
-
-    class Arguments:
-        createRecord = %sRecord(required=True)
-    
-    message = graphene.String()
-    id = graphene.Int()
-    @staticmethod
-    def mutate(root, info, createRecord):
-
-        try:
-            data = jsonable_encoder(createRecord)
-            data["id"] = int(%s["id"].max()) + 1
-            print(data)
-            column_order = list(%s.columns)
-            data_new = {col:data[col] for col in column_order}
-
-            %s.loc[len(%s.index)] = list(data_new.values())
-
-            path = Path(str(%s_path))
-            file_name = str(path.name).split(".")[0]
-
-            %s.to_json(f"{path.parent.absolute()}{sep}{file_name}.json",orient="records",indent=4)
-
-            return Create%s(message="success",id=data["id"])
-        except Exception as e:
-            print(e)
-            raise GraphQLError("Internal Server Error")
-
-
-class Update%s(graphene.Mutation):
-    """
-    Update %s Record
-    """
-
-    class Arguments:
-        id = graphene.Int(required=True)
-        updateRecord = %sRecord(required=True)
-    
-    message = graphene.String()
-    
-    @staticmethod
-    def mutate(root, info, id, updateRecord):
-
-       try:
-            data = jsonable_encoder(updateRecord)
-            
-            %s.loc[%s['id'] == int(id), list(data.keys())] = list(data.values())
-
-            path = Path(str(%s_path))
-            file_name = str(path.name).split(".")[0]
-
-            %s.to_json(f"{path.parent.absolute()}{sep}{file_name}.json",orient="records",indent=4)
-
-            return Update%s(message="success")
-       except Exception as e:
-            print(e)
-            raise GraphQLError("Internal Server Error")
-
-
-class Delete%s(graphene.Mutation):
-    """
-    Delete %s
-    """
-
-    class Arguments:
-        id = graphene.Int(required=True)
-
-    message = graphene.String()
-
-    @staticmethod
-    def mutate(root, info, id):
-        try:
-            %s.drop(%s[%s['id'] == int(id)].index, inplace = True)
-
-            path = Path(str(%s_path))
-            file_name = str(path.name).split(".")[0]
-
-            %s.to_json(f"{path.parent.absolute()}{sep}{file_name}.json",orient="records",indent=4)
-
-            return Delete%s(message="success")
-        except Exception:
-            print(e)
-            message = "failed"
-            raise GraphQLError("Internal Server Error")
-
-      ''' % (
-        name.title(), name.title(), name.title(), name, name, name, name,
-        name, name, name.title(),
-        name.title(), name, name.title(), name, name, name, name,
-        name.title(),
-        name.title(), name, name, name, name, name, name, name.title())
-    return routes
-
-
-def create_mutations(mut_strs):
-    """
-    Mutations
-    :param mut_strs:
-    :return:
-    """
-    return '''
-class Mutations(graphene.ObjectType):
-    """
-    GraphQL Mutations
-    """
-%s  
-    ''' % (mut_strs)
-
-
-def mutation_routes(name):
-    """
-    Mutations objects
-    :param name:
-    :return:
-    """
-    mut_var = '''
-
-    create%s = Create%s.Field()
-    update%s = Update%s.Field()
-    delete%s = Delete%s.Field()
-
-    ''' % (
-        name.title(), name.title(), name.title(), name.title(), name.title(),
-        name.title())
-    return mut_var
-
-
-def query_super_schema(name):
-    """
-    Query Data type Objects
-    :param name:
-    :return:
-    """
-    return '''
-class %sPageInfo(graphene.ObjectType):    
-    page_num = graphene.Int()
-    item_count = graphene.Int()
-    items = graphene.List(%sItems)
-class %s(graphene.ObjectType):
-    total_pages = graphene.Int()
-    total_items = graphene.Int()
-    page_data = graphene.Field(%sPageInfo)
-    ''' % (name.title(), name.title(), name.title(), name.title())
-
-
-def mutation_schema(name, params):
-    """
-    Mutation schemas
-    :param name:
-    :param params:
-    :return:
-    """
-    return '''
-class %sRecord(graphene.InputObjectType):
-%s
-    ''' % (name.title(), params)
-
-
-def query_schema(name, params):
-    """
-    Query Data type Objects
-    :param name:
-    :param params:
-    :return:
-    """
-    return '''
-class %sItems(graphene.ObjectType):
-%s
-    ''' % (name.title(), params)
-
-
-def query_params(name, params):
-    """
-    Query Data Types
-    :param name:
-    :param params:
-    :return:
-    """
-    return '''
-    %s = graphene.List(%s, %s)
-    ''' % (name, name.title(), params)
-
-
-def query_method(name, params, filters):
-    """
-    create Query Resolver
-    :param name:
-    :param params:
-    :param filters:
-    :return:
-    """
-    return '''  
-    def resolve_%s(self, info, %s,page_size=10,page_num=1, **kwargs):
-
-        try:
-            data = %s.copy()
-            total_items = data.shape[0]
-            %s
-
-            if page_size is not None:
-
-                offset = page_size*(page_num-1)
-
-                data = data[offset:offset + page_size]
-            return [{"total_pages": ceil(data.shape[0]/float(page_size)),
-                                     "total_items": total_items,
-                                     "page_data": {"page_num": page_num,
-                                                   "item_count": page_size,
-                                                   "items":
-                                                       json.loads(data.to_json(orient="records"))}}]
-            # return json.loads(data.to_json(orient="records"))
-        except Exception:
-            print(e)
-            raise GraphQLError("Internal Server Error")
-
-    ''' % (name, params, name, filters)
-
-
-def create_query(filter_vars, filter_methods):
-    """
-    create Query
-    :param filter_vars:
-    :param filter_methods:
-    :return:
-    """
-    return '''
-class Query(graphene.ObjectType):
-    """
-    GraphQL Query
-    """
-
-%s
-
-%s  
-
-    ''' % (filter_vars, filter_methods)
-
-
-# Root API
-@app.get(ProjectSettings.API_VERSION_PATH, include_in_schema=False)
-def root() -> JSONResponse:
-    return JSONResponse(status_code=200,
-                        content={
-                            "message": "Welcome to FAST JSON SERVER"})
-
-
-source = dict()
-file_paths = dict()
-
-
-def get_fil_int(col) -> str:
-    """
-    Integer based filter conditions
-    :param col:
-    :return:
-    """
-    return """
-            if %s is not None:
-                data = data[data["%s"] == int(%s)]
-    """ % (col, col, col)
-
-
-def get_fil_non_int(col) -> str:
-    """
-    String based filter conditions
-    :param col:
-    :return:
-    """
-    return """
-            if %s is not None:
-                data = data[data["%s"] == str(%s)]
-    """ % (col, col, col)
-
-
-def get_fil_float(col) -> str:
-    """
-    floats based filter conditions
-    :param col:
-    :return:
-    """
-    return """
-            if %s is not None:
-                data = data[data["%s"] == float(%s)]
-    """ % (col, col, col)
-
-
-def graph_conf():
-    """
-    GraphQL configurations
-    :return:
-    """
-    return '''
-app.add_route(f"{ProjectSettings.API_VERSION_PATH}/graphql", GraphQLApp(graphiql=True, schema=graphene.Schema(query=Query, mutation=Mutations)))
-# graphql_app = GraphQLApp(graphiql=True, schema=Schema(query=Query, mutation=Mutations))
-# @app.api_route(f"{ProjectSettings.API_VERSION_PATH}/graphql",
-#                    methods=["GET", "POST"])
-# async def graphql(request: Request):
-#         """
-#         FastAPI-GraphQL with JWT Authentication
-#         """
-#         return await graphql_app.handle_graphql(request=request)
-    '''
-
-
-def get_query_params(df_data) -> Tuple:
-    """
-    Create Query / Mutation related params
-    :param df_data:
-    :return:
-    """
-    filter_str = ""
-    body_params = ""
-    query_body_params = ""
-    # body_param_var = list()
-    # body_param_val = list()
-    query_filters = list()
-    for col in df_data.columns:
-        if df_data[col].dtype in ["int", "int32", "int64"]:
-            filter_str += get_fil_int(col)
-            if col != "id":
-                # body_param_var.append(col)
-                # body_param_val.append("graphene.Int(required=True)")
-                body_params += f"\u0020\u0020\u0020\u0020\u0020\u0020\u0020\u0020{col} = graphene.Int(required=True)\n"
-                query_filters.append(f"{col} = graphene.Int()")
-            query_body_params += f"\u0020\u0020\u0020\u0020\u0020\u0020\u0020\u0020{col} = graphene.Int()\n"
-        elif df_data[col].dtype in ["float", "float32", "float64"]:
-            filter_str += get_fil_float(col)
-            # body_param_var.append(col)
-            # body_param_val.append("graphene.Float(required=True)")
-            body_params += f"\u0020\u0020\u0020\u0020\u0020\u0020\u0020\u0020{col} = graphene.Float(required=True)\n"
-            query_filters.append(f"{col} = graphene.Float()")
-            query_body_params += f"\u0020\u0020\u0020\u0020\u0020\u0020\u0020\u0020{col} = graphene.Float()\n"
-        else:
-            filter_str += get_fil_non_int(col)
-            # body_param_var.append(col)
-            # body_param_val.append("graphene.String(required=True)")
-            body_params += f"\u0020\u0020\u0020\u0020\u0020\u0020\u0020\u0020{col} = graphene.String(required=True)\n"
-            query_filters.append(f"{col} = graphene.String()")
-            query_body_params += f"\u0020\u0020\u0020\u0020\u0020\u0020\u0020\u0020{col} = graphene.String()\n"
-    filter_params = ",".join(
-        [f"{col}" for col in df_data.columns if col != "id"])
-    query_filter_params = ",".join(
-        [f"{col} = None" for col in df_data.columns])
-    # body_params = ",".join(body_param_var) + " = " + ",".join(body_param_val)
-    return filter_str, filter_params, body_params, query_filter_params, ",".join(
-        query_filters + ["id = graphene.Int()", "page_size=graphene.Int()",
-                         "page_num=graphene.Int()"]), query_body_params
-
-
-def start_graphql(data_path: str, host: str, port: int, log_level):
-    """
-    Start GraphQL Server
-    :param data_path:
-    :param host:
-    :param port:
-    :param log_level:
-    :return:
-    """
-    # Load JSON data
-    for file_path in glob(f"{data_path}/*.json"):
-        file = Path(file_path)
-        file_name = str(file.name).split(".")[0]
-        file_paths[file_name] = file_path
-        source[file_name] = pd.read_json(file_path, orient="records")
-        globals()[f"{file_name}_path"] = file_path
-    mut_strs = ["\u0020\u0020\u0020\u0020"]
-    query_params_str = ""
-    query_filter_str = ""
-    for key, value in source.items():
-        globals()[key] = value
-        filter_str, filter_params, body_params, query_filter_params, query_filters_str, query_body_params = get_query_params(
-            value)
-        # create mutations schemas
-        exec(mutation_schema(key, query_body_params), globals())
-        # exec(create_routes(str(key), filter_params, body_params),
-        #      globals())
-
-        # create Mutation routes
-        exec(create_routes(str(key)), globals())
-
-        # create Query Schemas
-        exec(query_schema(key, query_body_params), globals())
-
-        # create Query schemas
-        exec(query_super_schema(key), globals())
-        mut_strs.append(mutation_routes(key).strip())
-        query_params_str += query_params(key, query_filters_str)
-        query_filter_str += query_method(key, query_filter_params, filter_str)
-    # create Mutations
-    exec(create_mutations("\n\u0020\u0020\u0020\u0020".join(mut_strs)),
-         globals())
-    # create Query
-    exec(create_query(f"\t{query_params_str}", f"\t{query_filter_str}"),
-         globals())
-    # create GraphQL Configuration
-    exec(graph_conf(), globals())
-
-    # Run Server
-    uvicorn.run(app, host=host, port=port, log_level=log_level)
+from fastapi import FastAPI, Request
+from fastapi import APIRouter
+from typing import Dict, Optional, Any, Tuple, List, Iterator, Set
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, PlainTextResponse
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+from graphene import Schema
+from glob import glob
+from pathlib import Path
+import pandas as pd
+from pandas.api.types import is_datetime64_any_dtype, is_integer_dtype, \
+    is_float_dtype
+import json
+from math import ceil
+from functools import partial
+import graphene
+from starlette.graphql import GraphQLApp
+from graphql import GraphQLError
+from graphql.error import format_error as format_graphql_error
+from graphql.execution import execute, ExecutionResult
+from starlette.background import BackgroundTasks
+from hashlib import blake2b
+from promise import Promise
+from promise.dataloader import DataLoader
+from graphene.utils.str_converters import to_camel_case
+from graphql.language import ast
+from .collection import Collection, Evictor, select_columns
+from .journal import Journal, Flusher, journal_path, FSYNC_POLICIES
+from .workers import serve
+from .sqlite_store import SqliteCollection
+from .snapshot import load_files, read_data, sniff_data
+from .executor import Executor, Busy, busy_response
+from .documents import Document, DocumentCache, query_hash
+from .cache import ResponseCache
+from .watcher import Watcher
+from .metrics import MetricsMiddleware, enable_metrics, metrics_endpoint, \
+    resolver_middleware, timed_response
+
+
+class ProjectSettings:
+    PROJECT_NAME = "FAST JSON GraphQL SERVER"
+    PROJECT_DESCRIPTION = "Simple GraphQL Application using JSON data and FASTAPI"
+    API_VERSION = "1.0.0"
+    API_VERSION_PATH = "/api/v1"
+
+
+# REST API Settings
+app = FastAPI(title=ProjectSettings.PROJECT_NAME,
+              description=ProjectSettings.PROJECT_DESCRIPTION,
+              version=ProjectSettings.API_VERSION,
+              # docs_url=None,
+              # redoc_url=None,
+              openapi_url=f"{ProjectSettings.API_VERSION_PATH}/openapi.json",
+              docs_url=f"{ProjectSettings.API_VERSION_PATH}/docs",
+              redoc_url=f"{ProjectSettings.API_VERSION_PATH}/redoc")
+
+# Middleware Settings
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+base_responses = {
+    400: {"description": "Bad Request"},
+    401: {"description": "Unauthorized"},
+    404: {"description": "Not Found"},
+    422: {"description": "Validation Error"},
+    500: {"description": "Internal Server Error"}
+}
+
+general_responses = {
+    **base_responses,
+    200: {
+        "content": {
+            "application/json": {
+                "example": {"message": "success"}
+            }
+        },
+    }
+}
+
+pagination_responses = {
+    **base_responses,
+    200: {
+        "content": {
+            "application/json": {
+                "example": {"total_pages": 0,
+                            "total_items": 0,
+                            "page_data": {"page_num": 0,
+                                          "items_count": 0,
+                                          "items": []}}
+            }
+        },
+    }
+}
+
+api_router = APIRouter()
+
+
+class BulkResult(graphene.ObjectType):
+    """
+    Outcome of one bulk item
+    """
+    op = graphene.String()
+    id = graphene.Int()
+    status = graphene.Int()
+    message = graphene.String()
+
+
+def create_routes(name: str) -> str:
+    """
+    Mutations Routes
+    :param name:
+    :return:
+    """
+    routes = '''
+class Create%(title)s(graphene.Mutation):
+    """
+    Create %(title)s Record
+    """
+
+    class Arguments:
+        createRecord = %(title)sRecord(required=True)
+    
+    message = graphene.String()
+    id = graphene.Int()
+    @staticmethod
+    def mutate(root, info, createRecord):
+        collection = source["%(name)s"]
+        try:
+            # plain dicts, a field named items or keys would hide the
+            # methods of the input object
+            data = jsonable_encoder(dict(createRecord))
+            id = collection.create(data)
+            collection.save()
+
+            return Create%(title)s(message="success",id=id)
+        except Exception as e:
+            print(e)
+            raise GraphQLError("Internal Server Error")
+
+
+class Update%(title)s(graphene.Mutation):
+    """
+    Update %(title)s Record
+    """
+
+    class Arguments:
+        id = graphene.Int(required=True)
+        updateRecord = %(title)sRecord(required=True)
+    
+    message = graphene.String()
+    
+    @staticmethod
+    def mutate(root, info, id, updateRecord):
+        collection = source["%(name)s"]
+        try:
+            data = jsonable_encoder(dict(updateRecord))
+            
+            if not collection.update(id, data):
+                return Update%(title)s(message="No Data Found")
+            collection.save()
+
+            return Update%(title)s(message="success")
+        except Exception as e:
+            print(e)
+            raise GraphQLError("Internal Server Error")
+
+
+class Delete%(title)s(graphene.Mutation):
+    """
+    Delete %(title)s
+    """
+
+    class Arguments:
+        id = graphene.Int(required=True)
+
+    message = graphene.String()
+
+    @staticmethod
+    def mutate(root, info, id):
+        collection = source["%(name)s"]
+        try:
+            if not collection.delete(id):
+                return Delete%(title)s(message="No Data Found")
+            collection.save()
+
+            return Delete%(title)s(message="success")
+        except Exception as e:
+            print(e)
+            raise GraphQLError("Internal Server Error")
+
+
+class %(title)sBulkItem(graphene.InputObjectType):
+    """
+    create (record), update (id, record) or delete (id)
+    """
+    op = graphene.String(required=True)
+    id = graphene.Int()
+    record = %(title)sRecord()
+
+
+class Bulk%(title)s(graphene.Mutation):
+    """
+    Create / Update / Delete %(title)s Records in one batch
+    """
+
+    class Arguments:
+        items = graphene.List(graphene.NonNull(%(title)sBulkItem),
+                              required=True)
+
+    message = graphene.String()
+    results = graphene.List(BulkResult)
+
+    @staticmethod
+    def mutate(root, info, items):
+        collection = source["%(name)s"]
+        try:
+            results = collection.bulk([{"op": item.get("op"),
+                                        "id": item.get("id"),
+                                        "record": jsonable_encoder(
+                                            dict(item.get("record") or
+                                                 dict()))}
+                                       for item in items])
+            collection.save()
+
+            return Bulk%(title)s(message="success", results=results)
+        except ValueError as e:
+            raise GraphQLError(str(e))
+        except Exception as e:
+            print(e)
+            raise GraphQLError("Internal Server Error")
+
+      ''' % {"name": name, "title": name.title()}
+    return routes
+
+
+def create_mutations(mut_strs):
+    """
+    Mutations
+    :param mut_strs:
+    :return:
+    """
+    return '''
+class Mutations(graphene.ObjectType):
+    """
+    GraphQL Mutations
+    """
+%s  
+    ''' % (mut_strs)
+
+
+def mutation_routes(name):
+    """
+    Mutations objects
+    :param name:
+    :return:
+    """
+    mut_var = '''
+
+    create%s = Create%s.Field()
+    update%s = Update%s.Field()
+    delete%s = Delete%s.Field()
+    bulk%s = Bulk%s.Field()
+
+    ''' % tuple([name.title()] * 8)
+    return mut_var
+
+
+def query_super_schema(name):
+    """
+    Query Data type Objects
+    :param name:
+    :return:
+    """
+    return '''
+class %sPageInfo(graphene.ObjectType):    
+    page_num = graphene.Int()
+    item_count = graphene.Int()
+    items = graphene.List(%sItems)
+class %s(graphene.ObjectType):
+    total_pages = graphene.Int()
+    total_items = graphene.Int()
+    page_data = graphene.Field(%sPageInfo)
+class %sEdge(graphene.ObjectType):
+    cursor = graphene.String()
+    node = graphene.Field(%sItems)
+class %sConnection(graphene.ObjectType):
+    total_count = graphene.Int()
+    edges = graphene.List(%sEdge)
+    page_info = graphene.Field(graphene.relay.PageInfo)
+    ''' % tuple([name.title()] * 8)
+
+
+def mutation_schema(name, params):
+    """
+    Mutation schemas
+    :param name:
+    :param params:
+    :return:
+    """
+    return '''
+class %sRecord(graphene.InputObjectType):
+%s
+    ''' % (name.title(), params)
+
+
+def query_schema(name, params):
+    """
+    Query Data type Objects
+    :param name:
+    :param params:
+    :return:
+    """
+    return '''
+class %sItems(graphene.ObjectType):
+%s
+    ''' % (name.title(), params)
+
+
+def query_params(name, params):
+    """
+    Query Data Types
+    :param name:
+    :param params:
+    :return:
+    """
+    return '''
+    %s = graphene.List(%s, %s, page_size=graphene.Int(),
+                       page_num=graphene.Int())
+    %s_connection = graphene.Field(%sConnection, %s,
+                                   _first=graphene.Int(name="_first"),
+                                   _after=graphene.String(name="_after"))
+    ''' % (name, name.title(), params, name, name.title(), params)
+
+
+def query_method(name, params, filters):
+    """
+    create Query Resolver
+    :param name:
+    :param params:
+    :param filters:
+    :return:
+    """
+    return '''  
+    def resolve_%(name)s(self, info, %(params)s,page_size=10,page_num=1,
+                         _sort=None, _order="asc", _search=None, **kwargs):
+
+        collection = source["%(name)s"]
+        try:
+            filters = dict()
+            conditions = list()
+            %(filters)s
+            with collection.read():
+                total_items = collection.count()
+                offset = 0
+                if page_size is not None:
+
+                    offset = page_size*(page_num-1)
+
+                data = collection.select(filters, conditions, _sort,
+                                         _order, offset, page_size,
+                                         search=_search)
+                # encode only the selected columns
+                data = data[projection("%(name)s", data.columns,
+                                       selected_fields(info, ["pageData",
+                                                              "items"]))]
+            return [{"total_pages": ceil(data.shape[0]/float(page_size)),
+                                     "total_items": total_items,
+                                     "page_data": {"page_num": page_num,
+                                                   "item_count": page_size,
+                                                   "items":
+                                                       json.loads(data.to_json(orient="records"))}}]
+            # return json.loads(data.to_json(orient="records"))
+        except ValueError as e:
+            raise GraphQLError(str(e))
+        except Exception as e:
+            print(e)
+            raise GraphQLError("Internal Server Error")
+
+    def resolve_%(name)s_connection(self, info, %(params)s, _first=10,
+                                    _after=None, _sort=None, _order="asc",
+                                    _search=None, **kwargs):
+
+        collection = source["%(name)s"]
+        try:
+            filters = dict()
+            conditions = list()
+            %(filters)s
+            if _first < 0:
+                raise ValueError("_first must not be negative")
+            with collection.read():
+                total_items = collection.count()
+                # keyset pagination, one extra row tells if there is more
+                data = collection.select(filters, conditions, _sort,
+                                         _order, 0, _first + 1,
+                                         search=_search, after=_after)
+                has_next_page = data.shape[0] > _first
+                data = data.iloc[:_first]
+                cursors = collection.cursors(data, _sort, _order)
+                data = data[projection("%(name)s", data.columns,
+                                       selected_fields(info, ["edges",
+                                                              "node"]))]
+            nodes = json.loads(data.to_json(orient="records"))
+            return {"total_count": total_items,
+                    "edges": [{"cursor": cursor, "node": node}
+                              for cursor, node in zip(cursors, nodes)],
+                    "page_info": {
+                        "has_next_page": has_next_page,
+                        "has_previous_page": _after is not None,
+                        "start_cursor": cursors[0] if cursors else None,
+                        "end_cursor": cursors[-1] if cursors else None}}
+        except ValueError as e:
+            raise GraphQLError(str(e))
+        except Exception as e:
+            print(e)
+            raise GraphQLError("Internal Server Error")
+
+    ''' % {"name": name, "params": params, "filters": filters}
+
+
+def create_query(filter_vars, filter_methods):
+    """
+    create Query
+    :param filter_vars:
+    :param filter_methods:
+    :return:
+    """
+    return '''
+class Query(graphene.ObjectType):
+    """
+    GraphQL Query
+    """
+
+%s
+
+%s  
+
+    ''' % (filter_vars, filter_methods)
+
+
+# Root API
+@app.get(ProjectSettings.API_VERSION_PATH, include_in_schema=False)
+def root() -> JSONResponse:
+    return JSONResponse(status_code=200,
+                        content={
+                            "message": "Welcome to FAST JSON SERVER"})
+
+
+source = dict()
+file_paths = dict()
+# query and mutation execution (reads, mutations, journal commits)
+work = Executor("work")
+
+
+class ExecutorGraphQLApp(GraphQLApp):
+    """
+    GraphQL app executing on the bounded work executor instead of the
+    default threadpool, answering 503 when it is full. Documents are
+    parsed and validated once (DocumentCache), which also serves persisted
+    queries sent as extensions.persistedQuery.sha256Hash. With
+    result_entries, query responses are cached per document, variables
+    and versions of the collections the document reads.
+    """
+
+    def __init__(self, schema: graphene.Schema, graphiql: bool = True,
+                 document_entries: int = 1024, result_entries: int = 0):
+        super().__init__(schema=schema, graphiql=graphiql)
+        self.documents = DocumentCache(schema, document_entries)
+        self.results = ResponseCache(result_entries)
+
+    def swap(self, schema: graphene.Schema):
+        """
+        Serve a new schema (a watched file added, removed or changed the
+        columns of a collection), dropping the documents validated against
+        the old one and the cached results
+        :param schema:
+        :return:
+        """
+        self.schema = schema
+        self.documents = DocumentCache(schema, self.documents.max_entries)
+        self.results = ResponseCache(self.results.max_entries)
+
+    @staticmethod
+    def _params(query_params) -> Dict:
+        # variables and extensions are JSON encoded in a query string
+        return {key: json.loads(value) if key in ("variables", "extensions")
+                else value for key, value in query_params.items()}
+
+    async def handle_graphql(self, request: Request) -> Response:
+        try:
+            if request.method in ("GET", "HEAD"):
+                if "text/html" in request.headers.get("Accept", ""):
+                    if not self.graphiql:
+                        return PlainTextResponse("Not Found",
+                                                 status_code=404)
+                    return await self.handle_graphiql(request)
+                data = self._params(request.query_params)
+            elif request.method == "POST":
+                content_type = request.headers.get("Content-Type", "")
+                if "application/json" in content_type:
+                    data = await request.json()
+                elif "application/graphql" in content_type:
+                    data = {"query": (await request.body()).decode()}
+                elif "query" in request.query_params:
+                    data = self._params(request.query_params)
+                else:
+                    return PlainTextResponse("Unsupported Media Type",
+                                             status_code=415)
+            else:
+                return PlainTextResponse("Method Not Allowed",
+                                         status_code=405)
+            query = data.get("query")
+            persisted = (data.get("extensions") or dict()).get(
+                "persistedQuery") or dict()
+            hash = persisted.get("sha256Hash")
+        except (ValueError, AttributeError):
+            return PlainTextResponse("Malformed GraphQL request",
+                                     status_code=400)
+        if query is None and hash is None:
+            return PlainTextResponse("No GraphQL query found in the request",
+                                     status_code=400)
+        if query is not None and hash is not None and \
+                query_hash(query) != hash:
+            return JSONResponse(
+                {"errors": [{"message": "provided sha does not match query"}]},
+                status_code=400)
+        background = BackgroundTasks()
+        context = {"request": request, "background": background}
+        try:
+            return await work.run(self.respond, query, hash,
+                                  data.get("variables"),
+                                  data.get("operationName"), context,
+                                  background)
+        except Busy:
+            return busy_response()
+
+    def result_key(self, document: Document, variables,
+                   operation_name: Optional[str]) -> str:
+        """
+        Result cache key of a document run with variables against the
+        current versions of the collections it reads
+        :param document:
+        :param variables:
+        :param operation_name:
+        :return:
+        """
+        versions = list()
+        for name in sorted(document_collections(document)):
+            source[name].sync()
+            versions.append((name, source[name].version))
+        key = repr((document.hash, operation_name,
+                    json.dumps(variables or dict(), sort_keys=True,
+                               default=str),
+                    versions)).encode("utf-8")
+        return blake2b(key, digest_size=16).hexdigest()
+
+    def respond(self, query: Optional[str], hash: Optional[str], variables,
+                operation_name: Optional[str], context: Dict,
+                background: BackgroundTasks) -> Response:
+        """
+        Run a query (or the persisted query of hash) to a response
+        :param query:
+        :param hash:
+        :param variables:
+        :param operation_name:
+        :param context:
+        :param background:
+        :return:
+        """
+        if query is not None:
+            document = self.documents.document(query)
+        else:
+            document = self.documents.get(hash)
+            if document is None:
+                # the client sends the query with its hash next
+                return JSONResponse({"errors": [{
+                    "message": "PersistedQueryNotFound",
+                    "extensions": {"code": "PERSISTED_QUERY_NOT_FOUND"}}]})
+        if document.errors is not None:
+            result = ExecutionResult(errors=document.errors, invalid=True)
+        else:
+            key = None
+            if self.results.max_entries > 0 and not document.mutation:
+                key = self.result_key(document, variables, operation_name)
+                cached = self.results.get(key)
+                if cached is not None:
+                    return Response(cached[1], status_code=cached[0],
+                                    media_type="application/json")
+            result = execute(self.schema, document.document,
+                             context_value=context,
+                             variable_values=variables,
+                             operation_name=operation_name,
+                             middleware=resolver_middleware())
+            if key is not None and not result.errors:
+                response = timed_response(
+                    document_collections(document),
+                    lambda: JSONResponse({"data": result.data},
+                                         background=background))
+                self.results.put(key, 200, response.body)
+                return response
+        response_data = {"data": result.data}
+        if result.errors:
+            response_data["errors"] = [format_graphql_error(error)
+                                       for error in result.errors]
+        return timed_response(
+            document_collections(document),
+            lambda: JSONResponse(response_data,
+                                 status_code=400 if result.errors else 200,
+                                 background=background))
+
+
+# collection -> relation field -> column holding its key
+relation_keys: Dict[str, Dict[str, str]] = dict()
+# query / relation field -> collections it reads
+field_collections: Dict[str, Set[str]] = dict()
+# <prefix>_id columns that refer to users
+USER_ALIASES = ("author", "owner", "creator", "editor", "user")
+
+
+def document_collections(document: Document) -> Set[str]:
+    """
+    Collections read by the query and relation fields of a document
+    :param document:
+    :return:
+    """
+    return set().union(*(field_collections.get(field, ())
+                         for field in document.fields))
+
+
+def foreign_keys(schemas: Dict[str, pd.DataFrame],
+                 relations: Optional[str] = None) -> Dict[str, Dict[str, str]]:
+    """
+    Foreign keys of each collection, {name: {column: target}}. An integer
+    <prefix>_id column refers to the <prefix>s, <prefix>es or <prefix>
+    collection (author_id, owner_id ... to users). relations adds or
+    overrides keys ("articles.writer_id=users,articles.editor_id=", no
+    target to drop one) and "none" disables them
+    :param schemas:
+    :param relations:
+    :return:
+    """
+    keys = dict()
+    if relations == "none":
+        return keys
+    for name, schema in schemas.items():
+        for col in schema.columns:
+            if col == "id" or not col.endswith("_id") or \
+                    not is_integer_dtype(schema[col]):
+                continue
+            prefix = col[:-3]
+            candidates = [f"{prefix}s", f"{prefix}es", prefix]
+            if prefix in USER_ALIASES:
+                candidates.append("users")
+            target = next((candidate for candidate in candidates
+                           if candidate in schemas and
+                           "id" in schemas[candidate].columns), None)
+            if target is not None:
+                keys.setdefault(name, dict())[col] = target
+    for relation in (relations or "").split(","):
+        if relation.strip() == "":
+            continue
+        column, _, target = relation.strip().partition("=")
+        name, _, col = column.partition(".")
+        if name not in schemas or col not in schemas[name].columns or \
+                not col.endswith("_id") or \
+                (target != "" and target not in schemas):
+            print(f"Unknown relation {relation.strip()}")
+        elif target == "":
+            keys.get(name, dict()).pop(col, None)
+        else:
+            keys.setdefault(name, dict())[col] = target
+    return keys
+
+
+def relation_fields(keys: Dict[str, Dict[str, str]],
+                    schemas: Dict[str, pd.DataFrame]) -> Dict[str, str]:
+    """
+    Items fields of the foreign keys: the referred record (author for
+    author_id) and, on the referred collection, the list of referring
+    records (articles, or articles_by_editor when articles refers to it
+    more than once)
+    :param keys:
+    :param schemas:
+    :return:
+    """
+    fields = {name: dict() for name in schemas}
+    relation_keys.clear()
+    field_collections.clear()
+    for name in schemas:
+        field_collections[to_camel_case(name)] = {name}
+        field_collections[to_camel_case(f"{name}_connection")] = {name}
+    for name, columns in keys.items():
+        targets = list(columns.values())
+        for col, target in columns.items():
+            field = col[:-3]
+            if field not in schemas[name].columns and \
+                    field not in fields[name]:
+                relation_keys.setdefault(name, dict())[
+                    to_camel_case(field)] = col
+                field_collections.setdefault(to_camel_case(field),
+                                             set()).add(target)
+                fields[name][field] = (
+                    f"graphene.Field(lambda: {target.title()}Items, "
+                    f"resolver=relation_resolver(\"{target}\", \"id\", "
+                    f"\"{col}\"))")
+            reverse = name if targets.count(target) == 1 \
+                else f"{name}_by_{field}"
+            if reverse not in schemas[target].columns and \
+                    reverse not in fields[target]:
+                relation_keys.setdefault(target, dict())[
+                    to_camel_case(reverse)] = "id"
+                field_collections.setdefault(to_camel_case(reverse),
+                                             set()).add(name)
+                fields[target][reverse] = (
+                    f"graphene.List(lambda: {name.title()}Items, "
+                    f"resolver=relation_resolver(\"{name}\", \"{col}\", "
+                    f"\"id\", many=True))")
+    return {name: "".join(f"        "
+                          f"{field} = {declaration}\n"
+                          for field, declaration in declared.items())
+            for name, declared in fields.items()}
+
+
+def _selections(info, selection_sets) -> Iterator[ast.Field]:
+    for selection_set in selection_sets:
+        if selection_set is None:
+            continue
+        for selection in selection_set.selections:
+            if isinstance(selection, ast.FragmentSpread):
+                yield from _selections(info, [info.fragments[
+                    selection.name.value].selection_set])
+            elif isinstance(selection, ast.InlineFragment):
+                yield from _selections(info, [selection.selection_set])
+            else:
+                yield selection
+
+
+def selected_fields(info, path: List[str]) -> Set[str]:
+    """
+    Names of the fields a query selects on the records found under path
+    (["pageData", "items"]) of the field being resolved, through fragments
+    :param info:
+    :param path:
+    :return:
+    """
+    selection_sets = [field.selection_set for field in info.field_asts]
+    for name in path:
+        selection_sets = [field.selection_set
+                          for field in _selections(info, selection_sets)
+                          if field.name.value == name]
+    return {field.name.value for field in _selections(info, selection_sets)}
+
+
+def projection(name: str, columns: List[str], fields: Set[str]) -> List[str]:
+    """
+    Columns of a collection to encode for the selected fields, relation
+    fields needing their key column
+    :param name:
+    :param columns:
+    :param fields:
+    :return:
+    """
+    keys = {col for field, col in relation_keys.get(name, dict()).items()
+            if field in fields}
+    projected = [col for col in columns
+                 if to_camel_case(col) in fields or col in keys]
+    # to_json drops the records of a frame without columns
+    return projected if len(projected) != 0 else list(columns[:1])
+
+
+class RelationLoader(DataLoader):
+    """
+    Per-request batch loader of related records: the keys of all the
+    records resolved at one level of a query are looked up together, in
+    one lookup() of the target collection, instead of a query per record.
+    Only the selected fields are encoded.
+    """
+
+    def __init__(self, name: str, column: str, fields: Set[str]):
+        super().__init__()
+        self.name = name
+        self.collection = source[name]
+        self.column = column
+        self.fields = fields
+
+    def batch_load_fn(self, keys):
+        with self.collection.read():
+            data = self.collection.lookup(self.column, list(keys))
+            columns = projection(self.name, data.columns, self.fields)
+            data = data[columns + [self.column] if self.column not in columns
+                        else columns]
+        rows = dict()
+        for row in json.loads(data.to_json(orient="records")):
+            rows.setdefault(row[self.column], list()).append(row)
+        return Promise.resolve([rows.get(key, list()) for key in keys])
+
+
+def relation_resolver(target: str, column: str, key: str,
+                      many: bool = False):
+    """
+    Resolver of a relation field: the records of target whose column
+    equals the parent record's key, through the request's RelationLoader
+    :param target:
+    :param column:
+    :param key:
+    :param many: a list of records rather than one
+    :return:
+    """
+    def resolve(parent, info):
+        value = parent.get(key)
+        if value is None:
+            return list() if many else None
+        fields = frozenset(selected_fields(info, list()))
+        # the context is per request, and so are the loaders' caches
+        loaders = info.context.setdefault("loaders", dict()) \
+            if isinstance(info.context, dict) else dict()
+        loader = loaders.get((target, column, fields))
+        if loader is None:
+            loader = loaders[(target, column, fields)] = RelationLoader(
+                target, column, fields)
+        rows = loader.load(value)
+        return rows if many else rows.then(
+            lambda found: found[0] if len(found) != 0 else None)
+    return resolve
+
+
+def get_fil_int(col, param) -> str:
+    """
+    Integer based filter conditions
+    :param col:
+    :param param: resolver argument of the column's filter
+    :return:
+    """
+    return """
+            if %s is not None:
+                filters[%r] = int(%s)
+    """ % (param, col, param)
+
+
+def get_fil_non_int(col, param) -> str:
+    """
+    String based filter conditions
+    :param col:
+    :param param: resolver argument of the column's filter
+    :return:
+    """
+    return """
+            if %s is not None:
+                filters[%r] = str(%s)
+    """ % (param, col, param)
+
+
+def get_fil_float(col, param) -> str:
+    """
+    floats based filter conditions
+    :param col:
+    :param param: resolver argument of the column's filter
+    :return:
+    """
+    return """
+            if %s is not None:
+                filters[%r] = float(%s)
+    """ % (param, col, param)
+
+
+def get_fil_date(col, param) -> str:
+    """
+    date based filter conditions
+    :param col:
+    :param param: resolver argument of the column's filter
+    :return:
+    """
+    return """
+            if %s is not None:
+                filters[%r] = pd.Timestamp(%s)
+    """ % (param, col, param)
+
+
+def get_fil_ops(col, param, conv) -> str:
+    """
+    Range / not equal / pattern filter conditions
+    (<col>_gte, <col>_lte, <col>_ne, <col>_like)
+    :param col:
+    :param param: resolver argument of the column's filter
+    :param conv:
+    :return:
+    """
+    return """
+            if %(param)s_gte is not None:
+                conditions.append((%(col)r, "gte", %(conv)s(%(param)s_gte)))
+            if %(param)s_lte is not None:
+                conditions.append((%(col)r, "lte", %(conv)s(%(param)s_lte)))
+            if %(param)s_ne is not None:
+                conditions.append((%(col)r, "ne", %(conv)s(%(param)s_ne)))
+            if %(param)s_like is not None:
+                conditions.append((%(col)r, "like", str(%(param)s_like)))
+    """ % {"col": col, "param": param, "conv": conv}
+
+
+def graph_conf(document_entries: int = 1024, result_entries: int = 0):
+    """
+    GraphQL configurations
+    :param document_entries:
+    :param result_entries:
+    :return:
+    """
+    return '''
+graphql_app = ExecutorGraphQLApp(graphiql=True, schema=graphene.Schema(query=Query, mutation=Mutations), document_entries=%d, result_entries=%d)
+app.add_route(f"{ProjectSettings.API_VERSION_PATH}/graphql", graphql_app)
+# graphql_app = GraphQLApp(graphiql=True, schema=Schema(query=Query, mutation=Mutations))
+# @app.api_route(f"{ProjectSettings.API_VERSION_PATH}/graphql",
+#                    methods=["GET", "POST"])
+# async def graphql(request: Request):
+#         """
+#         FastAPI-GraphQL with JWT Authentication
+#         """
+#         return await graphql_app.handle_graphql(request=request)
+    ''' % (document_entries, result_entries)
+
+
+def get_op_args(col, param, arg_type) -> List[str]:
+    """
+    Equality / range / not equal / pattern query arguments of a column,
+    named <col>, <col>Gte ... in the schema and passed to the resolvers as
+    param, param_gte ..., so column names never clash with the resolvers'
+    own names
+    :param col:
+    :param param:
+    :param arg_type:
+    :return:
+    """
+    return [f"{param}{op} = graphene.{'String' if op == '_like' else arg_type}"
+            f"(name={to_camel_case(col + op)!r})"
+            for op in ["", "_gte", "_lte", "_ne", "_like"]]
+
+
+def get_query_params(df_data) -> Tuple:
+    """
+    Create Query / Mutation related params
+    :param df_data:
+    :return:
+    """
+    filter_str = ""
+    body_params = ""
+    query_body_params = ""
+    # body_param_var = list()
+    # body_param_val = list()
+    query_filters = list()
+    for i, col in enumerate(df_data.columns):
+        param = f"_c{i}"
+        if is_integer_dtype(df_data[col]):
+            filter_str += get_fil_int(col, param) + \
+                get_fil_ops(col, param, "int")
+            query_filters += get_op_args(col, param, "Int")
+            if col != "id":
+                # body_param_var.append(col)
+                # body_param_val.append("graphene.Int(required=True)")
+                body_params += f"\u0020\u0020\u0020\u0020\u0020\u0020\u0020\u0020{col} = graphene.Int(required=True)\n"
+            query_body_params += f"\u0020\u0020\u0020\u0020\u0020\u0020\u0020\u0020{col} = graphene.Int()\n"
+        elif is_float_dtype(df_data[col]):
+            filter_str += get_fil_float(col, param) + \
+                get_fil_ops(col, param, "float")
+            query_filters += get_op_args(col, param, "Float")
+            # body_param_var.append(col)
+            # body_param_val.append("graphene.Float(required=True)")
+            body_params += f"\u0020\u0020\u0020\u0020\u0020\u0020\u0020\u0020{col} = graphene.Float(required=True)\n"
+            query_body_params += f"\u0020\u0020\u0020\u0020\u0020\u0020\u0020\u0020{col} = graphene.Float()\n"
+        else:
+            if is_datetime64_any_dtype(df_data[col]):
+                filter_str += get_fil_date(col, param) + \
+                    get_fil_ops(col, param, "pd.Timestamp")
+            else:
+                filter_str += get_fil_non_int(col, param) + \
+                    get_fil_ops(col, param, "str")
+            query_filters += get_op_args(col, param, "String")
+            # body_param_var.append(col)
+            # body_param_val.append("graphene.String(required=True)")
+            body_params += f"\u0020\u0020\u0020\u0020\u0020\u0020\u0020\u0020{col} = graphene.String(required=True)\n"
+            query_body_params += f"\u0020\u0020\u0020\u0020\u0020\u0020\u0020\u0020{col} = graphene.String()\n"
+    filter_params = ",".join(
+        [f"{col}" for col in df_data.columns if col != "id"])
+    query_filter_params = ",".join(
+        [f"_c{i}{op} = None" for i in range(len(df_data.columns))
+         for op in ["", "_gte", "_lte", "_ne", "_like"]])
+    # body_params = ",".join(body_param_var) + " = " + ",".join(body_param_val)
+    return filter_str, filter_params, body_params, query_filter_params, ",".join(
+        query_filters + ['_sort=graphene.String(name="_sort")',
+                         '_order=graphene.String(name="_order")',
+                         '_search=graphene.String(name="_search")']), \
+        query_body_params
+
+
+def start_graphql(data_path: str, host: str, port: int, log_level,
+                  index_columns: Optional[str] = "none", compact_mb: int = 64,
+                  search_columns: Optional[str] = "none",
+                  flush_interval_ms: int = 100, fsync: str = "interval",
+                  load_workers: int = 0, lazy_load: bool = False,
+                  sniff_rows: int = 100, lazy_ttl: int = 0,
+                  workers: int = 1, storage: str = "memory",
+                  executor_threads: int = 0, executor_queue: int = 1024,
+                  relations: Optional[str] = None,
+                  query_cache_entries: int = 1024,
+                  result_cache_entries: int = 0, watch: bool = False,
+                  watch_interval: float = 2.0, metrics: bool = False):
+    """
+    Start GraphQL Server
+    :param data_path:
+    :param host:
+    :param port:
+    :param log_level:
+    :param index_columns:
+    :param compact_mb:
+    :param search_columns:
+    :param flush_interval_ms:
+    :param fsync: always, interval or never
+    :param load_workers: processes loading the files (0: one per CPU)
+    :param lazy_load: load each collection on first access
+    :param sniff_rows: records read at start for a lazy collection's schema
+    :param lazy_ttl: seconds after which an idle lazy collection is evicted
+    :param workers: server processes sharing the collections
+    :param storage: memory (pandas) or sqlite
+    :param executor_threads: threads executing queries (0: CPUs + 4, max 32)
+    :param executor_queue: queries waiting for a thread before 503s
+    :param relations: foreign keys besides the <prefix>_id ones
+                      ("articles.writer_id=users", "none")
+    :param query_cache_entries: parsed queries kept (and persisted queries)
+    :param result_cache_entries: query results kept in the LRU cache
+                                 (0 disables)
+    :param watch: reload the collections whose JSON file changes on disk
+    :param watch_interval: seconds between two looks at the data files
+    :param metrics: serve Prometheus metrics at /metrics
+    :return:
+    """
+    work.threads = executor_threads
+    work.max_queued = executor_queue
+    if fsync not in FSYNC_POLICIES:
+        raise ValueError(f"Unknown fsync policy {fsync}, "
+                         f"one of {', '.join(FSYNC_POLICIES)}")
+    flusher = None
+    if fsync != "always":
+        flusher = Flusher(flush_interval_ms, fsync == "interval")
+        app.add_event_handler("startup", flusher.start)
+
+    evictor = None
+    # workers share the journals, which eviction would compact
+    if lazy_load and lazy_ttl > 0 and workers <= 1:
+        evictor = Evictor(source, lazy_ttl)
+        app.add_event_handler("startup", evictor.start)
+
+    watcher = None
+
+    def shutdown():
+        if watcher is not None:
+            watcher.stop()
+        if evictor is not None:
+            evictor.stop()
+        work.shutdown()
+        if flusher is not None:
+            flusher.stop()
+        # Fold journals back into the JSON files
+        for collection in source.values():
+            collection.close()
+
+    app.add_event_handler("shutdown", shutdown)
+    if metrics:
+        enable_metrics(source, [work])
+        app.add_middleware(MetricsMiddleware, router=app.router,
+                           prefix=ProjectSettings.API_VERSION_PATH)
+        app.add_route(f"{ProjectSettings.API_VERSION_PATH}/metrics",
+                      metrics_endpoint, include_in_schema=False)
+    # Load JSON data
+    data_files = glob(f"{data_path}/*.json")
+    in_memory = storage != "sqlite"
+    frames = load_files(data_files, load_workers) \
+        if in_memory and not lazy_load else dict()
+
+    def open_collection(file_name: str, file_path: str):
+        file_paths[file_name] = file_path
+        if not in_memory:
+            return SqliteCollection(file_name, file_path, fsync,
+                                    shared=workers > 1)
+        # lazy collections get routes from a sniff of their first records
+        schema = sniff_data(file_path, sniff_rows) if lazy_load else None
+        data = frames.pop(file_path, None)
+        if data is None and not lazy_load:
+            data = read_data(file_path)
+        return Collection(file_name, file_path, data,
+                          Journal(journal_path(file_path)),
+                          compact_mb * 1024 * 1024, flusher,
+                          loader=partial(read_data, file_path),
+                          schema=schema, shared=workers > 1)
+
+    def prepare(key: str):
+        value = source[key]
+        value.build_indexes(select_columns(value.schema.columns,
+                                           index_columns))
+        value.build_search_index(select_columns(value.schema.columns,
+                                                search_columns))
+
+    # collection -> its relation fields, and its Mutations fields, Query
+    # fields and Query resolvers
+    relation_params = dict()
+    parts = dict()
+
+    def build_relations() -> List[str]:
+        schemas = {key: value.schema for key, value in source.items()}
+        fields = relation_fields(foreign_keys(schemas, relations), schemas)
+        changed = [key for key in fields
+                   if fields[key] != relation_params.get(key)]
+        relation_params.clear()
+        relation_params.update(fields)
+        return changed
+
+    def build_types(key: str):
+        filter_str, filter_params, body_params, query_filter_params, query_filters_str, query_body_params = get_query_params(
+            source[key].schema)
+        # create mutations schemas
+        exec(mutation_schema(key, query_body_params), globals())
+        # exec(create_routes(str(key), filter_params, body_params),
+        #      globals())
+
+        # create Mutation routes
+        exec(create_routes(str(key)), globals())
+
+        # create Query Schemas
+        exec(query_schema(key, query_body_params + relation_params[key]),
+             globals())
+
+        # create Query schemas
+        exec(query_super_schema(key), globals())
+        parts[key] = (mutation_routes(key).strip(),
+                      query_params(key, query_filters_str),
+                      query_method(key, query_filter_params, filter_str))
+
+    def build_schema():
+        mut_strs = ["\u0020\u0020\u0020\u0020"] + \
+            [mutation for mutation, _, _ in parts.values()]
+        query_params_str = "".join(params for _, params, _ in parts.values())
+        query_filter_str = "".join(method for _, _, method in parts.values())
+        # create Mutations
+        exec(create_mutations("\n\u0020\u0020\u0020\u0020".join(mut_strs)),
+             globals())
+        # create Query
+        exec(create_query(f"\t{query_params_str}", f"\t{query_filter_str}"),
+             globals())
+
+    def on_change(key: str, file_path: Optional[str]):
+        collection = source.get(key)
+        if file_path is None:
+            if collection is None:
+                return
+            del source[key], file_paths[key], parts[key]
+            collection.discard()
+            print(f"Removed {key}")
+        elif collection is None:
+            source[key] = open_collection(key, file_path)
+            prepare(key)
+            print(f"Added {key}")
+        elif collection.reload():
+            # other columns: new types
+            prepare(key)
+            print(f"Reloaded {key}")
+        else:
+            print(f"Reloaded {key}")
+            return
+        # the types of the collections it refers to or is referred by too
+        changed = build_relations()
+        for name in source:
+            if name == key or name in changed:
+                build_types(name)
+        build_schema()
+        graphql_app.swap(graphene.Schema(query=Query, mutation=Mutations))
+
+    for file_path in data_files:
+        file_name = str(Path(file_path).name).split(".")[0]
+        source[file_name] = open_collection(file_name, file_path)
+    build_relations()
+    for key in source:
+        prepare(key)
+        build_types(key)
+    build_schema()
+    # create GraphQL Configuration
+    exec(graph_conf(query_cache_entries, result_cache_entries), globals())
+    if watch and workers <= 1:
+        watcher = Watcher(data_path, source, on_change, watch_interval)
+        app.add_event_handler("startup", watcher.start)
+    elif watch:
+        print("--watch needs a single worker, not watching")
+
+    # Run Server
+    serve(app, host, port, log_level, workers, source)
@@ -0,0 +1,237 @@
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+from bisect import bisect_left, bisect_right
+from itertools import chain
+import pandas as pd
+import re
+
+TOKEN_PATTERN = r"\w+"
+TOKEN = re.compile(TOKEN_PATTERN)
+
+
+def tokenize(text) -> List[str]:
+    """
+    Lower-cased word tokens of a value
+    :param text:
+    :return:
+    """
+    if text is None or text != text:
+        return list()
+    return TOKEN.findall(str(text).lower())
+
+
+class SortedIndex:
+    """
+    Column values in sorted order with their row labels (ties ordered by
+    label), for range filters and sorted pages without a per-request sort.
+    Rows with a null value are kept apart and come last in either order.
+    """
+
+    def __init__(self, series: pd.Series):
+        present = series.dropna()
+        ordered = present.sort_values(kind="mergesort")
+        self.values: List[Any] = ordered.tolist()
+        self.labels: List[int] = ordered.index.tolist()
+        self.nulls: Set[int] = set(series.index[series.isna()].tolist())
+
+    def _position(self, value, label: int) -> int:
+        lo = bisect_left(self.values, value)
+        hi = bisect_right(self.values, value, lo)
+        return bisect_left(self.labels, label, lo, hi)
+
+    def add(self, label: int, value):
+        """
+        Insert a row
+        :param label:
+        :param value:
+        :return:
+        """
+        if pd.isna(value):
+            self.nulls.add(label)
+            return
+        position = self._position(value, label)
+        self.values.insert(position, value)
+        self.labels.insert(position, label)
+
+    def remove(self, label: int, value):
+        """
+        Remove a row
+        :param label:
+        :param value:
+        :return:
+        """
+        if pd.isna(value):
+            self.nulls.discard(label)
+            return
+        position = self._position(value, label)
+        if position < len(self.labels) and self.labels[position] == label:
+            del self.values[position]
+            del self.labels[position]
+
+    def range(self, gte=None, lte=None) -> Set[int]:
+        """
+        Labels of rows with gte <= value <= lte
+        :param gte:
+        :param lte:
+        :return:
+        """
+        lo = 0 if gte is None else bisect_left(self.values, gte)
+        hi = len(self.values) if lte is None else bisect_right(self.values,
+                                                               lte)
+        return set(self.labels[lo:hi])
+
+    def ordered(self, descending: bool = False,
+                labels: Optional[Set[int]] = None,
+                after: Optional[Tuple[Any, int]] = None) -> Iterator[int]:
+        """
+        Labels in value order, optionally restricted to a set of labels and
+        starting just past an (value, label) key. Descending order keeps
+        ties in label order, like a stable sort.
+        :param descending:
+        :param labels:
+        :param after:
+        :return:
+        """
+        if after is None:
+            ordered = iter(self.labels) if not descending \
+                else self._descending(len(self.values))
+            nulls = sorted(self.nulls)
+        elif after[0] is None:
+            # past the last non-null value already
+            ordered = iter(())
+            nulls = sorted(label for label in self.nulls if label > after[1])
+        else:
+            value, label = after
+            lo = bisect_left(self.values, value)
+            hi = bisect_right(self.values, value, lo)
+            start = bisect_right(self.labels, label, lo, hi)
+            if not descending:
+                ordered = self._ascending(start)
+            else:
+                ordered = chain(self._ascending(start, hi),
+                                self._descending(lo))
+            nulls = sorted(self.nulls)
+        for label in ordered:
+            if labels is None or label in labels:
+                yield label
+        for label in nulls:
+            if labels is None or label in labels:
+                yield label
+
+    def _ascending(self, start: int,
+                   stop: Optional[int] = None) -> Iterator[int]:
+        stop = len(self.labels) if stop is None else stop
+        for position in range(start, stop):
+            yield self.labels[position]
+
+    def _descending(self, hi: int) -> Iterator[int]:
+        while hi > 0:
+            lo = bisect_left(self.values, self.values[hi - 1], 0, hi)
+            yield from self.labels[lo:hi]
+            hi = lo
+
+
+class TextIndex:
+    """
+    Token -> row labels inverted index over string columns. A search
+    matches rows containing every query term; the last term also matches
+    as a prefix, so search-as-you-type queries hit the index too.
+    """
+
+    def __init__(self, data: pd.DataFrame, columns: List[str]):
+        self.columns = list(columns)
+        self.postings: Dict[str, Set[int]] = dict()
+        for col in self.columns:
+            tokens = data[col].dropna().astype(str).str.lower() \
+                .str.findall(TOKEN_PATTERN).explode().dropna()
+            labels = tokens.index.to_numpy()
+            groups = tokens.groupby(tokens.to_numpy(), sort=False).indices
+            for token, positions in groups.items():
+                self.postings.setdefault(token, set()).update(
+                    labels[positions].tolist())
+        self.vocabulary: List[str] = sorted(self.postings)
+
+    def _tokens(self, values: List) -> Set[str]:
+        tokens = set()
+        for value in values:
+            tokens.update(tokenize(value))
+        return tokens
+
+    def _add_tokens(self, label: int, tokens: Set[str]):
+        for token in tokens:
+            labels = self.postings.get(token)
+            if labels is None:
+                self.postings[token] = {label}
+                self.vocabulary.insert(bisect_left(self.vocabulary, token),
+                                       token)
+            else:
+                labels.add(label)
+
+    def _remove_tokens(self, label: int, tokens: Set[str]):
+        for token in tokens:
+            labels = self.postings.get(token)
+            if labels is None:
+                continue
+            labels.discard(label)
+            if len(labels) == 0:
+                del self.postings[token]
+                del self.vocabulary[bisect_left(self.vocabulary, token)]
+
+    def add(self, label: int, values: List):
+        """
+        Index a row from the values of its text columns
+        :param label:
+        :param values:
+        :return:
+        """
+        self._add_tokens(label, self._tokens(values))
+
+    def remove(self, label: int, values: List):
+        """
+        Unindex a row from the values of its text columns
+        :param label:
+        :param values:
+        :return:
+        """
+        self._remove_tokens(label, self._tokens(values))
+
+    def replace(self, label: int, old: List, new: List):
+        """
+        Reindex an updated row, touching only the tokens that changed
+        :param label:
+        :param old:
+        :param new:
+        :return:
+        """
+        old_tokens = self._tokens(old)
+        new_tokens = self._tokens(new)
+        self._remove_tokens(label, old_tokens - new_tokens)
+        self._add_tokens(label, new_tokens - old_tokens)
+
+    def _prefixed(self, prefix: str) -> Set[int]:
+        lo = bisect_left(self.vocabulary, prefix)
+        hi = bisect_left(self.vocabulary, prefix + "\U0010ffff", lo)
+        if hi - lo == 1:
+            return self.postings[self.vocabulary[lo]]
+        labels = set()
+        for token in self.vocabulary[lo:hi]:
+            labels.update(self.postings[token])
+        return labels
+
+    def search(self, query: str) -> Optional[Set[int]]:
+        """
+        Labels of rows containing all query terms (None for an empty query)
+        :param query:
+        :return:
+        """
+        terms = tokenize(query)
+        if len(terms) == 0:
+            return None
+        postings = [self.postings.get(term, set()) for term in terms[:-1]]
+        postings.append(self._prefixed(terms[-1]))
+        postings.sort(key=len)
+        labels = set(postings[0])
+        for other in postings[1:]:
+            if len(labels) == 0:
+                break
+            labels &= other
+        return labels
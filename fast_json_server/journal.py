@@ -0,0 +1,278 @@
+from typing import Dict, Iterator, List
+from pathlib import Path
+from threading import Lock, Event, Thread
+from contextlib import contextmanager
+import json
+import os
+
+try:
+    import fcntl
+except ImportError:
+    # no cross-process locking (single worker only)
+    fcntl = None
+
+JOURNAL_DIR = ".fast_json_server"
+
+FSYNC_POLICIES = ("always", "interval", "never")
+
+
+def journal_path(file_path: str) -> str:
+    """
+    Journal file of a JSON data file
+    :param file_path:
+    :return:
+    """
+    path = Path(file_path)
+    file_name = str(path.name).split(".")[0]
+    return str(path.parent / JOURNAL_DIR / f"{file_name}.journal")
+
+
+def replace_file(tmp_path: str, path: str):
+    """
+    Move a fully written temporary file over path, fsyncing it before the
+    rename and the directory after it, so a crash leaves either the old or
+    the new file and never a truncated one
+    :param tmp_path:
+    :param path:
+    :return:
+    """
+    with open(tmp_path, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    try:
+        directory = os.open(os.path.dirname(os.path.abspath(path)),
+                            os.O_RDONLY)
+    except OSError:
+        # directories cannot be opened on every platform
+        return
+    try:
+        os.fsync(directory)
+    except OSError:
+        pass
+    finally:
+        os.close(directory)
+
+
+class Journal:
+    """
+    Append-only log of collection mutations, one JSON object per line.
+    Mutations are buffered in memory and written with a single write per
+    commit. Compaction rotates the active log to <path>.old, writes the
+    snapshot and then removes the rotated log, so both files are replayed
+    on start.
+
+    Worker processes can share the active log: each one writes under
+    locked() and tails what the others appended, position being how much
+    of the log it has applied.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.old_path = f"{path}.old"
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.lock = Lock()
+        self.buffer: List[str] = list()
+        self.file = open(self.path, "a", encoding="utf-8")
+        self.size = self.file.tell()
+        self.position = 0
+        self.unsynced = False
+        self._lock_file = None
+        self._lock_owner = None
+
+    def replay(self) -> Iterator[Dict]:
+        """
+        Logged mutations, oldest first
+        :return:
+        """
+        if os.path.exists(self.old_path):
+            with open(self.old_path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip() == "":
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        # torn last line of a crashed write
+                        break
+        self.position = 0
+        yield from self.tail()
+
+    def tail(self) -> Iterator[Dict]:
+        """
+        Mutations of the active log past position, advancing it. A line
+        still being written by another process is left for the next call.
+        :return:
+        """
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            f.seek(self.position)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                self.position += len(line)
+                if line.strip() == b"":
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # torn line of a crashed write
+                    continue
+        self.size = max(self.size, self.position)
+
+    @contextmanager
+    def locked(self):
+        """
+        Exclusive lock on the log across processes
+        :return:
+        """
+        if self._lock_owner != os.getpid():
+            # flock belongs to the open file, so each process opens its own
+            self._lock_file = open(f"{self.path}.lock", "a")
+            self._lock_owner = os.getpid()
+        fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+
+    def publish(self, fsync: bool):
+        """
+        Commit buffered mutations and mark the log as applied up to its end
+        (under locked(), after tail()), so other processes see them
+        :param fsync:
+        :return:
+        """
+        with self.lock:
+            self._flush(fsync)
+            self.position = self.size = os.path.getsize(self.path)
+
+    def write(self, op: Dict):
+        """
+        Buffer a mutation, made durable by commit()
+        :param op:
+        :return:
+        """
+        line = json.dumps(op, separators=(",", ":")) + "\n"
+        with self.lock:
+            self.buffer.append(line)
+            self.size += len(line)
+
+    def _flush(self, fsync: bool):
+        if len(self.buffer) != 0:
+            self.file.write("".join(self.buffer))
+            self.buffer = list()
+            self.file.flush()
+            self.unsynced = True
+        if fsync and self.unsynced:
+            os.fsync(self.file.fileno())
+            self.unsynced = False
+
+    def commit(self, fsync: bool = True):
+        """
+        Write buffered mutations in one write, optionally fsynced
+        :param fsync:
+        :return:
+        """
+        with self.lock:
+            self._flush(fsync)
+
+    def rotate(self):
+        """
+        Start a fresh log, keeping the current one until the snapshot that
+        covers it is written
+        :return:
+        """
+        with self.lock:
+            self._flush(True)
+            self.file.close()
+            if os.path.exists(self.old_path):
+                # a previous compaction failed, keep its entries first
+                with open(self.old_path, "a", encoding="utf-8") as old, \
+                        open(self.path, encoding="utf-8") as current:
+                    old.write(current.read())
+                os.remove(self.path)
+            else:
+                os.replace(self.path, self.old_path)
+            self.file = open(self.path, "a", encoding="utf-8")
+            self.size = self.position = 0
+
+    def discard_rotated(self):
+        """
+        Remove the rotated log once it is covered by a snapshot
+        :return:
+        """
+        if os.path.exists(self.old_path):
+            os.remove(self.old_path)
+
+    def close(self):
+        """
+        Flush and close the log
+        :return:
+        """
+        with self.lock:
+            self._flush(True)
+            self.file.close()
+
+
+class Flusher:
+    """
+    Background group commit: collections mark themselves dirty on save and
+    are flushed together once per interval, so N mutations within a window
+    cost one journal write per collection
+    """
+
+    def __init__(self, interval_ms: int = 100, fsync: bool = True):
+        self.interval = interval_ms / 1000.0
+        self.fsync = fsync
+        self.lock = Lock()
+        self.dirty = dict()
+        self.stopped = Event()
+        self.thread = None
+
+    def mark(self, collection):
+        """
+        Schedule a collection for the next flush
+        :param collection:
+        :return:
+        """
+        with self.lock:
+            self.dirty[collection.name] = collection
+
+    def flush(self):
+        """
+        Flush all dirty collections now
+        :return:
+        """
+        with self.lock:
+            dirty, self.dirty = self.dirty, dict()
+        for collection in dirty.values():
+            try:
+                collection.flush(self.fsync)
+            except Exception as e:
+                print(e)
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.flush()
+
+    def start(self):
+        """
+        Start the flusher thread
+        :return:
+        """
+        self.stopped.clear()
+        self.thread = Thread(target=self._run, name="journal-flusher",
+                             daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stop the flusher thread and flush what is left
+        :return:
+        """
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.flush()
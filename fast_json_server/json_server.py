@@ -1,63 +1,168 @@
-import click
-from .rest_api import start_api
-from .graph_ql import start_graphql
-
-
-@click.command()
-@click.option('--data_path', '-dp',
-              help='Data Source Path', default="")
-@click.option('--host', '-h',
-              help='Host', default='0.0.0.0"')
-@click.option('--port', '-p',
-              help='Port', default=3000)
-@click.option('--log_level', '-l',
-              help='Log Level', default="debug")
-@click.option('--server_type', '-st',
-              help='Server Type', default="rest_api")
-def __start_cli_server(data_path: str, host: str,
-                       port: int,
-                       log_level: str, server_type: str):
-    if data_path != "":
-        if server_type == "rest_api":
-            print("REST API Server Started....")
-            start_api(data_path=data_path, host=host, port=port,
-                      log_level=log_level)
-        elif server_type == "graph_ql":
-            print("GraphQL Server Started....")
-            start_graphql(data_path=data_path, host=host, port=port,
-                          log_level=log_level)
-        else:
-            print("rest_api or graph_ql are allowed")
-    else:
-        print("Please provide json data")
-
-
-def start_server(data_path: str = "", host: str = "0.0.0.0",
-                 port: int = 3000,
-                 log_level: str = "debug", server_type: str = "rest_api"):
-    """
-    Start Fast JSON Server
-    :param data_path:
-    :param host:
-    :param port:
-    :param log_level:
-    :param server_type:
-    :return:
-    """
-    if data_path != "":
-        if server_type == "rest_api":
-            print("REST API Server Started....")
-            start_api(data_path=data_path, host=host, port=port,
-                      log_level=log_level)
-        elif server_type == "graph_ql":
-            print("GraphQL Server Started....")
-            start_graphql(data_path=data_path, host=host, port=port,
-                          log_level=log_level)
-        else:
-            print("rest_api or graph_ql are allowed")
-    else:
-        print("Please provide json data")
-
-
-if __name__ == "__main__":
-    __start_cli_server()
+import click
+from .rest_api import start_api
+from .graph_ql import start_graphql
+from .journal import FSYNC_POLICIES
+
+
+@click.command()
+@click.option('--data_path', '-dp',
+              help='Data Source Path', default="")
+@click.option('--host', '-h',
+              help='Host', default='0.0.0.0"')
+@click.option('--port', '-p',
+              help='Port', default=3000)
+@click.option('--log_level', '-l',
+              help='Log Level', default="debug")
+@click.option('--server_type', '-st',
+              help='Server Type', default="rest_api")
+@click.option('--index_columns', '-ic',
+              help='Columns to index for filters (all, none or a,b)',
+              default="none")
+@click.option('--search_columns', '-sc',
+              help='String columns indexed for _q / _search (all, none or '
+                   'a,b)',
+              default="none")
+@click.option('--compact_mb', '-cm',
+              help='Journal size (MB) that triggers compaction', default=64)
+@click.option('--flush_interval_ms', '-fi',
+              help='Group commit window for journal writes', default=100)
+@click.option('--fsync', '-fs', type=click.Choice(FSYNC_POLICIES),
+              help='Journal fsync policy (always, interval or never)',
+              default="interval")
+@click.option('--cache_entries', '-ce',
+              help='GET responses kept in the REST response cache (0 disables)',
+              default=1024)
+@click.option('--load_workers', '-lw',
+              help='Processes loading the json files at start (0: one per CPU)',
+              default=0)
+@click.option('--lazy_load', '-ll', is_flag=True,
+              help='Load each collection on first access')
+@click.option('--sniff_rows', '-sr',
+              help='Records read at start for a lazy collection\'s schema',
+              default=100)
+@click.option('--lazy_ttl', '-lt',
+              help='Seconds before an idle lazy collection is evicted '
+                   '(0: never)',
+              default=0)
+@click.option('--workers', '-w',
+              help='Server processes sharing the data (needs os.fork)',
+              default=1)
+@click.option('--storage', '-sg',
+              help='Storage engine (memory or sqlite)', default="memory")
+@click.option('--executor_threads', '-et',
+              help='Threads serving requests (0: CPUs + 4, max 32)',
+              default=0)
+@click.option('--executor_queue', '-eq',
+              help='Requests waiting for a thread before 503 responses',
+              default=1024)
+@click.option('--relations', '-rl',
+              help='GraphQL foreign keys besides the <prefix>_id ones '
+                   '(articles.writer_id=users,... or none)',
+              default="")
+@click.option('--query_cache_entries', '-qc',
+              help='Parsed GraphQL queries kept, also serving persisted '
+                   'queries', default=1024)
+@click.option('--result_cache_entries', '-rc',
+              help='GraphQL query results kept in the result cache '
+                   '(0 disables)', default=0)
+@click.option('--watch', '-wa', is_flag=True,
+              help='Reload the collections whose json file changes on disk')
+@click.option('--watch_interval', '-wi',
+              help='Seconds between two looks at the json files', default=2.0)
+@click.option('--metrics', '-mt', is_flag=True,
+              help='Serve Prometheus metrics at /api/v1/metrics')
+def __start_cli_server(data_path: str, host: str,
+                       port: int,
+                       log_level: str, server_type: str,
+                       index_columns: str, search_columns: str,
+                       compact_mb: int, flush_interval_ms: int, fsync: str,
+                       cache_entries: int, load_workers: int,
+                       lazy_load: bool, sniff_rows: int, lazy_ttl: int,
+                       workers: int, storage: str, executor_threads: int,
+                       executor_queue: int, relations: str,
+                       query_cache_entries: int, result_cache_entries: int,
+                       watch: bool, watch_interval: float, metrics: bool):
+    start_server(data_path=data_path, host=host, port=port,
+                 log_level=log_level, server_type=server_type,
+                 index_columns=index_columns, search_columns=search_columns,
+                 compact_mb=compact_mb, flush_interval_ms=flush_interval_ms,
+                 fsync=fsync, cache_entries=cache_entries,
+                 load_workers=load_workers, lazy_load=lazy_load,
+                 sniff_rows=sniff_rows, lazy_ttl=lazy_ttl, workers=workers,
+                 storage=storage, executor_threads=executor_threads,
+                 executor_queue=executor_queue, relations=relations,
+                 query_cache_entries=query_cache_entries,
+                 result_cache_entries=result_cache_entries, watch=watch,
+                 watch_interval=watch_interval, metrics=metrics)
+
+
+def start_server(data_path: str = "", host: str = "0.0.0.0",
+                 port: int = 3000,
+                 log_level: str = "debug", server_type: str = "rest_api",
+                 index_columns: str = "none", search_columns: str = "none",
+                 compact_mb: int = 64, flush_interval_ms: int = 100,
+                 fsync: str = "interval", cache_entries: int = 1024,
+                 load_workers: int = 0, lazy_load: bool = False,
+                 sniff_rows: int = 100, lazy_ttl: int = 0,
+                 workers: int = 1, storage: str = "memory",
+                 executor_threads: int = 0, executor_queue: int = 1024,
+                 relations: str = "", query_cache_entries: int = 1024,
+                 result_cache_entries: int = 0, watch: bool = False,
+                 watch_interval: float = 2.0, metrics: bool = False):
+    """
+    Start Fast JSON Server
+    :param data_path:
+    :param host:
+    :param port:
+    :param log_level:
+    :param server_type:
+    :param index_columns:
+    :param search_columns:
+    :param compact_mb:
+    :param flush_interval_ms:
+    :param fsync:
+    :param cache_entries:
+    :param load_workers:
+    :param lazy_load:
+    :param sniff_rows:
+    :param lazy_ttl:
+    :param workers:
+    :param storage:
+    :param executor_threads:
+    :param executor_queue:
+    :param relations:
+    :param query_cache_entries:
+    :param result_cache_entries:
+    :param watch:
+    :param watch_interval:
+    :param metrics:
+    :return:
+    """
+    options = dict(data_path=data_path, host=host, port=port,
+                   log_level=log_level, index_columns=index_columns,
+                   search_columns=search_columns, compact_mb=compact_mb,
+                   flush_interval_ms=flush_interval_ms, fsync=fsync,
+                   load_workers=load_workers, lazy_load=lazy_load,
+                   sniff_rows=sniff_rows, lazy_ttl=lazy_ttl, workers=workers,
+                   storage=storage, executor_threads=executor_threads,
+                   executor_queue=executor_queue, watch=watch,
+                   watch_interval=watch_interval, metrics=metrics)
+    if storage not in ("memory", "sqlite"):
+        print("memory or sqlite storage are allowed")
+    elif data_path != "":
+        if server_type == "rest_api":
+            print("REST API Server Started....")
+            start_api(**options, cache_entries=cache_entries)
+        elif server_type == "graph_ql":
+            print("GraphQL Server Started....")
+            start_graphql(**options, relations=relations,
+                          query_cache_entries=query_cache_entries,
+                          result_cache_entries=result_cache_entries)
+        else:
+            print("rest_api or graph_ql are allowed")
+    else:
+        print("Please provide json data")
+
+
+if __name__ == "__main__":
+    __start_cli_server()
@@ -0,0 +1,407 @@
+from typing import Dict, List, Optional, Tuple, Iterable, Callable
+from threading import Lock, local
+from functools import wraps
+from time import perf_counter
+from fastapi.responses import Response
+from starlette.concurrency import run_in_threadpool
+from starlette.routing import Match
+from promise import Promise, is_thenable
+import os
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+           2.5, 5.0, 10.0)
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    pairs = ['%s="%s"' % (name, str(value).replace("\\", "\\\\")
+                          .replace('"', '\\"').replace("\n", "\\n"))
+             for name, value in zip(names, values)]
+    if extra != "":
+        pairs.append(extra)
+    return "{%s}" % ",".join(pairs) if len(pairs) != 0 else ""
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Histogram:
+    """
+    Prometheus histogram: cumulative bucket counts, sum and count per
+    label values
+    """
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...],
+                 buckets: Tuple[float, ...] = BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.lock = Lock()
+        # label values -> bucket counts, sum and count
+        self.series: Dict[Tuple, List] = dict()
+
+    def observe(self, values: Tuple, value: float):
+        """
+        Record a value
+        :param values: label values
+        :param value:
+        :return:
+        """
+        with self.lock:
+            series = self.series.get(values)
+            if series is None:
+                series = self.series[values] = [[0] * len(self.buckets),
+                                                0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}",
+                 f"# TYPE {self.name} histogram"]
+        with self.lock:
+            series = [(values, list(counts), total, count)
+                      for values, (counts, total, count)
+                      in sorted(self.series.items())]
+        for values, counts, total, count in series:
+            cumulative = 0
+            for bound, bucket in zip(self.buckets, counts):
+                cumulative += bucket
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket"
+                             f"{_labels(self.labels, values, le)} "
+                             f"{cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket"
+                         f"{_labels(self.labels, values, le)} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, values)} "
+                         f"{_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labels, values)} "
+                         f"{count}")
+        return lines
+
+
+class Counter:
+    """
+    Prometheus counter per label values
+    """
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...]):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.lock = Lock()
+        self.series: Dict[Tuple, float] = dict()
+
+    def inc(self, values: Tuple, amount: float = 1):
+        """
+        Add to the counter
+        :param values: label values
+        :param amount:
+        :return:
+        """
+        with self.lock:
+            self.series[values] = self.series.get(values, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}",
+                 f"# TYPE {self.name} counter"]
+        with self.lock:
+            series = sorted(self.series.items())
+        for values, value in series:
+            lines.append(f"{self.name}{_labels(self.labels, values)} "
+                         f"{_number(value)}")
+        return lines
+
+
+class Gauge:
+    """
+    Prometheus gauge whose samples are collected when scraped
+    """
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...],
+                 collect: Callable[[], Iterable[Tuple[Tuple, float]]],
+                 kind: str = "gauge"):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.collect = collect
+        self.kind = kind
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}",
+                 f"# TYPE {self.name} {self.kind}"]
+        for values, value in self.collect():
+            lines.append(f"{self.name}{_labels(self.labels, values)} "
+                         f"{_number(value)}")
+        return lines
+
+
+class Registry:
+    """
+    Metrics of the server, off until enable_metrics(): until then the
+    timing hooks of the hot paths cost a flag test
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.collections: Dict = dict()
+        self.executors: List = list()
+        self.metrics: List = list()
+
+    def render(self) -> str:
+        """
+        Text exposition of every metric
+        :return:
+        """
+        lines = list()
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+_scan = local()
+
+
+def _collection_samples(measure: Callable) -> List[Tuple[Tuple, float]]:
+    samples = list()
+    for name, collection in list(registry.collections.items()):
+        try:
+            value = measure(collection)
+        except Exception as e:
+            print(e)
+            continue
+        if value is not None:
+            samples.append(((name,), value))
+    return samples
+
+
+def _process_memory() -> List[Tuple[Tuple, float]]:
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return list()
+    return [((), pages * os.sysconf("SC_PAGE_SIZE"))]
+
+
+request_seconds = Histogram(
+    "fast_json_server_request_seconds",
+    "Request latency by route template and status",
+    ("method", "route", "status"))
+collection_request_seconds = Histogram(
+    "fast_json_server_collection_request_seconds",
+    "Latency of the REST requests of each collection",
+    ("collection", "method"))
+stage_seconds = Histogram(
+    "fast_json_server_stage_seconds",
+    "Time spent filtering (select / lookup), serializing (encode, GraphQL "
+    "responses) and "
+    "persisting (journal commits, file writes, SQLite writes)",
+    ("collection", "stage"))
+resolver_seconds = Histogram(
+    "fast_json_server_graphql_resolver_seconds",
+    "GraphQL resolver time of the query, mutation and relation fields",
+    ("field",))
+rows_scanned = Counter(
+    "fast_json_server_rows_scanned_total",
+    "Rows tested by the filters of the selects (in memory)",
+    ("collection",))
+rows_returned = Counter(
+    "fast_json_server_rows_returned_total",
+    "Rows returned by the selects", ("collection",))
+registry.metrics.extend([
+    request_seconds, collection_request_seconds, stage_seconds,
+    resolver_seconds, rows_scanned, rows_returned,
+    Gauge("fast_json_server_collection_bytes",
+          "Memory of the records (DataFrame, deep) or size of the SQLite "
+          "database", ("collection",),
+          lambda: _collection_samples(
+              lambda collection: collection.memory_usage())),
+    Gauge("fast_json_server_collection_rows",
+          "Records of the loaded collections", ("collection",),
+          lambda: _collection_samples(
+              lambda collection: collection.count()
+              if collection.loaded() else None)),
+    Gauge("fast_json_server_executor_queued",
+          "Tasks waiting for an executor thread", ("executor",),
+          lambda: [((executor.name,), executor.queued())
+                   for executor in registry.executors]),
+    Gauge("fast_json_server_executor_rejected_total",
+          "Requests refused with 503 by a full executor", ("executor",),
+          lambda: [((executor.name,), executor.rejected)
+                   for executor in registry.executors], kind="counter"),
+    Gauge("process_resident_memory_bytes", "Resident memory of the process",
+          (), _process_memory)])
+
+
+def enable_metrics(collections: Dict, executors: List):
+    """
+    Turn the metrics on
+    :param collections: name -> collection, measured when scraped
+    :param executors:
+    :return:
+    """
+    registry.collections = collections
+    registry.executors = list(executors)
+    registry.enabled = True
+
+
+def timed(stage: str, rows: bool = False):
+    """
+    Time a collection method as a stage of the requests (filter, serialize
+    or persist). With rows, the method returns a DataFrame whose rows are
+    counted as returned, and the rows its filters tested (scanned()) as
+    scanned; rows taken straight from the indexes count as both.
+    :param stage:
+    :param rows:
+    :return:
+    """
+    def decorate(method):
+        @wraps(method)
+        def timer(self, *args, **kwargs):
+            if not registry.enabled:
+                return method(self, *args, **kwargs)
+            _scan.rows = 0
+            started = perf_counter()
+            try:
+                result = method(self, *args, **kwargs)
+            finally:
+                stage_seconds.observe((self.name, stage),
+                                      perf_counter() - started)
+            if rows:
+                returned = len(result.index)
+                rows_returned.inc((self.name,), returned)
+                rows_scanned.inc((self.name,), _scan.rows or returned)
+            return result
+        return timer
+    return decorate
+
+
+def scanned(count: int):
+    """
+    Count rows tested by a filter of the running select
+    :param count:
+    :return:
+    """
+    if registry.enabled:
+        _scan.rows = getattr(_scan, "rows", 0) + count
+
+
+def timed_response(collections: Iterable[str],
+                   build: Callable[[], Response]) -> Response:
+    """
+    Build a response (its JSON serialization), timed as the serialize
+    stage of the collections a GraphQL document reads. A document reading
+    several collections is one series labelled with all of their names.
+    :param collections:
+    :param build:
+    :return:
+    """
+    if not registry.enabled:
+        return build()
+    started = perf_counter()
+    try:
+        return build()
+    finally:
+        stage_seconds.observe((",".join(sorted(collections)) or "graphql",
+                               "serialize"), perf_counter() - started)
+
+
+def resolver_middleware() -> Optional[List]:
+    """
+    graphql-core middleware timing the resolvers, None when metrics are off
+    :return:
+    """
+    return [time_resolver] if registry.enabled else None
+
+
+def time_resolver(next, root, info, **args):
+    """
+    Time the resolvers of object fields (queries, mutations, relations and
+    their pages), until their promise resolves for batched loaders. Scalar
+    fields are left alone, there are one per value.
+    :param next:
+    :param root:
+    :param info:
+    :param args:
+    :return:
+    """
+    return_type = info.return_type
+    while hasattr(return_type, "of_type"):
+        return_type = return_type.of_type
+    if not hasattr(return_type, "fields"):
+        return next(root, info, **args)
+    field = (f"{info.parent_type.name}.{info.field_name}",)
+    started = perf_counter()
+    result = next(root, info, **args)
+    if is_thenable(result):
+        def done(value):
+            resolver_seconds.observe(field, perf_counter() - started)
+            return value
+        return Promise.resolve(result).then(done)
+    resolver_seconds.observe(field, perf_counter() - started)
+    return result
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing every request by method, route template (not
+    the path, to bound the series) and status, and the REST routes by
+    collection too
+    """
+
+    def __init__(self, app, router, prefix: str):
+        self.app = app
+        self.router = router
+        self.prefix = prefix
+
+    def _route(self, scope) -> str:
+        for route in self.router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+        return "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = [500]
+
+        async def send_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        started = perf_counter()
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            seconds = perf_counter() - started
+            route = self._route(scope)
+            request_seconds.observe((scope["method"], route, status[0]),
+                                    seconds)
+            if route.startswith(f"{self.prefix}/"):
+                name = route[len(self.prefix) + 1:].split("/")[0]
+                if name in registry.collections:
+                    collection_request_seconds.observe(
+                        (name, scope["method"]), seconds)
+
+
+async def metrics_endpoint(request) -> Response:
+    """
+    Prometheus scrape endpoint
+    :param request:
+    :return:
+    """
+    # measuring the collections is blocking, but must not wait behind a
+    # full work executor
+    return Response(await run_in_threadpool(registry.render),
+                    media_type=CONTENT_TYPE)
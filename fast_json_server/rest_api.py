@@ -1,308 +1,770 @@
-import uvicorn
-from fastapi import FastAPI
-from fastapi import APIRouter
-from typing import Dict, Optional, Any, Tuple, List
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from fastapi.encoders import jsonable_encoder
-from pydantic import BaseModel
-from glob import glob
-from pathlib import Path
-import pandas as pd
-import json
-from math import ceil
-from os import sep
-
-
-class ProjectSettings:
-    PROJECT_NAME = "FAST JSON API SERVER"
-    PROJECT_DESCRIPTION = "Simple RESTAPI Application using JSON data and FASTAPI"
-    API_VERSION = "1.0.0"
-    API_VERSION_PATH = "/api/v1"
-
-
-# REST API Settings
-app = FastAPI(title=ProjectSettings.PROJECT_NAME,
-              description=ProjectSettings.PROJECT_DESCRIPTION,
-              version=ProjectSettings.API_VERSION,
-              # docs_url=None,
-              # redoc_url=None,
-              openapi_url=f"{ProjectSettings.API_VERSION_PATH}/openapi.json",
-              docs_url=f"{ProjectSettings.API_VERSION_PATH}/docs",
-              redoc_url=f"{ProjectSettings.API_VERSION_PATH}/redoc")
-
-# Middleware Settings
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-base_responses = {
-    400: {"description": "Bad Request"},
-    401: {"description": "Unauthorized"},
-    404: {"description": "Not Found"},
-    422: {"description": "Validation Error"},
-    500: {"description": "Internal Server Error"}
-}
-
-general_responses = {
-    **base_responses,
-    200: {
-        "content": {
-            "application/json": {
-                "example": {"message": "success"}
-            }
-        },
-    }
-}
-
-pagination_responses = {
-    **base_responses,
-    200: {
-        "content": {
-            "application/json": {
-                "example": {"total_pages": 0,
-                            "total_items": 0,
-                            "page_data": {"page_num": 0,
-                                          "items_count": 0,
-                                          "items": []}}
-            }
-        },
-    }
-}
-
-api_router = APIRouter()
-
-
-def create_routes(name: str, filter_str: str, filter_params: str) -> str:
-    """
-    Create Rest API Routes
-    :param name:
-    :param filter_str:
-    :param filter_params:
-    :return:
-    """
-    routes = '''
-router = APIRouter()
-@router.post("/", responses=general_responses)
-def create_%s(object: %sModel) -> JSONResponse:
-    """ create a %s """
-    try:
-        data = jsonable_encoder(object)
-        data["id"] = int(%s["id"].max()) + 1
-        
-        column_order = list(%s.columns)
-        data_new = {col:data[col] for col in column_order}
-        
-        %s.loc[len(%s.index)] = list(data_new.values())
-        
-        path = Path(str(%s_path))
-        file_name = str(path.name).split(".")[0]
-    
-        %s.to_json(f"{path.parent.absolute()}{sep}{file_name}.json",orient="records",indent=4)
-        
-        return JSONResponse(status_code=200,
-                        content={"message": "success"})
-    except Exception as e:
-        print(e)
-        return JSONResponse(status_code=500,
-                        content={"message": "Something Went Wrong"})
-
-
-@router.put("/{id}", responses=general_responses)
-def update_%s(id: str,object:%sModel) -> JSONResponse:
-    """ update a %s """
-    try:
-        data = jsonable_encoder(object)
-       
-        %s.loc[%s['id'] == int(id), list(data.keys())] = list(data.values())
-       
-        path = Path(str(%s_path))
-        file_name = str(path.name).split(".")[0]
-    
-        %s.to_json(f"{path.parent.absolute()}{sep}{file_name}.json",orient="records",indent=4)
-    
-        return JSONResponse(status_code=200,
-                            content={"message": "success"})
-    except Exception as e:
-        print(e)
-        return JSONResponse(status_code=500,
-                        content={"message": "Something Went Wrong"})
-
-
-@router.delete("/{id}",
-               responses=general_responses)
-def delete_%s(id: str) -> JSONResponse:
-    """ Delete a %s """
-    try:
-        %s.drop(%s[%s['id'] == int(id)].index, inplace = True)
-        
-        path = Path(str(%s_path))
-        file_name = str(path.name).split(".")[0]
-        
-        %s.to_json(f"{path.parent.absolute()}{sep}{file_name}.json",orient="records",indent=4)
-        
-        return JSONResponse(status_code=200,
-                            content={"message": "success"})
-    except Exception as e:
-        print(e)
-        return JSONResponse(status_code=500,
-                        content={"message": "Something Went Wrong"})
-
-@router.get("/", responses=pagination_responses)
-def get_%s(%s, page_num: int = 1, page_size:int = 10) -> JSONResponse:
-    """ Return %s"""
-    try:
-        data = %s.copy()
-        total_items = data.shape[0]
-        %s
-        
-        if page_size is not None:
-        
-            offset = page_size*(page_num-1)
-            
-            data = data[offset:offset + page_size]
-        
-        if data.shape[0] != 0:
-            return JSONResponse(status_code=200, content={"total_pages": ceil(data.shape[0]/float(page_size)),
-                                     "total_items": total_items,
-                                     "page_data": {"page_num": page_num,
-                                                   "item_count": page_size,
-                                                   "items":
-                                                       json.loads(data.to_json(orient="records"))}})
-        else:
-            return JSONResponse(status_code=404, content={"No Data Found"})
-    except Exception as e:
-        print(e)
-        return JSONResponse(status_code=500,
-                        content={"message": "Something Went Wrong"})
-                        
-api_router.include_router(router, prefix="/%s", tags=["%s"])
-      ''' % (
-        name, name, name, name, name, name, name, name, name, name, name, name,
-        name, name, name, name, name, name, name,
-        name, name, name, name, name,
-        filter_params,
-        name, name, filter_str,
-        name, name)
-    return routes
-
-
-# Root API
-@app.get(ProjectSettings.API_VERSION_PATH, include_in_schema=False)
-def root() -> JSONResponse:
-    """
-    Root Route
-    :return:
-    """
-    return JSONResponse(status_code=200,
-                        content={
-                            "message": "Welcome to FAST JSON SERVER"})
-
-
-source = dict()
-file_paths = dict()
-
-
-def get_body_model(name, params: str):
-    """
-    POST / PUT Request Body Schema
-    :param name:
-    :param params:
-    :return:
-    """
-    body_model = """
-class %sModel(BaseModel):
-%s
-    """ % (name, params)
-    exec(body_model, globals())
-
-
-def get_fil_int(col) -> str:
-    """
-    Integer based filter conditions
-    :param col:
-    :return:
-    """
-    return """
-        if %s is not None:
-            data = data[data["%s"] == int(%s)]
-    """ % (col, col, col)
-
-
-def get_fil_non_int(col) -> str:
-    """
-    String based filter conditions
-    :param col:
-    :return:
-    """
-    return """
-        if %s is not None:
-            data = data[data["%s"] == str(%s)]
-    """ % (col, col, col)
-
-
-def get_fil_float(col) -> str:
-    """
-    Float based filter conditions
-    :param col:
-    :return:
-    """
-    return """
-        if %s is not None:
-            data = data[data["%s"] == float(%s)]
-    """ % (col, col, col)
-
-
-def get_query_params(data_name, df_data) -> Tuple:
-    """
-    Query Params for GET Routes
-    :param data_name:
-    :param df_data:
-    :return:
-    """
-    filter_str = ""
-    body_params = ""
-    for col in df_data.columns:
-        if df_data[col].dtype in ["int", "int32", "int64"]:
-            filter_str += get_fil_int(col)
-            if col != "id":
-                body_params += f"\t{col}:int\n"
-        elif df_data[col].dtype in ["float", "float32", "float64"]:
-            filter_str += get_fil_float(col)
-            body_params += f"\t{col}:float\n"
-        else:
-            filter_str += get_fil_non_int(col)
-            body_params += f"\t{col}:str\n"
-    get_body_model(data_name, body_params)
-    filter_params = ",".join(
-        [f"{col}:Optional[Any] = None" for col in df_data.columns])
-    return filter_str, filter_params
-
-
-def start_api(data_path: str, host: str, port: int, log_level):
-    """
-    Start REST API Server
-    :param data_path:
-    :param host:
-    :param port:
-    :param log_level:
-    :return:
-    """
-    # Load JSON Data
-    for file_path in glob(f"{data_path}/*.json"):
-        file = Path(file_path)
-        file_name = str(file.name).split(".")[0]
-        file_paths[file_name] = file_path
-        source[file_name] = pd.read_json(file_path, orient="records")
-        globals()[f"{file_name}_path"] = file_path
-    for key, value in source.items():
-        globals()[key] = value
-        filter_str, filter_params = get_query_params(key, value)
-        # print(create_routes(str(key), filter_str, filter_params))
-        exec(create_routes(str(key), filter_str, filter_params), globals())
-    app.include_router(api_router, prefix=ProjectSettings.API_VERSION_PATH)
-    uvicorn.run(app, host=host, port=port, log_level=log_level)
+from fastapi import FastAPI, Request, Query
+from fastapi import APIRouter
+from typing import Dict, Optional, Any, Tuple, List, Iterator
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel, ValidationError
+from glob import glob
+from pathlib import Path
+import pandas as pd
+from pandas.api.types import is_datetime64_any_dtype, is_integer_dtype, \
+    is_float_dtype
+import json
+from math import ceil
+from itertools import chain
+from functools import partial
+from .collection import Collection, Evictor, select_columns
+from .journal import Journal, Flusher, journal_path, FSYNC_POLICIES
+from .workers import serve
+from .sqlite_store import SqliteCollection
+from .snapshot import load_files, read_data, sniff_data
+from .cache import ResponseCache, not_modified
+from .executor import Executor, Busy, busy_response
+from .watcher import Watcher
+from .metrics import MetricsMiddleware, enable_metrics, metrics_endpoint
+
+
+class ProjectSettings:
+    PROJECT_NAME = "FAST JSON API SERVER"
+    PROJECT_DESCRIPTION = "Simple RESTAPI Application using JSON data and FASTAPI"
+    API_VERSION = "1.0.0"
+    API_VERSION_PATH = "/api/v1"
+
+
+# REST API Settings
+app = FastAPI(title=ProjectSettings.PROJECT_NAME,
+              description=ProjectSettings.PROJECT_DESCRIPTION,
+              version=ProjectSettings.API_VERSION,
+              # docs_url=None,
+              # redoc_url=None,
+              openapi_url=f"{ProjectSettings.API_VERSION_PATH}/openapi.json",
+              docs_url=f"{ProjectSettings.API_VERSION_PATH}/docs",
+              redoc_url=f"{ProjectSettings.API_VERSION_PATH}/redoc")
+
+# Middleware Settings
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+base_responses = {
+    400: {"description": "Bad Request"},
+    401: {"description": "Unauthorized"},
+    404: {"description": "Not Found"},
+    422: {"description": "Validation Error"},
+    500: {"description": "Internal Server Error"},
+    503: {"description": "Server Busy"}
+}
+
+general_responses = {
+    **base_responses,
+    200: {
+        "content": {
+            "application/json": {
+                "example": {"message": "success"}
+            }
+        },
+    }
+}
+
+pagination_responses = {
+    **base_responses,
+    200: {
+        "content": {
+            "application/json": {
+                "example": {"total_pages": 0,
+                            "total_items": 0,
+                            "page_data": {"page_num": 0,
+                                          "items_count": 0,
+                                          "items": []}}
+            }
+        },
+    }
+}
+
+api_router = APIRouter()
+
+
+def create_routes(name: str, filter_str: str, filter_params: str) -> str:
+    """
+    Create Rest API Routes
+    :param name:
+    :param filter_str:
+    :param filter_params:
+    :return:
+    """
+    routes = '''
+router = APIRouter()
+@router.post("/", responses=general_responses)
+async def create_%(name)s(object: %(name)sModel) -> JSONResponse:
+    """ create a %(name)s """
+    collection = source["%(name)s"]
+    try:
+        data = jsonable_encoder(object)
+        await work.run(collection.create, data)
+        await persistence.run(collection.save)
+        
+        return JSONResponse(status_code=200,
+                        content={"message": "success"})
+    except Busy:
+        return busy_response()
+    except Exception as e:
+        print(e)
+        return JSONResponse(status_code=500,
+                        content={"message": "Something Went Wrong"})
+
+
+@router.post("/_bulk", responses=general_responses)
+async def bulk_%(name)s(_items: List[BulkItem]) -> JSONResponse:
+    """ create / update / delete %(name)s in one batch """
+    collection = source["%(name)s"]
+    try:
+        results = await work.run(
+            lambda: collection.bulk(validated_bulk(%(name)sModel, _items)))
+        await persistence.run(collection.save)
+
+        return JSONResponse(status_code=200,
+                            content={"message": "success",
+                                     "results": results})
+    except ValueError as e:
+        return JSONResponse(status_code=400,
+                            content={"message": str(e)})
+    except Busy:
+        return busy_response()
+    except Exception as e:
+        print(e)
+        return JSONResponse(status_code=500,
+                        content={"message": "Something Went Wrong"})
+
+
+@router.put("/{id}", responses=general_responses)
+async def update_%(name)s(id: str,object:%(name)sModel) -> JSONResponse:
+    """ update a %(name)s """
+    collection = source["%(name)s"]
+    try:
+        data = jsonable_encoder(object)
+       
+        if not await work.run(collection.update, id, data):
+            return JSONResponse(status_code=404,
+                                content={"message": "No Data Found"})
+        await persistence.run(collection.save)
+    
+        return JSONResponse(status_code=200,
+                            content={"message": "success"})
+    except Busy:
+        return busy_response()
+    except Exception as e:
+        print(e)
+        return JSONResponse(status_code=500,
+                        content={"message": "Something Went Wrong"})
+
+
+@router.delete("/{id}",
+               responses=general_responses)
+async def delete_%(name)s(id: str) -> JSONResponse:
+    """ Delete a %(name)s """
+    collection = source["%(name)s"]
+    try:
+        if not await work.run(collection.delete, id):
+            return JSONResponse(status_code=404,
+                                content={"message": "No Data Found"})
+        await persistence.run(collection.save)
+        
+        return JSONResponse(status_code=200,
+                            content={"message": "success"})
+    except Busy:
+        return busy_response()
+    except Exception as e:
+        print(e)
+        return JSONResponse(status_code=500,
+                        content={"message": "Something Went Wrong"})
+
+@router.get("/", responses=pagination_responses)
+async def get_%(name)s(_request: Request, %(filter_params)s,
+           page_num: int = 1, page_size:int = 10, _sort: Optional[str] = None,
+           _order: str = "asc", _q: Optional[str] = None,
+           _after: Optional[str] = None, _limit: Optional[int] = None,
+           _fields: Optional[str] = None) -> Response:
+    """ Return %(name)s"""
+    collection = source["%(name)s"]
+    try:
+        filters = dict()
+        conditions = list()
+        %(filter_str)s
+        columns = field_columns(collection, _fields)
+        params = (sorted(filters.items()), conditions, page_num, page_size,
+                  _sort, _order, _q, _after, _limit, columns)
+        if_none_match = _request.headers.get("if-none-match")
+        # revalidations and cached pages are answered on the event loop
+        version = collection.current_version()
+        if version is not None:
+            etag = responses.tag(collection, params, version)
+            if not_modified(if_none_match, etag):
+                return Response(status_code=304, headers={"ETag": etag})
+            cached = responses.get(etag)
+            if cached is not None:
+                return cached_response(etag, *cached)
+        keyset = _after is not None or _limit is not None
+        if keyset:
+            # one extra row tells if there is more
+            _limit = page_size if _limit is None else _limit
+            if _limit < 1:
+                raise ValueError("_limit must be positive")
+
+        def get_page() -> Response:
+            with collection.read():
+                etag = responses.tag(collection, params)
+                if not_modified(if_none_match, etag):
+                    return Response(status_code=304, headers={"ETag": etag})
+                cached = responses.get(etag)
+                if cached is None:
+                    total_items = collection.count()
+                    if keyset:
+                        data = collection.select(filters, conditions, _sort,
+                                                 _order, 0, _limit + 1,
+                                                 search=_q, after=_after)
+                        next_cursor = None
+                        if data.shape[0] > _limit:
+                            data = data.iloc[:_limit]
+                            next_cursor = collection.cursors(
+                                data.iloc[-1:], _sort, _order)[0]
+                        content = cursor_content(
+                            total_items, next_cursor,
+                            collection.encode(data, columns=columns))
+                    else:
+                        offset = 0
+                        if page_size is not None:
+
+                            offset = page_size*(page_num-1)
+
+                        data = collection.select(filters, conditions, _sort,
+                                                 _order, offset, page_size,
+                                                 search=_q)
+                        content = page_content(
+                            ceil(data.shape[0]/float(page_size)),
+                            total_items, page_num, page_size,
+                            collection.encode(data, columns=columns))
+                    if data.shape[0] != 0:
+                        cached = (200, content)
+                    else:
+                        cached = (404, b'{"message":"No Data Found"}')
+                    responses.put(etag, *cached)
+            return cached_response(etag, *cached)
+        
+        return await work.run(get_page)
+    except ValueError as e:
+        return JSONResponse(status_code=400,
+                            content={"message": str(e)})
+    except Busy:
+        return busy_response()
+    except Exception as e:
+        print(e)
+        return JSONResponse(status_code=500,
+                        content={"message": "Something Went Wrong"})
+
+
+@router.get("/_export", responses=base_responses)
+async def export_%(name)s(%(filter_params)s, _format: str = "ndjson",
+           _sort: Optional[str] = None, _order: str = "asc",
+           _q: Optional[str] = None) -> Response:
+    """ Stream all %(name)s matching the filters as ndjson or json """
+    collection = source["%(name)s"]
+    try:
+        if _format not in EXPORT_MEDIA_TYPES:
+            raise ValueError(f"Unknown export format {_format}")
+        filters = dict()
+        conditions = list()
+        %(filter_str)s
+        chunks = collection.export(filters, conditions, _sort, _order, _q)
+        # the first chunk raises bad filters before the response starts
+        first = await work.run(next, chunks, list())
+        return StreamingResponse(streamed_export(first, chunks, _format),
+                                 media_type=EXPORT_MEDIA_TYPES[_format])
+    except ValueError as e:
+        return JSONResponse(status_code=400,
+                            content={"message": str(e)})
+    except Busy:
+        return busy_response()
+    except Exception as e:
+        print(e)
+        return JSONResponse(status_code=500,
+                        content={"message": "Something Went Wrong"})
+
+
+@router.get("/{id}", responses=general_responses)
+async def get_%(name)s_by_id(_request: Request, id: str) -> Response:
+    """ Return a %(name)s by id """
+    collection = source["%(name)s"]
+    try:
+        if_none_match = _request.headers.get("if-none-match")
+        # revalidations and cached rows are answered on the event loop
+        version = collection.current_version()
+        if version is not None:
+            etag = responses.tag(collection, id, version)
+            if not_modified(if_none_match, etag):
+                return Response(status_code=304, headers={"ETag": etag})
+            item = collection.cached_row(id)
+            if item is not None and collection.current_version() == version:
+                return cached_response(etag, 200, item)
+
+        def get_item() -> Response:
+            with collection.read():
+                etag = responses.tag(collection, id)
+                if not_modified(if_none_match, etag):
+                    return Response(status_code=304, headers={"ETag": etag})
+                label = collection.label(id)
+                if label is None:
+                    return JSONResponse(status_code=404,
+                                        content={"message": "No Data Found"})
+                item = collection.encode(collection.rows([label]))[0]
+            return cached_response(etag, 200, item)
+
+        return await work.run(get_item)
+    except ValueError:
+        return JSONResponse(status_code=404,
+                            content={"message": "No Data Found"})
+    except Busy:
+        return busy_response()
+    except Exception as e:
+        print(e)
+        return JSONResponse(status_code=500,
+                        content={"message": "Something Went Wrong"})
+                        
+api_router.include_router(router, prefix="/%(name)s", tags=["%(name)s"])
+      ''' % {"name": name, "filter_str": filter_str,
+             "filter_params": filter_params}
+    return routes
+
+
+# Root API
+@app.get(ProjectSettings.API_VERSION_PATH, include_in_schema=False)
+def root() -> JSONResponse:
+    """
+    Root Route
+    :return:
+    """
+    return JSONResponse(status_code=200,
+                        content={
+                            "message": "Welcome to FAST JSON SERVER"})
+
+
+source = dict()
+file_paths = dict()
+responses = ResponseCache()
+# request work (reads, mutations, encoding) and journal commits; a commit
+# is never refused once its mutation is applied, and one commit covers all
+# the mutations queued behind it
+work = Executor("work")
+persistence = Executor("persistence", threads=1, max_queued=None)
+
+
+def cached_response(etag: str, status_code: int, content: bytes) -> Response:
+    """
+    JSON response from an encoded body, tagged when it has data
+    :param etag:
+    :param status_code:
+    :param content:
+    :return:
+    """
+    headers = {"ETag": etag} if status_code == 200 else None
+    return Response(status_code=status_code, media_type="application/json",
+                    content=content, headers=headers)
+
+
+def field_columns(collection, fields: Optional[str]) -> Optional[List[str]]:
+    """
+    Columns of a _fields= projection ("a,b"), None for all columns
+    :param collection:
+    :param fields:
+    :return:
+    """
+    if fields is None:
+        return None
+    columns = list(dict.fromkeys(col.strip() for col in fields.split(",")
+                                 if col.strip() != ""))
+    unknown = [col for col in columns
+               if col not in collection.schema.columns]
+    if len(unknown) != 0:
+        raise ValueError(f"Unknown fields {', '.join(unknown)}")
+    return columns if len(columns) != 0 else None
+
+
+def page_content(total_pages: int, total_items: int, page_num: int,
+                 item_count: int, items: List[bytes]) -> bytes:
+    """
+    Paginated GET response body from pre-encoded rows
+    :param total_pages:
+    :param total_items:
+    :param page_num:
+    :param item_count:
+    :param items:
+    :return:
+    """
+    return b"".join([
+        b'{"total_pages":%d,"total_items":%d,' % (total_pages, total_items),
+        b'"page_data":{"page_num":%d,"item_count":%d,"items":[' % (
+            page_num, item_count),
+        b",".join(items), b"]}}"])
+
+
+def cursor_content(total_items: int, next_cursor: Optional[str],
+                   items: List[bytes]) -> bytes:
+    """
+    Keyset paginated GET response body from pre-encoded rows
+    :param total_items:
+    :param next_cursor:
+    :param items:
+    :return:
+    """
+    return b"".join([
+        b'{"total_items":%d,"item_count":%d,"next_cursor":%s,"items":[' % (
+            total_items, len(items),
+            json.dumps(next_cursor).encode("utf-8")),
+        b",".join(items), b"]}"])
+
+
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson",
+                      "json": "application/json"}
+
+
+def streamed_export(first: List[bytes], chunks: Iterator[List[bytes]],
+                    format: str) -> Iterator[bytes]:
+    """
+    Export response body, one write per chunk of encoded rows
+    :param first:
+    :param chunks:
+    :param format: ndjson or json
+    :return:
+    """
+    if format == "json":
+        yield b"["
+        separator = b""
+        for rows in chain([first], chunks):
+            if len(rows) != 0:
+                yield separator + b",".join(rows)
+                separator = b","
+        yield b"]"
+    else:
+        for rows in chain([first], chunks):
+            if len(rows) != 0:
+                yield b"\n".join(rows) + b"\n"
+
+
+class BulkItem(BaseModel):
+    """
+    Item of a bulk request: create (record), update (id, record) or
+    delete (id)
+    """
+    op: str
+    id: Optional[int] = None
+    record: Optional[Dict[str, Any]] = None
+
+
+def validated_bulk(model, items: List[BulkItem]) -> List[Dict]:
+    """
+    Bulk items in Collection.bulk() form, records validated by the body
+    model (failures are reported per item)
+    :param model:
+    :param items:
+    :return:
+    """
+    batch = list()
+    for item in items:
+        entry = {"op": item.op, "id": item.id}
+        if item.op in ("create", "update"):
+            try:
+                entry["record"] = jsonable_encoder(model(**(item.record or
+                                                            dict())))
+            except ValidationError as e:
+                entry["error"] = "; ".join(
+                    f"{'.'.join(str(loc) for loc in error['loc'])}: "
+                    f"{error['msg']}" for error in e.errors())
+        batch.append(entry)
+    return batch
+
+
+def get_body_model(name, params: str):
+    """
+    POST / PUT Request Body Schema
+    :param name:
+    :param params:
+    :return:
+    """
+    body_model = """
+class %sModel(BaseModel):
+%s
+    """ % (name, params)
+    exec(body_model, globals())
+
+
+def get_fil_int(col, param) -> str:
+    """
+    Integer based filter conditions
+    :param col:
+    :param param: handler argument of the column's filter
+    :return:
+    """
+    return """
+        if %s is not None:
+            filters[%r] = int(%s)
+    """ % (param, col, param)
+
+
+def get_fil_non_int(col, param) -> str:
+    """
+    String based filter conditions
+    :param col:
+    :param param: handler argument of the column's filter
+    :return:
+    """
+    return """
+        if %s is not None:
+            filters[%r] = str(%s)
+    """ % (param, col, param)
+
+
+def get_fil_float(col, param) -> str:
+    """
+    Float based filter conditions
+    :param col:
+    :param param: handler argument of the column's filter
+    :return:
+    """
+    return """
+        if %s is not None:
+            filters[%r] = float(%s)
+    """ % (param, col, param)
+
+
+def get_fil_date(col, param) -> str:
+    """
+    Date based filter conditions
+    :param col:
+    :param param: handler argument of the column's filter
+    :return:
+    """
+    return """
+        if %s is not None:
+            filters[%r] = pd.Timestamp(%s)
+    """ % (param, col, param)
+
+
+def get_fil_ops(col, param, conv) -> str:
+    """
+    Range / not equal / pattern filter conditions
+    (<col>_gte, <col>_lte, <col>_ne, <col>_like)
+    :param col:
+    :param param: handler argument of the column's filter
+    :param conv:
+    :return:
+    """
+    return """
+        if %(param)s_gte is not None:
+            conditions.append((%(col)r, "gte", %(conv)s(%(param)s_gte)))
+        if %(param)s_lte is not None:
+            conditions.append((%(col)r, "lte", %(conv)s(%(param)s_lte)))
+        if %(param)s_ne is not None:
+            conditions.append((%(col)r, "ne", %(conv)s(%(param)s_ne)))
+        if %(param)s_like is not None:
+            conditions.append((%(col)r, "like", str(%(param)s_like)))
+    """ % {"col": col, "param": param, "conv": conv}
+
+
+def get_query_params(data_name, df_data) -> Tuple:
+    """
+    Query Params for GET Routes. The filters of a column are handler
+    arguments _c<n>, _c<n>_gte ... aliased to the column's query parameters,
+    so column names never clash with the handlers' own names.
+    :param data_name:
+    :param df_data:
+    :return:
+    """
+    filter_str = ""
+    body_params = ""
+    for i, col in enumerate(df_data.columns):
+        param = f"_c{i}"
+        if is_integer_dtype(df_data[col]):
+            filter_str += get_fil_int(col, param) + \
+                get_fil_ops(col, param, "int")
+            if col != "id":
+                body_params += f"\t{col}:int\n"
+        elif is_float_dtype(df_data[col]):
+            filter_str += get_fil_float(col, param) + \
+                get_fil_ops(col, param, "float")
+            body_params += f"\t{col}:float\n"
+        elif is_datetime64_any_dtype(df_data[col]):
+            filter_str += get_fil_date(col, param) + \
+                get_fil_ops(col, param, "pd.Timestamp")
+            body_params += f"\t{col}:str\n"
+        else:
+            filter_str += get_fil_non_int(col, param) + \
+                get_fil_ops(col, param, "str")
+            body_params += f"\t{col}:str\n"
+    get_body_model(data_name, body_params)
+    filter_params = ",".join(
+        [f"_c{i}{op}:Optional[Any] = Query(None, alias={col + op!r})"
+         for i, col in enumerate(df_data.columns)
+         for op in ["", "_gte", "_lte", "_ne", "_like"]])
+    return filter_str, filter_params
+
+
+def start_api(data_path: str, host: str, port: int, log_level,
+              index_columns: Optional[str] = "none", compact_mb: int = 64,
+              search_columns: Optional[str] = "none",
+              flush_interval_ms: int = 100, fsync: str = "interval",
+              cache_entries: int = 1024, load_workers: int = 0,
+              lazy_load: bool = False, sniff_rows: int = 100,
+              lazy_ttl: int = 0, workers: int = 1,
+              storage: str = "memory", executor_threads: int = 0,
+              executor_queue: int = 1024, watch: bool = False,
+              watch_interval: float = 2.0, metrics: bool = False):
+    """
+    Start REST API Server
+    :param data_path:
+    :param host:
+    :param port:
+    :param log_level:
+    :param index_columns:
+    :param compact_mb:
+    :param search_columns:
+    :param flush_interval_ms:
+    :param fsync: always, interval or never
+    :param cache_entries: GET responses kept in the LRU cache (0 disables)
+    :param load_workers: processes loading the files (0: one per CPU)
+    :param lazy_load: load each collection on first access
+    :param sniff_rows: records read at start for a lazy collection's schema
+    :param lazy_ttl: seconds after which an idle lazy collection is evicted
+    :param workers: server processes sharing the collections
+    :param storage: memory (pandas) or sqlite
+    :param executor_threads: threads serving requests (0: CPUs + 4, max 32)
+    :param executor_queue: requests waiting for a thread before 503s
+    :param watch: reload the collections whose JSON file changes on disk
+    :param watch_interval: seconds between two looks at the data files
+    :param metrics: serve Prometheus metrics at /metrics
+    :return:
+    """
+    responses.max_entries = cache_entries
+    work.threads = executor_threads
+    work.max_queued = executor_queue
+    if fsync not in FSYNC_POLICIES:
+        raise ValueError(f"Unknown fsync policy {fsync}, "
+                         f"one of {', '.join(FSYNC_POLICIES)}")
+    flusher = None
+    if fsync != "always":
+        flusher = Flusher(flush_interval_ms, fsync == "interval")
+        app.add_event_handler("startup", flusher.start)
+
+    evictor = None
+    # workers share the journals, which eviction would compact
+    if lazy_load and lazy_ttl > 0 and workers <= 1:
+        evictor = Evictor(source, lazy_ttl)
+        app.add_event_handler("startup", evictor.start)
+    watcher = None
+
+    def shutdown():
+        if watcher is not None:
+            watcher.stop()
+        if evictor is not None:
+            evictor.stop()
+        work.shutdown()
+        persistence.shutdown()
+        if flusher is not None:
+            flusher.stop()
+        # Fold journals back into the JSON files
+        for collection in source.values():
+            collection.close()
+
+    app.add_event_handler("shutdown", shutdown)
+    if metrics:
+        enable_metrics(source, [work, persistence])
+        app.add_middleware(MetricsMiddleware, router=app.router,
+                           prefix=ProjectSettings.API_VERSION_PATH)
+        app.add_route(f"{ProjectSettings.API_VERSION_PATH}/metrics",
+                      metrics_endpoint, include_in_schema=False)
+    # Load JSON Data
+    data_files = glob(f"{data_path}/*.json")
+    in_memory = storage != "sqlite"
+    frames = load_files(data_files, load_workers) \
+        if in_memory and not lazy_load else dict()
+
+    def open_collection(file_name: str, file_path: str):
+        file_paths[file_name] = file_path
+        if not in_memory:
+            return SqliteCollection(file_name, file_path, fsync,
+                                    shared=workers > 1)
+        # lazy collections get routes from a sniff of their first records
+        schema = sniff_data(file_path, sniff_rows) if lazy_load else None
+        data = frames.pop(file_path, None)
+        if data is None and not lazy_load:
+            data = read_data(file_path)
+        return Collection(file_name, file_path, data,
+                          Journal(journal_path(file_path)),
+                          compact_mb * 1024 * 1024, flusher,
+                          loader=partial(read_data, file_path),
+                          schema=schema, shared=workers > 1)
+
+    def mount(key: str) -> APIRouter:
+        value = source[key]
+        filter_str, filter_params = get_query_params(key, value.schema)
+        value.build_indexes(select_columns(value.schema.columns,
+                                           index_columns))
+        value.build_search_index(select_columns(value.schema.columns,
+                                                search_columns))
+        # print(create_routes(str(key), filter_str, filter_params))
+        # a namespace of its own, so the handlers (bulk_<name> ...) cannot
+        # replace the module's functions
+        namespace = dict(globals())
+        exec(create_routes(str(key), filter_str, filter_params), namespace)
+        return namespace["router"]
+
+    def unmount(key: str):
+        prefix = f"/{key}/"
+        api_router.routes[:] = [route for route in api_router.routes
+                                if not route.path.startswith(prefix)]
+        prefix = f"{ProjectSettings.API_VERSION_PATH}/{key}/"
+        app.router.routes[:] = [route for route in app.router.routes
+                                if not route.path.startswith(prefix)]
+        app.openapi_schema = None
+
+    def on_change(key: str, file_path: Optional[str]):
+        collection = source.get(key)
+        if file_path is None:
+            if collection is None:
+                return
+            unmount(key)
+            del source[key], file_paths[key]
+            collection.discard()
+            responses.clear()
+            print(f"Removed {key}")
+            return
+        if collection is not None:
+            if not collection.reload():
+                print(f"Reloaded {key}")
+                return
+            # other columns: new routes
+            unmount(key)
+        else:
+            source[key] = open_collection(key, file_path)
+            responses.clear()
+        app.include_router(mount(key),
+                           prefix=f"{ProjectSettings.API_VERSION_PATH}/{key}",
+                           tags=[key])
+        app.openapi_schema = None
+        print(f"Reloaded {key}" if collection is not None else f"Added {key}")
+
+    for file_path in data_files:
+        file_name = str(Path(file_path).name).split(".")[0]
+        source[file_name] = open_collection(file_name, file_path)
+    for key in source:
+        mount(key)
+    app.include_router(api_router, prefix=ProjectSettings.API_VERSION_PATH)
+    if watch and workers <= 1:
+        watcher = Watcher(data_path, source, on_change, watch_interval)
+        app.add_event_handler("startup", watcher.start)
+    elif watch:
+        print("--watch needs a single worker, not watching")
+    serve(app, host, port, log_level, workers, source)
@@ -0,0 +1,464 @@
+from typing import Dict, Iterator, Optional, List, Tuple
+from pathlib import Path
+from hashlib import blake2b
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from pandas.api.types import (infer_dtype, is_bool_dtype, is_integer_dtype,
+                              is_string_dtype, union_categoricals)
+from io import StringIO
+import json
+import os
+import time
+from .journal import JOURNAL_DIR
+
+try:
+    import pyarrow  # noqa: F401
+    SNAPSHOT_FORMAT = "feather"
+except ImportError:
+    SNAPSHOT_FORMAT = "pickle"
+
+
+def snapshot_path(file_path: str) -> str:
+    """
+    Binary snapshot (without extension) of a JSON data file
+    :param file_path:
+    :return:
+    """
+    path = Path(file_path)
+    file_name = str(path.name).split(".")[0]
+    return str(path.parent / JOURNAL_DIR / f"{file_name}.snapshot")
+
+
+def file_hash(file_path: str) -> str:
+    """
+    Content hash of a file
+    :param file_path:
+    :return:
+    """
+    digest = blake2b(digest_size=16)
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _read_meta(base: str) -> Optional[Dict]:
+    try:
+        with open(f"{base}.meta", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_meta(base: str, meta: Dict):
+    tmp_path = f"{base}.meta.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, f"{base}.meta")
+
+
+def write_snapshot(file_path: str, data: pd.DataFrame):
+    """
+    Store data as the snapshot of a JSON data file (data must be what the
+    file holds), as Feather when pyarrow is installed, else as a pickle
+    :param file_path:
+    :param data:
+    :return:
+    """
+    base = snapshot_path(file_path)
+    Path(base).parent.mkdir(parents=True, exist_ok=True)
+    stat = os.stat(file_path)
+    meta = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+            "hash": file_hash(file_path)}
+    data = data.reset_index(drop=True)
+    for fmt in dict.fromkeys([SNAPSHOT_FORMAT, "pickle"]):
+        # per process, workers may load the same file at once
+        tmp_path = f"{base}.{fmt}.{os.getpid()}.tmp"
+        try:
+            if fmt == "feather":
+                data.to_feather(tmp_path)
+            else:
+                data.to_pickle(tmp_path)
+        except Exception as e:
+            # e.g. nested values Feather cannot store
+            print(e)
+            continue
+        os.replace(tmp_path, f"{base}.{fmt}")
+        _write_meta(base, {**meta, "format": fmt})
+        return
+
+
+def read_snapshot(file_path: str) -> Optional[pd.DataFrame]:
+    """
+    Snapshot of a JSON data file, None when missing or stale. A file with
+    the same size but a new mtime is checked by hash, and its snapshot
+    reused when the content did not change.
+    :param file_path:
+    :return:
+    """
+    base = snapshot_path(file_path)
+    meta = _read_meta(base)
+    if meta is None:
+        return None
+    stat = os.stat(file_path)
+    if meta["size"] != stat.st_size:
+        return None
+    if meta["mtime_ns"] != stat.st_mtime_ns:
+        if meta["hash"] != file_hash(file_path):
+            return None
+        _write_meta(base, {**meta, "mtime_ns": stat.st_mtime_ns})
+    try:
+        if meta["format"] == "feather":
+            return pd.read_feather(f"{base}.feather")
+        return pd.read_pickle(f"{base}.pickle")
+    except Exception as e:
+        print(e)
+        return None
+
+
+# structural bytes of JSON text: 1 opens a value, 2 closes one, 3 is a
+# quote and 4 a backslash (every other byte is 0)
+STRUCTURE = bytearray(256)
+STRUCTURE[ord("{")] = STRUCTURE[ord("[")] = 1
+STRUCTURE[ord("}")] = STRUCTURE[ord("]")] = 2
+STRUCTURE[ord('"')] = 3
+STRUCTURE[ord("\\")] = 4
+STRUCTURE = bytes(STRUCTURE)
+
+
+def _escaped(codes: np.ndarray, slashes: np.ndarray,
+             escaped: bool) -> Tuple[np.ndarray, bool]:
+    """
+    Positions of the characters escaped by a backslash in a block, and
+    whether the first character of the next block is (escaped: whether
+    the first one of this block is)
+    """
+    if escaped and len(slashes) != 0 and slashes[0] == 0:
+        slashes = slashes[1:]
+    positions = [np.array([0] if escaped else [], dtype=np.int64)]
+    escaped = False
+    if len(slashes) != 0:
+        # a run of backslashes escapes the next character when it is odd
+        breaks = np.flatnonzero(np.diff(slashes) != 1) + 1
+        firsts = slashes[np.r_[0, breaks]]
+        lasts = slashes[np.r_[breaks - 1, len(slashes) - 1]]
+        after = lasts[(lasts - firsts) % 2 == 0] + 1
+        if len(after) != 0 and after[-1] == len(codes):
+            escaped = True
+            after = after[:-1]
+        positions.append(after)
+    return np.concatenate(positions), escaped
+
+
+def _scan(file_path: str, chunk_bytes: int) -> Iterator[
+        Tuple[bytes, List[int], List[int], bool, bool]]:
+    """
+    Blocks of a JSON data file with the positions where records (values
+    inside the top-level array) start and end in them, whether a record
+    is open at the start of the block and whether the array ends in it.
+    Brackets are found outside strings by a translate and a numpy scan of
+    each block, nothing is decoded.
+    """
+    depth = 0
+    in_string = False
+    escaped = False
+    with open(file_path, "rb") as f:
+        while True:
+            block = f.read(chunk_bytes)
+            if block == b"":
+                return
+            codes = np.frombuffer(block, dtype=np.uint8)
+            kinds = np.frombuffer(block.translate(STRUCTURE), dtype=np.uint8)
+            positions = np.flatnonzero(kinds)
+            kinds = kinds[positions]
+            quote = kinds == 3
+            skipped, escaped = _escaped(codes, positions[kinds == 4], escaped)
+            skipped = skipped[codes[skipped] == ord('"')]
+            quote[np.searchsorted(positions, skipped)] = False
+            # a bracket after an odd number of quotes is inside a string
+            parity = np.cumsum(quote, dtype=np.int64) + in_string
+            bracket = (kinds <= 2) & (parity % 2 == 0)
+            brackets = positions[bracket]
+            if len(parity) != 0:
+                in_string = bool(parity[-1] % 2)
+            inside = depth >= 2
+            if len(brackets) == 0:
+                yield block, [], [], inside, False
+                continue
+            delta = np.where(kinds[bracket] == 1, 1, -1)
+            levels = np.cumsum(delta, dtype=np.int64) + depth
+            depth = int(levels[-1])
+            # records open at level 2 (inside the array) and close to 1
+            yield (block, brackets[(delta == 1) & (levels == 2)].tolist(),
+                   brackets[(delta == -1) & (levels == 1)].tolist(), inside,
+                   bool((levels <= 0).any()))
+            if depth <= 0:
+                return
+
+
+def _take(parts: List[bytes]) -> str:
+    """
+    JSON array of the records gathered in parts, emptying parts so the
+    generator does not hold the chunk while it is parsed
+    :param parts:
+    :return:
+    """
+    text = b"".join(parts)
+    parts.clear()
+    return "[" + text.decode("utf-8") + "]"
+
+
+def iter_chunks(file_path: str, chunk_rows: int,
+                chunk_bytes: int = 1024 * 1024) -> Iterator[str]:
+    """
+    JSON text (an array) of each run of chunk_rows records of a JSON data
+    file, read in blocks so only one block and the chunk being gathered
+    are held in memory. The runs are cut out of the blocks as they are,
+    so parse_records parses each record once, and a record spanning many
+    blocks costs its length.
+    :param file_path:
+    :param chunk_rows:
+    :param chunk_bytes:
+    :return:
+    """
+    parts: List[bytes] = list()
+    count = 0
+    for block, starts, ends, inside, last in _scan(file_path, chunk_bytes):
+        # the first end closes the record open before this block
+        offset = int(inside)
+        begin = 0 if inside else (starts[0] if len(starts) != 0 else None)
+        done = 0
+        while begin is not None:
+            if count != 0 and not inside:
+                # the separator may be in an earlier block
+                parts.append(b",")
+            inside = False
+            need = chunk_rows - count
+            if len(ends) - done < need:
+                if len(starts) + offset > len(ends):
+                    # a record goes on in the next block
+                    parts.append(block[begin:])
+                elif len(ends) > done:
+                    parts.append(block[begin:ends[-1] + 1])
+                count += len(ends) - done
+                break
+            done += need
+            parts.append(block[begin:ends[done - 1] + 1])
+            count = 0
+            yield _take(parts)
+            following = done - offset
+            begin = starts[following] if following < len(starts) else None
+        if last:
+            break
+    if count != 0:
+        yield _take(parts)
+
+
+def parse_records(text: str) -> pd.DataFrame:
+    """
+    Records (a JSON array from iter_chunks) as a DataFrame, with the dtype
+    and date inference of reading the whole file
+    :param text:
+    :return:
+    """
+    return pd.read_json(StringIO(text), orient="records")
+
+
+def file_signature(file_path: str) -> Optional[Tuple[int, int]]:
+    """
+    Size and modification time of a file, None when it does not exist
+    :param file_path:
+    :return:
+    """
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def sniff_data(file_path: str, rows: int = 100) -> pd.DataFrame:
+    """
+    The first records of a JSON data file, decoded without reading the
+    rest of it, for the columns and dtypes of a lazily loaded collection
+    :param file_path:
+    :param rows:
+    :return:
+    """
+    return compact(parse_records(next(iter_chunks(file_path, rows), "[]")))
+
+
+def _is_text(series: pd.Series) -> bool:
+    if series.dtype == object:
+        return infer_dtype(series, skipna=True) == "string"
+    return is_string_dtype(series.dtype) and \
+        not isinstance(series.dtype, pd.CategoricalDtype)
+
+
+def _compact_numbers(series: pd.Series) -> pd.Series:
+    if is_bool_dtype(series.dtype):
+        return series
+    if is_integer_dtype(series.dtype):
+        return pd.to_numeric(series, downcast="integer")
+    if series.dtype == np.float64:
+        narrow = series.astype(np.float32)
+        # only when no value changes, so filters and output stay exact
+        if narrow.astype(np.float64).equals(series):
+            return narrow
+    return series
+
+
+def compact(data: pd.DataFrame,
+            max_category_ratio: float = 0.5) -> pd.DataFrame:
+    """
+    Data with narrower dtypes: integers downcast to the smallest type that
+    holds them, floats to float32 when that is lossless, and strings with
+    few distinct values stored as categoricals
+    :param data:
+    :param max_category_ratio: most distinct values per row of a
+    categorical column
+    :return:
+    """
+    columns = dict()
+    for col in data.columns:
+        series = data[col]
+        if _is_text(series) and \
+                series.nunique() <= max_category_ratio * len(series):
+            series = series.astype("category")
+        columns[col] = _compact_numbers(series)
+    return pd.DataFrame(columns, index=data.index, columns=data.columns)
+
+
+def _combine(pieces: List[pd.Series], categorical: bool) -> pd.Series:
+    if categorical:
+        try:
+            return pd.Series(union_categoricals(pieces, sort_categories=True))
+        except TypeError:
+            # categories of mixed types
+            pass
+    pieces = [piece.astype(object) if isinstance(piece.dtype,
+                                                 pd.CategoricalDtype)
+              else piece for piece in pieces]
+    # numbers compacted per chunk are widened to a type that holds every
+    # piece (int8 and int32 to int32, int32 and float32 to float64)
+    return pd.concat(pieces, ignore_index=True)
+
+
+def read_compact(file_path: str, chunk_rows: int = 50000,
+                 max_category_ratio: float = 0.5) -> pd.DataFrame:
+    """
+    Records of a JSON data file, parsed in chunks of records that are
+    compacted (see compact) before the next chunk is read, so peak memory
+    is about the compact data plus one chunk instead of the whole file as
+    Python objects
+    :param file_path:
+    :param chunk_rows:
+    :param max_category_ratio:
+    :return:
+    """
+    chunks = list()
+    for text in iter_chunks(file_path, chunk_rows):
+        chunk = parse_records(text)
+        del text
+        for col in chunk.columns:
+            series = chunk[col]
+            if _is_text(series) and \
+                    series.nunique() <= max_category_ratio * len(series):
+                chunk[col] = series.astype("category")
+            else:
+                chunk[col] = _compact_numbers(series)
+        chunks.append(chunk)
+    if len(chunks) == 0:
+        return pd.DataFrame()
+    if len(chunks) == 1:
+        data = chunks[0]
+    else:
+        columns = list(dict.fromkeys(col for chunk in chunks
+                                     for col in chunk.columns))
+        data = dict()
+        for col in columns:
+            pieces = [chunk[col] if col in chunk.columns
+                      else pd.Series([None] * chunk.shape[0], dtype=object)
+                      for chunk in chunks]
+            kinds = [piece.dtype for piece in pieces
+                     if isinstance(piece.dtype, pd.CategoricalDtype)]
+            categorical = len(kinds) > 0 and all(
+                isinstance(piece.dtype, pd.CategoricalDtype) or
+                piece.isna().all() for piece in pieces)
+            if categorical:
+                # null pieces as empty categoricals of the same kind
+                empty = pd.CategoricalDtype(
+                    kinds[0].categories[:0])
+                pieces = [piece if isinstance(piece.dtype,
+                                              pd.CategoricalDtype)
+                          else pd.Series(pd.Categorical(
+                              [None] * len(piece), dtype=empty))
+                          for piece in pieces]
+            data[col] = _combine(pieces, categorical)
+            for chunk in chunks:
+                chunk.drop(columns=col, inplace=True, errors="ignore")
+        data = pd.DataFrame(data, columns=columns)
+    for col in data.columns:
+        series = data[col]
+        if isinstance(series.dtype, pd.CategoricalDtype) and \
+                len(series.cat.categories) > \
+                max_category_ratio * len(series):
+            data[col] = series.astype(series.cat.categories.dtype)
+    return compact(data, max_category_ratio)
+
+
+def load_file(file_path: str) -> Tuple[pd.DataFrame, str, float]:
+    """
+    Records of a JSON data file, from its binary snapshot when it is
+    valid; the JSON is parsed and the snapshot rewritten otherwise
+    :param file_path:
+    :return: data, where it came from (snapshot or json), seconds taken
+    """
+    started = time.perf_counter()
+    data = read_snapshot(file_path)
+    source = "snapshot"
+    if data is None:
+        source = "json"
+        data = read_compact(file_path)
+        try:
+            write_snapshot(file_path, data)
+        except Exception as e:
+            print(e)
+    return data, source, time.perf_counter() - started
+
+
+def read_data(file_path: str) -> pd.DataFrame:
+    """
+    Records of a JSON data file (see load_file)
+    :param file_path:
+    :return:
+    """
+    return load_file(file_path)[0]
+
+
+def load_files(file_paths: List[str],
+               workers: int = 0) -> Dict[str, pd.DataFrame]:
+    """
+    Records of JSON data files, loaded in parallel by a process pool, with
+    a per-file timing report
+    :param file_paths:
+    :param workers: pool size, 0 for one per CPU, 1 to load in process
+    :return: file path -> data
+    """
+    started = time.perf_counter()
+    workers = min(workers or os.cpu_count() or 1, len(file_paths))
+    if workers <= 1:
+        results = [load_file(file_path) for file_path in file_paths]
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            results = list(pool.map(load_file, file_paths))
+    for file_path, (data, source, seconds) in zip(file_paths, results):
+        megabytes = data.memory_usage(deep=True).sum() / (1024 * 1024)
+        print(f"Loaded {Path(file_path).name}: {data.shape[0]} records, "
+              f"{megabytes:.1f} MB in {seconds:.2f}s ({source})")
+    print(f"Loaded {len(file_paths)} files in "
+          f"{time.perf_counter() - started:.2f}s with {max(workers, 1)} "
+          f"worker(s)")
+    return {file_path: data
+            for file_path, (data, _, _) in zip(file_paths, results)}
@@ -0,0 +1,925 @@
+from typing import Dict, Optional, Any, List, Tuple, Iterator
+from pathlib import Path
+from threading import local
+from contextlib import contextmanager
+import pandas as pd
+from pandas.api.types import is_bool_dtype, is_integer_dtype, \
+    is_float_dtype, is_datetime64_any_dtype, infer_dtype
+import sqlite3
+import base64
+import json
+import os
+import re
+from .journal import JOURNAL_DIR, replace_file
+from .indexes import tokenize
+from .metrics import timed
+from .snapshot import file_hash, file_signature, iter_chunks, \
+    parse_records
+
+DATE_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+
+# column kind -> SQL type, dtype of the collection schema
+KINDS = {"int": ("INTEGER", "int64"), "float": ("REAL", "float64"),
+         "bool": ("INTEGER", "bool"), "date": ("TEXT", "datetime64[ns]"),
+         "text": ("TEXT", "str"), "json": ("TEXT", "object")}
+
+OPERATORS = {"gte": ">=", "lte": "<="}
+
+SYNCHRONOUS = {"always": "FULL", "interval": "NORMAL", "never": "OFF"}
+
+
+def sqlite_path(file_path: str) -> str:
+    """
+    SQLite database of a JSON data file
+    :param file_path:
+    :return:
+    """
+    path = Path(file_path)
+    file_name = str(path.name).split(".")[0]
+    return str(path.parent / JOURNAL_DIR / f"{file_name}.sqlite")
+
+
+def quote(name: str) -> str:
+    """
+    SQL identifier
+    :param name:
+    :return:
+    """
+    return '"%s"' % name.replace('"', '""')
+
+
+def column_kind(series: pd.Series) -> str:
+    """
+    How a column is stored: int, float, bool, date, text or json
+    :param series:
+    :return:
+    """
+    if is_bool_dtype(series):
+        return "bool"
+    if is_integer_dtype(series):
+        return "int"
+    if is_float_dtype(series):
+        return "float"
+    if is_datetime64_any_dtype(series):
+        return "date"
+    if isinstance(series.dtype, pd.CategoricalDtype) or \
+            infer_dtype(series, skipna=True) in ("string", "empty"):
+        return "text"
+    return "json"
+
+
+def widen_kind(kind: Optional[str], other: str) -> str:
+    """
+    Kind holding the values of both kinds: float for ints and floats, text
+    for dates and strings and json for any other mix
+    :param kind:
+    :param other:
+    :return:
+    """
+    if kind is None or kind == other:
+        return other
+    if {kind, other} == {"int", "float"}:
+        return "float"
+    if {kind, other} == {"date", "text"}:
+        return "text"
+    return "json"
+
+
+def _has_token(value, term: str, prefix: int) -> bool:
+    """
+    Whether a value has the token (or one starting with it), the matching
+    of the in-memory TextIndex
+    """
+    if prefix:
+        return any(token.startswith(term) for token in tokenize(value))
+    return term in tokenize(value)
+
+
+def _regexp(pattern: str, value) -> bool:
+    return value is not None and \
+        re.search(pattern, str(value), re.IGNORECASE) is not None
+
+
+class SqliteCollection:
+    """
+    JSON collection stored in a SQLite database, for data larger than
+    memory: the JSON file is imported once (in chunks) into a table keyed
+    by id with an index per filter column, GET filters and pages run as
+    parameterized SQL and every write is its own transaction. The database
+    is exported back to the JSON file on shutdown.
+
+    Each thread (and worker process) has its own connection. Reads run in
+    one read transaction, a consistent snapshot, and the version and record
+    count kept in the meta table are bumped by every write.
+    """
+
+    def __init__(self, name: str, path: str, fsync: str = "interval",
+                 chunk_rows: int = 50000, shared: bool = False):
+        self.name = name
+        self.path = path
+        self.db_path = sqlite_path(path)
+        self.table = quote(name)
+        if fsync not in SYNCHRONOUS:
+            raise ValueError(f"Unknown fsync policy {fsync}")
+        self.synchronous = SYNCHRONOUS[fsync]
+        self.chunk_rows = chunk_rows
+        self.shared = shared
+        self.index_columns: List[str] = list()
+        self.search_columns: List[str] = list()
+        self.written = None
+        self._local = local()
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("CREATE TABLE IF NOT EXISTS meta "
+                           "(key TEXT PRIMARY KEY, value TEXT)")
+        if not self._imported(connection):
+            self._import(connection)
+        self._columns(connection)
+
+    def _columns(self, connection: sqlite3.Connection):
+        self.kinds: Dict[str, str] = dict(
+            json.loads(self._meta(connection, "columns")))
+        self.columns = list(self.kinds)
+        self.schema = pd.DataFrame(
+            {col: pd.Series(dtype=KINDS[kind][1])
+             for col, kind in self.kinds.items()})
+        self._select = ", ".join(quote(col) for col in self.columns)
+
+    def _connection(self) -> sqlite3.Connection:
+        """
+        This thread's connection (opened again in a forked worker)
+        """
+        if getattr(self._local, "pid", None) != os.getpid():
+            connection = sqlite3.connect(self.db_path, timeout=30,
+                                         isolation_level=None,
+                                         check_same_thread=False)
+            connection.execute(f"PRAGMA synchronous={self.synchronous}")
+            connection.create_function("regexp", 2, _regexp,
+                                       deterministic=True)
+            connection.create_function("has_token", 3, _has_token,
+                                       deterministic=True)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+            self._local.depth = 0
+        return self._local.connection
+
+    @staticmethod
+    def _meta(connection: sqlite3.Connection, key: str) -> Optional[str]:
+        row = connection.execute("SELECT value FROM meta WHERE key = ?",
+                                 (key,)).fetchone()
+        return None if row is None else row[0]
+
+    @staticmethod
+    def _set_meta(connection: sqlite3.Connection, key: str, value):
+        connection.execute("INSERT OR REPLACE INTO meta (key, value) "
+                           "VALUES (?, ?)", (key, str(value)))
+
+    def _source(self) -> Dict:
+        stat = os.stat(self.path)
+        return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    def _imported(self, connection: sqlite3.Connection) -> bool:
+        """
+        Whether the database holds the current JSON file (it is newer when
+        the server stopped without exporting it)
+        """
+        source = self._meta(connection, "source")
+        if source is None or self._meta(connection, "columns") is None:
+            return False
+        source = json.loads(source)
+        current = self._source()
+        if source["size"] != current["size"]:
+            return False
+        if source["mtime_ns"] != current["mtime_ns"]:
+            if source["hash"] != file_hash(self.path):
+                return False
+            source["mtime_ns"] = current["mtime_ns"]
+            self._set_meta(connection, "source", json.dumps(source))
+        return True
+
+    def _chunks(self) -> Iterator[pd.DataFrame]:
+        for text in iter_chunks(self.path, self.chunk_rows):
+            yield parse_records(text)
+
+    def _kinds(self) -> Dict[str, str]:
+        """
+        Kind of each column over the whole file: a first pass over the
+        chunks widens a kind when a later chunk holds other values, so no
+        value is cast to the kind of the first chunk
+        """
+        kinds: Dict[str, Optional[str]] = {"id": "int"}
+        for chunk in self._chunks():
+            for col in chunk.columns:
+                if col == "id":
+                    continue
+                if chunk[col].isna().all():
+                    kinds.setdefault(col, None)
+                else:
+                    kinds[col] = widen_kind(kinds.get(col),
+                                            column_kind(chunk[col]))
+        return {col: "text" if kind is None else kind
+                for col, kind in kinds.items()}
+
+    def _import(self, connection: sqlite3.Connection):
+        """
+        Load the JSON file into a fresh table, a chunk of records at a time
+        (once to find the column kinds, then to insert the records).
+        The version goes on from the one of a previous import.
+        """
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            version = self._meta(connection, "version")
+            connection.execute(f"DROP TABLE IF EXISTS {self.table}")
+            kinds = self._kinds()
+            connection.execute(f"CREATE TABLE {self.table} (%s)" % ", ".join(
+                "id INTEGER PRIMARY KEY" if col == "id" else
+                f"{quote(col)} {KINDS[kind][0]}"
+                for col, kind in kinds.items()))
+            for chunk in self._chunks():
+                columns = list(chunk.columns)
+                values = [chunk[col].astype(object).tolist()
+                          for col in columns]
+                connection.executemany(
+                    f"INSERT OR REPLACE INTO {self.table} "
+                    f"({', '.join(quote(col) for col in columns)}) "
+                    f"VALUES ({', '.join('?' * len(columns))})",
+                    [[self._value(kinds[col], value)
+                      for col, value in zip(columns, row)]
+                     for row in zip(*values)])
+            count, last_id = connection.execute(
+                f"SELECT COUNT(*), COALESCE(MAX(id), 0) "
+                f"FROM {self.table}").fetchone()
+            self._set_meta(connection, "columns",
+                           json.dumps(list(kinds.items())))
+            self._set_meta(connection, "count", count)
+            self._set_meta(connection, "last_id", last_id)
+            self._set_meta(connection, "version",
+                           0 if version is None else int(version) + 1)
+            self._set_meta(connection, "source",
+                           json.dumps({**self._source(),
+                                       "hash": file_hash(self.path)}))
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        print(f"Imported {Path(self.path).name} into SQLite: "
+              f"{count} records")
+
+    @staticmethod
+    def _value(kind: str, value):
+        """
+        SQL value of a record value
+        """
+        if kind == "json":
+            if value is None or isinstance(value, float) and value != value:
+                return None
+            return json.dumps(value)
+        try:
+            if pd.isna(value):
+                return None
+        except ValueError:
+            # a list or object in a scalar column
+            return json.dumps(value)
+        if kind == "date":
+            return pd.Timestamp(value).strftime(DATE_FORMAT)
+        if kind in ("int", "bool"):
+            return int(value)
+        if kind == "float":
+            return float(value)
+        if isinstance(value, (list, dict)):
+            return json.dumps(value)
+        if isinstance(value, pd.Timestamp):
+            # a date in a column widened to text
+            return value.strftime(DATE_FORMAT)
+        if hasattr(value, "item"):
+            return value.item()
+        return value
+
+    def _param(self, col: str, value):
+        return self._value(self.kinds[col], value)
+
+    def _frame(self, rows: List[Tuple]) -> pd.DataFrame:
+        """
+        Selected rows as a DataFrame indexed by id, like a slice of an in
+        memory collection
+        """
+        if len(rows) == 0:
+            return self.schema
+        ids = [row[0] for row in rows]
+        columns = dict()
+        for col, values in zip(self.columns, zip(*rows)):
+            kind = self.kinds[col]
+            if kind == "date":
+                columns[col] = pd.to_datetime(pd.Series(values, index=ids,
+                                                        dtype=object))
+            elif kind == "json":
+                columns[col] = pd.Series([None if value is None
+                                          else json.loads(value)
+                                          for value in values],
+                                         index=ids, dtype=object)
+            elif kind == "bool" and None not in values:
+                columns[col] = pd.Series(values, index=ids, dtype=bool)
+            elif kind == "float":
+                columns[col] = pd.Series(values, index=ids, dtype="float64")
+            else:
+                columns[col] = pd.Series(values, index=ids)
+        return pd.DataFrame(columns, index=ids, columns=self.columns)
+
+    def build_indexes(self, columns: List[str]):
+        """
+        Create an index per filter column (id is the primary key) and drop
+        those of columns no longer indexed
+        :param columns:
+        :return:
+        """
+        self.index_columns = list(columns)
+        connection = self._connection()
+        wanted = {f"{self.name}__{col}": col for col in columns
+                  if col in self.kinds and col != "id" and
+                  self.kinds[col] != "json"}
+        existing = [row[0] for row in connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND "
+            "tbl_name = ? AND name LIKE ?", (self.name, f"{self.name}__%"))]
+        for index in existing:
+            if index not in wanted:
+                connection.execute(f"DROP INDEX {quote(index)}")
+        for index, col in wanted.items():
+            if index not in existing:
+                connection.execute(f"CREATE INDEX {quote(index)} ON "
+                                   f"{self.table} ({quote(col)})")
+
+    def text_columns(self) -> List[str]:
+        """
+        String columns, the ones searched by _q / _search
+        :return:
+        """
+        return [col for col, kind in self.kinds.items() if kind == "text"]
+
+    def build_search_index(self, columns: List[str]):
+        """
+        Pick the columns searched by _q / _search (a scan matching tokens,
+        over all string columns when none is picked)
+        :param columns:
+        :return:
+        """
+        self.search_columns = [col for col in self.text_columns()
+                               if col in columns]
+
+    def reload(self) -> bool:
+        """
+        Import the JSON file again after it changed on disk, in one
+        transaction (readers keep their snapshot)
+        :return: whether the columns changed
+        """
+        connection = self._connection()
+        columns = list(self.kinds.items())
+        self._import(connection)
+        self._columns(connection)
+        self.build_indexes(self.index_columns)
+        self.build_search_index(self.search_columns)
+        return list(self.kinds.items()) != columns
+
+    def discard(self):
+        """
+        Nothing to do, the database is imported again if the JSON file
+        comes back
+        :return:
+        """
+
+    @contextmanager
+    def read(self):
+        """
+        Read transaction: everything read inside sees one snapshot
+        :return:
+        """
+        connection = self._connection()
+        if self._local.depth == 0:
+            connection.execute("BEGIN")
+            self._local.version = int(self._meta(connection, "version"))
+        self._local.depth += 1
+        try:
+            yield
+        finally:
+            self._local.depth -= 1
+            if self._local.depth == 0:
+                connection.execute("COMMIT")
+
+    @property
+    def version(self) -> int:
+        """
+        Version of the data, the snapshot's under read()
+        :return:
+        """
+        connection = self._connection()
+        if self._local.depth != 0:
+            return self._local.version
+        return int(self._meta(connection, "version"))
+
+    @contextmanager
+    def _writing(self):
+        """
+        Write transaction, bumping the version when it commits
+        """
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+            connection.execute("UPDATE meta SET value = value + 1 "
+                               "WHERE key = 'version'")
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def loaded(self) -> bool:
+        """
+        Always, the records stay in the database
+        :return:
+        """
+        return True
+
+    def memory_usage(self) -> int:
+        """
+        Size of the database (the records are not held in memory)
+        :return:
+        """
+        connection = self._connection()
+        page_count = connection.execute("PRAGMA page_count").fetchone()[0]
+        page_size = connection.execute("PRAGMA page_size").fetchone()[0]
+        return page_count * page_size
+
+    def load(self):
+        """
+        Nothing to load
+        :return:
+        """
+
+    def evict(self, ttl: float) -> bool:
+        """
+        Nothing to evict
+        :param ttl:
+        :return:
+        """
+        return False
+
+    def sync(self):
+        """
+        Nothing to catch up with, SQLite is shared by all workers
+        :return:
+        """
+
+    def current_version(self) -> Optional[int]:
+        """
+        None, the version is only known by a query
+        :return:
+        """
+        return None
+
+    def count(self) -> int:
+        """
+        Number of records (call under read())
+        :return:
+        """
+        return int(self._meta(self._connection(), "count"))
+
+    def label(self, id) -> Optional[int]:
+        """
+        Row label of a record, its id
+        :param id:
+        :return:
+        """
+        row = self._connection().execute(
+            f"SELECT id FROM {self.table} WHERE id = ?",
+            (int(id),)).fetchone()
+        return None if row is None else row[0]
+
+    def rows(self, labels: List[int]) -> pd.DataFrame:
+        """
+        Rows by label (call under read())
+        :param labels:
+        :return:
+        """
+        rows = self._connection().execute(
+            f"SELECT {self._select} FROM {self.table} WHERE id IN "
+            f"({', '.join('?' * len(labels))})", labels).fetchall()
+        return self._frame(rows).loc[labels]
+
+    @timed("filter", rows=True)
+    def lookup(self, col: str, values: List) -> pd.DataFrame:
+        """
+        Rows whose col is one of values, in id order (call under read())
+        :param col:
+        :param values:
+        :return:
+        """
+        if col not in self.kinds:
+            raise ValueError(f"Unknown column {col}")
+        params = [self._param(col, value) for value in set(values)]
+        rows = self._connection().execute(
+            f"SELECT {self._select} FROM {self.table} WHERE {quote(col)} IN "
+            f"({', '.join('?' * len(params))}) ORDER BY id", params).fetchall()
+        return self._frame(rows)
+
+    def get(self, id) -> Optional[Dict]:
+        """
+        Return a record by id
+        :param id:
+        :return:
+        """
+        with self.read():
+            label = self.label(id)
+            if label is None:
+                return None
+            return json.loads(self.rows([label]).to_json(
+                orient="records"))[0]
+
+    @timed("serialize")
+    def encode(self, data: pd.DataFrame, cache: bool = True,
+               columns: Optional[List[str]] = None) -> List[bytes]:
+        """
+        JSON bytes of each row of data
+        :param data:
+        :param cache: unused, rows are not cached
+        :param columns: only these columns
+        :return:
+        """
+        if data.shape[0] == 0:
+            return list()
+        if columns is not None:
+            data = data[columns]
+        lines = data.to_json(orient="records", lines=True,
+                             force_ascii=False)
+        return [line.encode("utf-8") for line in lines.split("\n")
+                if line != ""]
+
+    def encoded_row(self, id) -> Optional[bytes]:
+        """
+        JSON bytes of a record by id
+        :param id:
+        :return:
+        """
+        with self.read():
+            label = self.label(id)
+            if label is None:
+                return None
+            return self.encode(self.rows([label]))[0]
+
+    def _where(self, filters: Dict[str, Any], conditions: List[Tuple],
+               search: Optional[str]) -> Tuple[List[str], List]:
+        """
+        WHERE clauses and parameters of the filters, conditions and search
+        terms
+        """
+        clauses = list()
+        params = list()
+        for col, value in filters.items():
+            clauses.append(f"{quote(col)} = ?")
+            params.append(self._param(col, value))
+        for col, op, value in conditions:
+            if op in OPERATORS:
+                clauses.append(f"{quote(col)} {OPERATORS[op]} ?")
+            elif op == "ne":
+                clauses.append(f"({quote(col)} IS NULL OR {quote(col)} != ?)")
+            elif op == "like":
+                clauses.append(f"{quote(col)} REGEXP ?")
+                params.append(str(value))
+                continue
+            else:
+                raise ValueError(f"Unknown operator {op}")
+            params.append(self._param(col, value))
+        terms = tokenize(search)
+        # all string columns unless some were picked, like the in-memory
+        # scan without a token index
+        columns = self.search_columns or self.text_columns()
+        for position, term in enumerate(terms):
+            if len(columns) == 0:
+                clauses.append("0")
+                break
+            # whole tokens, the last term a prefix (as typed so far)
+            prefix = int(position == len(terms) - 1)
+            clauses.append("(%s)" % " OR ".join(
+                f"has_token({quote(col)}, ?, {prefix})" for col in columns))
+            params.extend([term] * len(columns))
+        return clauses, params
+
+    @staticmethod
+    def _key_value(value):
+        try:
+            if pd.isna(value):
+                return None
+        except ValueError:
+            pass
+        if isinstance(value, pd.Timestamp):
+            return value.isoformat()
+        if hasattr(value, "item"):
+            return value.item()
+        return value
+
+    def cursors(self, data: pd.DataFrame, sort: Optional[str] = None,
+                order: str = "asc") -> List[str]:
+        """
+        Opaque keyset cursors of the rows of a page, each one pointing just
+        past its row
+        :param data:
+        :param sort:
+        :param order:
+        :return:
+        """
+        ids = data.index.tolist()
+        values = [None] * len(ids) if sort is None else data[sort].tolist()
+        cursors = list()
+        for value, id in zip(values, ids):
+            key = {"s": sort, "o": order, "v": self._key_value(value),
+                   "l": id, "i": id}
+            cursors.append(base64.urlsafe_b64encode(
+                json.dumps(key, separators=(",", ":")).encode("utf-8"))
+                           .decode("ascii").rstrip("="))
+        return cursors
+
+    def _after(self, cursor: str, sort: Optional[str],
+               order: str) -> Tuple[List[str], List]:
+        """
+        WHERE clause and parameters of the rows past a cursor
+        """
+        try:
+            key = json.loads(base64.urlsafe_b64decode(
+                cursor + "=" * (-len(cursor) % 4)))
+            cursor_sort, cursor_order = key["s"], key["o"]
+            value = key["v"]
+            id = int(key["i"] if key["i"] is not None else key["l"])
+        except (ValueError, KeyError, TypeError):
+            raise ValueError("Invalid cursor")
+        if cursor_sort != sort or cursor_order != order:
+            raise ValueError("Cursor does not match the sort order")
+        if sort is None:
+            return ["id > ?"], [id]
+        col = quote(sort)
+        if value is None:
+            return [f"({col} IS NULL AND id > ?)"], [id]
+        value = self._param(sort, value)
+        beyond = ">" if order == "asc" else "<"
+        return [f"({col} {beyond} ? OR ({col} = ? AND id > ?) OR "
+                f"{col} IS NULL)"], [value, value, id]
+
+    @timed("filter", rows=True)
+    def select(self, filters: Dict[str, Any], conditions: List[Tuple] = (),
+               sort: Optional[str] = None, order: str = "asc",
+               offset: int = 0, limit: Optional[int] = None,
+               search: Optional[str] = None,
+               after: Optional[str] = None) -> pd.DataFrame:
+        """
+        Page of rows matching the equality filters, the (column, op,
+        value) conditions and the search terms, optionally sorted by a
+        column with nulls last, as one indexed SQL query (call under
+        read()). With a cursor from cursors() the page starts just past
+        the row it points to.
+        :param filters:
+        :param conditions:
+        :param sort:
+        :param order:
+        :param offset:
+        :param limit:
+        :param search:
+        :param after:
+        :return:
+        """
+        if sort is not None and sort not in self.kinds:
+            raise ValueError(f"Unknown sort column {sort}")
+        if order not in ("asc", "desc"):
+            raise ValueError(f"Unknown sort order {order}")
+        if limit is not None and limit < 0:
+            raise ValueError("limit must not be negative")
+        clauses, params = self._where(filters, conditions, search)
+        if after is not None:
+            clause, extra = self._after(after, sort, order)
+            clauses += clause
+            params += extra
+        sql = f"SELECT {self._select} FROM {self.table}"
+        if len(clauses) != 0:
+            sql += " WHERE " + " AND ".join(clauses)
+        if sort is None:
+            sql += " ORDER BY id"
+        else:
+            sql += f" ORDER BY {quote(sort)} {order.upper()} NULLS LAST, id"
+        sql += " LIMIT ? OFFSET ?"
+        params += [-1 if limit is None else limit, offset]
+        return self._frame(self._connection().execute(sql,
+                                                      params).fetchall())
+
+    def export(self, filters: Dict[str, Any], conditions: List[Tuple] = (),
+               sort: Optional[str] = None, order: str = "asc",
+               search: Optional[str] = None,
+               chunk_size: int = 1000) -> Iterator[List[bytes]]:
+        """
+        All rows matching a select() as chunks of JSON encoded rows, walked
+        with keyset cursors, one read transaction per chunk
+        :param filters:
+        :param conditions:
+        :param sort:
+        :param order:
+        :param search:
+        :param chunk_size:
+        :return:
+        """
+        after = None
+        while True:
+            with self.read():
+                data = self.select(filters, conditions, sort, order, 0,
+                                   chunk_size + 1, search, after)
+            more = data.shape[0] > chunk_size
+            data = data.iloc[:chunk_size]
+            rows = self.encode(data)
+            if more:
+                after = self.cursors(data.iloc[-1:], sort, order)[0]
+            if len(rows) != 0:
+                yield rows
+            if not more:
+                return
+
+    def _insert(self, connection: sqlite3.Connection, record: Dict):
+        columns = [col for col in self.columns if col in record]
+        connection.execute(
+            f"INSERT INTO {self.table} "
+            f"({', '.join(quote(col) for col in columns)}) "
+            f"VALUES ({', '.join('?' * len(columns))})",
+            [self._param(col, record[col]) for col in columns])
+        connection.execute("UPDATE meta SET value = value + 1 "
+                           "WHERE key = 'count'")
+
+    def _update(self, connection: sqlite3.Connection, id: int,
+                record: Dict) -> bool:
+        columns = [col for col in record if col in self.kinds and
+                   col != "id"]
+        if len(columns) == 0:
+            return connection.execute(
+                f"SELECT 1 FROM {self.table} WHERE id = ?",
+                (id,)).fetchone() is not None
+        return connection.execute(
+            f"UPDATE {self.table} SET "
+            f"{', '.join(f'{quote(col)} = ?' for col in columns)} "
+            f"WHERE id = ?",
+            [self._param(col, record[col]) for col in columns] + [id]
+        ).rowcount != 0
+
+    def _delete(self, connection: sqlite3.Connection, id: int) -> bool:
+        if connection.execute(f"DELETE FROM {self.table} WHERE id = ?",
+                              (id,)).rowcount == 0:
+            return False
+        connection.execute("UPDATE meta SET value = value - 1 "
+                           "WHERE key = 'count'")
+        return True
+
+    def _next_id(self, connection: sqlite3.Connection) -> int:
+        connection.execute("UPDATE meta SET value = value + 1 "
+                           "WHERE key = 'last_id'")
+        return int(self._meta(connection, "last_id"))
+
+    @timed("persist")
+    def create(self, record: Dict) -> int:
+        """
+        Insert a record and return its id
+        :param record:
+        :return:
+        """
+        with self._writing() as connection:
+            record["id"] = self._next_id(connection)
+            self._insert(connection, record)
+            return record["id"]
+
+    @timed("persist")
+    def update(self, id, record: Dict) -> bool:
+        """
+        Update a record
+        :param id:
+        :param record:
+        :return:
+        """
+        id = int(id)
+        record.pop("id", None)
+        with self._writing() as connection:
+            return self._update(connection, id, record)
+
+    @timed("persist")
+    def delete(self, id) -> bool:
+        """
+        Delete a record
+        :param id:
+        :return:
+        """
+        id = int(id)
+        with self._writing() as connection:
+            return self._delete(connection, id)
+
+    @timed("persist")
+    def bulk(self, items: List[Dict]) -> List[Dict]:
+        """
+        Apply a batch of create / update / delete items (see
+        Collection.bulk) in order, in one transaction
+        :param items:
+        :return: per item op, id, status and message
+        """
+        results = list()
+        columns = [col for col in self.columns if col != "id"]
+        with self._writing() as connection:
+            for item in items:
+                op, id = item.get("op"), item.get("id")
+                if "error" in item:
+                    results.append(self._result(op, id, 422, item["error"]))
+                    continue
+                if op == "create":
+                    record = dict(item.get("record") or dict())
+                    missing = [col for col in columns if col not in record]
+                    if len(missing) != 0:
+                        results.append(self._result(
+                            op, id, 422, f"Missing fields {missing}"))
+                        continue
+                    id = record["id"] = self._next_id(connection)
+                    self._insert(connection, record)
+                elif op in ("update", "delete"):
+                    try:
+                        id = int(id)
+                    except (TypeError, ValueError):
+                        results.append(self._result(op, id, 422,
+                                                    "Invalid id"))
+                        continue
+                    if op == "update":
+                        record = dict(item.get("record") or dict())
+                        record.pop("id", None)
+                        found = self._update(connection, id, record)
+                    else:
+                        found = self._delete(connection, id)
+                    if not found:
+                        results.append(self._result(op, id, 404,
+                                                    "No Data Found"))
+                        continue
+                else:
+                    results.append(self._result(op, id, 422,
+                                                f"Unknown operation {op}"))
+                    continue
+                results.append(self._result(op, id, 200, "success"))
+        return results
+
+    @staticmethod
+    def _result(op, id, status: int, message: str) -> Dict:
+        return {"op": op, "id": id, "status": status, "message": message}
+
+    def save(self):
+        """
+        Nothing to do, every write commits its own transaction
+        :return:
+        """
+
+    def flush(self, fsync: bool = True):
+        """
+        Nothing to do, every write commits its own transaction
+        :param fsync:
+        :return:
+        """
+
+    @timed("persist")
+    def write(self):
+        """
+        Atomically replace the JSON file with the records of the database,
+        read a chunk at a time, and remember it as imported
+        :return:
+        """
+        connection = self._connection()
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("[")
+            last = None
+            separator = "\n"
+            while True:
+                with self.read():
+                    sql = f"SELECT {self._select} FROM {self.table}"
+                    params: List = [self.chunk_rows]
+                    if last is not None:
+                        sql += " WHERE id > ?"
+                        params.insert(0, last)
+                    data = self._frame(connection.execute(
+                        sql + " ORDER BY id LIMIT ?", params).fetchall())
+                if data.shape[0] == 0:
+                    break
+                last = int(data.index[-1])
+                for row in self.encode(data):
+                    f.write(separator)
+                    f.write(row.decode("utf-8"))
+                    separator = ",\n"
+            f.write("\n]\n")
+        replace_file(tmp_path, self.path)
+        # told apart from an edit by the file watcher
+        self.written = file_signature(self.path)
+        self._set_meta(connection, "source",
+                       json.dumps({**self._source(),
+                                   "hash": file_hash(self.path)}))
+
+    def close(self):
+        """
+        Export the database to the JSON file on shutdown (a shared one is
+        exported once all workers are gone)
+        :return:
+        """
+        if self.shared:
+            return
+        self.write()
@@ -0,0 +1,95 @@
+from typing import Dict, Optional, Tuple, Callable
+from glob import glob
+from pathlib import Path
+from threading import Thread, Event
+from .snapshot import file_signature
+
+
+class Watcher:
+    """
+    Background polling of the data directory for JSON files changed, added
+    or removed on disk. A change is handed to on_change(name, file path,
+    None when removed) once the file held the same size and mtime for a
+    whole interval, so a file still being copied is not read half written;
+    the files the server writes itself (compaction, eviction, shutdown)
+    are recognized by the signature their collection recorded.
+    """
+
+    def __init__(self, data_path: str, collections: Dict,
+                 on_change: Callable[[str, Optional[str]], None],
+                 interval: float = 2.0):
+        self.data_path = data_path
+        self.collections = collections
+        self.on_change = on_change
+        self.interval = interval
+        self.known: Dict[str, Tuple[int, int]] = self._signatures()
+        self.pending: Dict[str, Optional[Tuple[int, int]]] = dict()
+        self.stopped = Event()
+        self.thread = None
+
+    def _signatures(self) -> Dict[str, Tuple[int, int]]:
+        signatures = dict()
+        for file_path in glob(f"{self.data_path}/*.json"):
+            signature = file_signature(file_path)
+            if signature is not None:
+                signatures[file_path] = signature
+        return signatures
+
+    def poll(self):
+        """
+        Compare the directory with the last poll and hand over the settled
+        changes
+        :return:
+        """
+        current = self._signatures()
+        for file_path in sorted(set(self.known) | set(current)):
+            signature = current.get(file_path)
+            if signature == self.known.get(file_path):
+                self.pending.pop(file_path, None)
+                continue
+            name = str(Path(file_path).name).split(".")[0]
+            collection = self.collections.get(name)
+            if signature is not None and \
+                    signature == getattr(collection, "written", None):
+                # written by the server
+                self.known[file_path] = signature
+                self.pending.pop(file_path, None)
+                continue
+            if file_path not in self.pending or \
+                    self.pending[file_path] != signature:
+                # wait for the file to settle
+                self.pending[file_path] = signature
+                continue
+            del self.pending[file_path]
+            if signature is None:
+                del self.known[file_path]
+            else:
+                self.known[file_path] = signature
+            try:
+                self.on_change(name, None if signature is None else file_path)
+            except Exception as e:
+                print(e)
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.poll()
+
+    def start(self):
+        """
+        Start the watching thread
+        :return:
+        """
+        self.stopped.clear()
+        self.thread = Thread(target=self._run, name="file-watcher",
+                             daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stop the watching thread
+        :return:
+        """
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
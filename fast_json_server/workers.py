@@ -0,0 +1,84 @@
+from typing import Dict, List, Optional
+import os
+import signal
+import socket
+import uvicorn
+from .collection import Collection
+
+
+def _listen(host: str, port: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _worker(app, sock: socket.socket, host: str, port: int, log_level):
+    code = 0
+    try:
+        config = uvicorn.Config(app, host=host, port=port,
+                                log_level=log_level)
+        uvicorn.Server(config).run(sockets=[sock])
+    except SystemExit as e:
+        code = e.code if isinstance(e.code, int) else 1
+    except Exception as e:
+        print(e)
+        code = 1
+    finally:
+        os._exit(code)
+
+
+def serve(app, host: str, port: int, log_level, workers: int = 1,
+          collections: Optional[Dict[str, Collection]] = None):
+    """
+    Run the app with uvicorn. With more than one worker the app (already
+    built, collections loaded) is forked into worker processes accepting
+    on one shared socket; the loaded frames are shared copy-on-write and
+    the collections, which must be shared ones, stay in step through their
+    journals. Once all workers exit, the journals are folded back into the
+    JSON files.
+    :param app:
+    :param host:
+    :param port:
+    :param log_level:
+    :param workers:
+    :param collections:
+    :return:
+    """
+    if workers <= 1:
+        uvicorn.run(app, host=host, port=port, log_level=log_level)
+        return
+    if not hasattr(os, "fork"):
+        raise ValueError("workers > 1 needs os.fork")
+    sock = _listen(host, port)
+    children: List[int] = list()
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            _worker(app, sock, host, port, log_level)
+        children.append(pid)
+    print(f"Started {workers} workers on {host}:{port}")
+
+    def stop(signum, frame):
+        for child in children:
+            try:
+                os.kill(child, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    for child in children:
+        os.waitpid(child, 0)
+    sock.close()
+    # Fold journals back into the JSON files
+    for collection in (collections or dict()).values():
+        try:
+            collection.sync()
+            collection.shared = False
+            collection.close()
+        except Exception as e:
+            print(e)
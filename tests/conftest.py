@@ -0,0 +1,36 @@
+import json
+import pytest
+from fast_json_server.collection import Collection
+from fast_json_server.journal import Journal, journal_path
+from fast_json_server.snapshot import read_data
+
+RECORDS = [
+    {"id": 1, "name": "alpha", "age": 30, "joined_at": "2020-01-01T00:00:00"},
+    {"id": 2, "name": "beta", "age": 25, "joined_at": "2020-02-01T00:00:00"},
+    {"id": 3, "name": "gamma", "age": 40, "joined_at": "2020-03-01T00:00:00"},
+]
+
+
+@pytest.fixture
+def data_file(tmp_path):
+    """
+    A users.json data file
+    """
+    path = tmp_path / "users.json"
+    path.write_text(json.dumps(RECORDS))
+    return str(path)
+
+
+def open_collection(path: str, **kwargs) -> Collection:
+    """
+    Collection of a data file with its journal, as the servers open them
+    """
+    return Collection("users", path, read_data(path),
+                      Journal(journal_path(path)), **kwargs)
+
+
+@pytest.fixture
+def collection(data_file):
+    collection = open_collection(data_file)
+    yield collection
+    collection.journal.close()
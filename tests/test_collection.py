@@ -0,0 +1,277 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+import pandas as pd
+import pytest
+from fast_json_server.collection import Collection
+from fast_json_server.journal import Journal, journal_path
+from fast_json_server.snapshot import read_data, sniff_data
+from conftest import open_collection
+
+
+def test_create_takes_the_next_id(collection):
+    assert collection.create({"name": "delta", "age": 20,
+                              "joined_at": "2021-01-01T00:00:00"}) == 4
+    assert collection.get(4)["name"] == "delta"
+
+
+def test_rejected_create_keeps_its_id(collection):
+    with pytest.raises(Exception):
+        collection.create({"name": "delta", "age": 20,
+                           "joined_at": "garbage"})
+    assert collection.create({"name": "delta", "age": 20,
+                              "joined_at": "2021-01-01T00:00:00"}) == 4
+
+
+def test_journal_is_replayed(data_file, collection):
+    collection.create({"name": "delta", "age": 20,
+                       "joined_at": "2021-01-01T00:00:00"})
+    collection.update(1, {"name": "renamed"})
+    collection.delete(2)
+    collection.flush()
+    reopened = open_collection(data_file)
+    try:
+        assert reopened.get(1)["name"] == "renamed"
+        assert reopened.get(2) is None
+        assert reopened.get(4)["name"] == "delta"
+        assert reopened.last_id == 4
+    finally:
+        reopened.journal.close()
+
+
+@pytest.mark.parametrize("indexed", [[], ["name", "age"]])
+def test_filters_with_and_without_indexes(collection, indexed):
+    collection.build_indexes(indexed)
+    collection.create({"name": "beta", "age": 50,
+                       "joined_at": "2021-01-01T00:00:00"})
+    with collection.read():
+        assert collection.select({"name": "beta"})["id"].tolist() == [2, 4]
+        assert collection.select({}, [("age", "gte", 30)], sort="age")[
+            "id"].tolist() == [1, 3, 4]
+
+
+@pytest.mark.parametrize("searched", [[], ["name"]])
+def test_search_with_and_without_token_index(collection, searched):
+    collection.build_search_index(searched)
+    collection.create({"name": "alpha beta", "age": 50,
+                       "joined_at": "2021-01-01T00:00:00"})
+    with collection.read():
+        assert collection.select({}, search="alpha")["id"].tolist() == [1, 4]
+        assert collection.select({}, search="bet")["id"].tolist() == [2, 4]
+        assert collection.select({}, search="alpha be")["id"].tolist() == [4]
+        assert collection.select({}, search="alp beta")["id"].tolist() == []
+
+
+def test_lazy_load_is_not_seen_half_built(data_file, monkeypatch):
+    building = threading.Event()
+    build_index = Collection.build_index
+
+    def slow_build_index(self):
+        building.set()
+        time.sleep(0.2)
+        build_index(self)
+
+    monkeypatch.setattr(Collection, "build_index", slow_build_index)
+    collection = Collection("users", data_file, None,
+                            Journal(journal_path(data_file)),
+                            loader=lambda: read_data(data_file),
+                            schema=sniff_data(data_file))
+    try:
+        loading = threading.Thread(target=collection.get, args=(1,))
+        loading.start()
+        building.wait()
+        assert collection.get(2)["name"] == "beta"
+        loading.join()
+    finally:
+        collection.journal.close()
+
+
+@pytest.mark.parametrize("bad", [{"joined_at": "garbage"}, {"age": "abc"}])
+def test_failed_bulk_changes_nothing(collection, bad):
+    collection.build_indexes(["name", "age"])
+    collection.build_search_index(["name"])
+    with collection.read():
+        before = collection.data.copy()
+    with pytest.raises(Exception):
+        collection.bulk([
+            {"op": "delete", "id": 1},
+            {"op": "update", "id": 2, "record": {"name": "renamed"}},
+            {"op": "update", "id": 3, "record": bad},
+        ])
+    with collection.read():
+        pd.testing.assert_frame_equal(collection.data, before)
+        assert collection.get(1)["name"] == "alpha"
+        assert collection.select({"name": "beta"})["id"].tolist() == [2]
+        assert collection.select({}, search="renamed").empty
+    assert collection.journal.size == 0
+
+
+def test_bulk_widens_compact_columns(collection):
+    results = collection.bulk([
+        {"op": "update", "id": 1, "record": {"age": 1000}},
+        {"op": "create", "record": {"name": "delta", "age": 2.5,
+                                    "joined_at": "2021-01-01T00:00:00"}},
+    ])
+    assert [result["status"] for result in results] == [200, 200]
+    assert collection.get(1)["age"] == 1000
+    assert collection.get(4)["age"] == 2.5
+
+
+@pytest.mark.parametrize("indexed", [[], ["name", "age"]])
+def test_reads_skip_deleted_rows(collection, indexed):
+    collection.build_indexes(indexed)
+    records = {1: ("alpha", 30), 2: ("beta", 25), 3: ("gamma", 40)}
+    rng = random.Random(0)
+    for step in range(100):
+        if rng.random() < 0.45 and len(records) != 0:
+            id = rng.choice(sorted(records))
+            assert collection.delete(id)
+            del records[id]
+        else:
+            record = (rng.choice(["alpha", "beta"]), rng.randint(20, 60))
+            records[collection.create({
+                "name": record[0], "age": record[1],
+                "joined_at": "2021-01-01T00:00:00"})] = record
+        ids = sorted(records)
+        by_age = sorted(ids, key=lambda id: (records[id][1], id))
+        with collection.read():
+            assert collection.count() == len(ids)
+            assert collection.select({})["id"].tolist() == ids
+            assert collection.select({}, offset=2, limit=3)["id"].tolist() \
+                == ids[2:5]
+            assert collection.select({"name": "beta"})["id"].tolist() == \
+                [id for id in ids if records[id][0] == "beta"]
+            assert collection.select({}, [("age", "gte", 40)], sort="age")[
+                "id"].tolist() == [id for id in by_age
+                                   if records[id][1] >= 40]
+            assert collection.lookup("age", [30, 31])["id"].tolist() == \
+                [id for id in ids if records[id][1] in (30, 31)]
+            page = collection.select({}, sort="age", limit=4)
+            after = collection.cursors(page.iloc[-1:], "age")[0]
+            assert collection.select({}, sort="age", limit=4, after=after)[
+                "id"].tolist() == by_age[4:8]
+
+
+def test_bulk_lets_reads_in_between_chunks(collection):
+    write = collection.lock.write
+    seen = list()
+
+    @contextmanager
+    def spied_write():
+        with write():
+            yield
+        # the lock is free again: a read goes through
+        with collection.read():
+            seen.append(collection.count())
+
+    collection.lock.write = spied_write
+    results = collection.bulk([
+        {"op": "create", "record": {"name": name, "age": 20,
+                                    "joined_at": "2021-01-01T00:00:00"}}
+        for name in ("delta", "epsilon", "zeta")], chunk_size=1)
+    assert [result["id"] for result in results] == [4, 5, 6]
+    assert seen[:4] == [3, 4, 5, 6]
+    assert collection.get(6)["name"] == "zeta"
+
+
+@pytest.mark.parametrize("indexed", [[], ["name", "age"]])
+@pytest.mark.parametrize("sort,order", [(None, "asc"), ("age", "asc"),
+                                        ("name", "desc")])
+def test_cursor_pages_walk_every_record_once(collection, indexed, sort,
+                                             order):
+    collection.build_indexes(indexed)
+    for age in (25, 30, 30, 50):
+        collection.create({"name": f"n{age}", "age": age,
+                           "joined_at": "2021-01-01T00:00:00"})
+    with collection.read():
+        expected = collection.select({}, sort=sort, order=order)[
+            "id"].tolist()
+    walked, after = list(), None
+    while True:
+        with collection.read():
+            page = collection.select({}, sort=sort, order=order, limit=2,
+                                     after=after)
+            if page.empty:
+                break
+            walked.extend(page["id"].tolist())
+            after = collection.cursors(page.iloc[-1:], sort, order)[0]
+        if len(walked) == 2:
+            # the row a cursor points to may go, the walk goes on past it
+            collection.delete(walked[-1])
+            expected.remove(walked[-1])
+            walked.pop()
+    assert walked == expected
+
+
+def test_cursor_of_another_sort_is_rejected(collection):
+    with collection.read():
+        page = collection.select({}, sort="age", limit=1)
+        after = collection.cursors(page, "age")[0]
+        with pytest.raises(ValueError):
+            collection.select({}, sort="name", after=after)
+        with pytest.raises(ValueError):
+            collection.select({}, after="not a cursor")
+
+
+def test_lazy_collection_loads_and_evicts(data_file):
+    collection = Collection("users", data_file, None,
+                            Journal(journal_path(data_file)),
+                            loader=lambda: read_data(data_file),
+                            schema=sniff_data(data_file))
+    try:
+        assert not collection.loaded()
+        assert collection.get(2)["name"] == "beta"
+        assert collection.loaded()
+        collection.create({"name": "delta", "age": 20,
+                           "joined_at": "2021-01-01T00:00:00"})
+        collection.last_access = time.monotonic()
+        assert not collection.evict(60)
+        assert collection.evict(0)
+        assert not collection.loaded()
+        # the journal was folded into the file before the rows were dropped
+        assert collection.journal.size == 0
+        assert read_data(data_file)["name"].tolist()[-1] == "delta"
+        assert collection.get(4)["name"] == "delta"
+        assert collection.create({"name": "epsilon", "age": 21,
+                                  "joined_at": "2021-01-01T00:00:00"}) == 5
+    finally:
+        collection.journal.close()
+
+
+def test_concurrent_writers_and_readers(collection):
+    collection.build_indexes(["name"])
+    errors = list()
+
+    def write(worker):
+        try:
+            for i in range(50):
+                id = collection.create({"name": f"w{worker}", "age": i,
+                                        "joined_at": "2021-01-01T00:00:00"})
+                if i % 3 == 0:
+                    assert collection.delete(id)
+        except Exception as e:
+            errors.append(e)
+
+    def read():
+        try:
+            while any(writer.is_alive() for writer in writers):
+                with collection.read():
+                    count = collection.count()
+                    ids = collection.select({})["id"].tolist()
+                    assert len(ids) == count == len(set(ids))
+        except Exception as e:
+            errors.append(e)
+
+    writers = [threading.Thread(target=write, args=(worker,))
+               for worker in range(4)]
+    readers = [threading.Thread(target=read) for _ in range(2)]
+    for thread in writers + readers:
+        thread.start()
+    for thread in writers + readers:
+        thread.join()
+    assert errors == []
+    with collection.read():
+        assert collection.count() == 3 + 4 * 33
+        assert collection.select({"name": "w0"}).shape[0] == 33
+    assert collection.last_id == 3 + 4 * 50
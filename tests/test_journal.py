@@ -0,0 +1,54 @@
+import json
+import os
+import pytest
+from fast_json_server.journal import Journal, replace_file
+from fast_json_server.rest_api import start_api
+from fast_json_server.sqlite_store import SqliteCollection
+from conftest import open_collection
+
+
+def test_replace_file(tmp_path):
+    path = tmp_path / "users.json"
+    path.write_text("old")
+    tmp = tmp_path / "users.json.tmp"
+    tmp.write_text("new")
+    replace_file(str(tmp), str(path))
+    assert path.read_text() == "new"
+    assert not tmp.exists()
+
+
+def test_journal_commit_and_replay(tmp_path):
+    journal = Journal(str(tmp_path / "users.journal"))
+    journal.write({"op": "delete", "id": 1})
+    journal.commit()
+    journal.write({"op": "delete", "id": 2})
+    journal.rotate()
+    journal.write({"op": "delete", "id": 3})
+    journal.commit()
+    assert [op["id"] for op in journal.replay()] == [1, 2, 3]
+    journal.discard_rotated()
+    assert [op["id"] for op in journal.replay()] == [3]
+    journal.close()
+
+
+def test_compaction_folds_the_journal_into_the_file(data_file, collection):
+    collection.update(1, {"name": "renamed"})
+    collection.flush()
+    collection.compact()
+    assert collection.journal.size == 0
+    assert not os.path.exists(collection.journal.old_path)
+    with open(data_file) as f:
+        assert json.load(f)[0]["name"] == "renamed"
+    reopened = open_collection(data_file)
+    try:
+        assert reopened.get(1)["name"] == "renamed"
+    finally:
+        reopened.journal.close()
+
+
+def test_unknown_fsync_policy(data_file):
+    with pytest.raises(ValueError):
+        start_api(os.path.dirname(data_file), "localhost", 3000, "info",
+                  fsync="sometimes")
+    with pytest.raises(ValueError):
+        SqliteCollection("users", data_file, fsync="sometimes")
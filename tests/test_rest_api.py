@@ -0,0 +1,74 @@
+import json
+import pytest
+from starlette.testclient import TestClient
+from fast_json_server import rest_api
+from conftest import RECORDS
+
+USERS = "/api/v1/users"
+
+
+@pytest.fixture(scope="module")
+def client(tmp_path_factory):
+    """
+    Client of the REST API serving a users.json, started once per module
+    (the app is module-global) without running a server
+    """
+    path = tmp_path_factory.mktemp("data")
+    (path / "users.json").write_text(json.dumps(RECORDS))
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(rest_api, "serve", lambda *args, **kwargs: None)
+        rest_api.start_api(data_path=str(path), host="localhost", port=0,
+                           log_level="warning", index_columns="all",
+                           load_workers=1)
+    with TestClient(rest_api.app) as client:
+        yield client
+
+
+def walk(client, params):
+    ids, cursor = list(), None
+    while True:
+        query = dict(params, _limit=1)
+        if cursor is not None:
+            query["_after"] = cursor
+        response = client.get(f"{USERS}/", params=query)
+        assert response.status_code == 200
+        content = response.json()
+        ids.extend(item["id"] for item in content["items"])
+        cursor = content["next_cursor"]
+        if cursor is None:
+            return ids
+
+
+def test_cursor_pagination(client):
+    assert walk(client, {}) == [1, 2, 3]
+    assert walk(client, {"_sort": "age"}) == [2, 1, 3]
+    assert walk(client, {"_sort": "age", "_order": "desc"}) == [3, 1, 2]
+    assert client.get(f"{USERS}/", params={"_after": "nope"}).status_code \
+        == 400
+
+
+def test_etag_revalidation(client):
+    page = client.get(f"{USERS}/", params={"_sort": "age"})
+    item = client.get(f"{USERS}/1")
+    for response, url, params in [(page, f"{USERS}/", {"_sort": "age"}),
+                                  (item, f"{USERS}/1", {})]:
+        assert response.status_code == 200
+        etag = response.headers["etag"]
+        again = client.get(url, params=params,
+                           headers={"If-None-Match": etag})
+        assert again.status_code == 304
+        assert again.headers["etag"] == etag
+    # a write changes the tags, the next revalidation gets the new rows
+    assert client.put(f"{USERS}/1", json={
+        "name": "renamed", "age": 30,
+        "joined_at": "2020-01-01T00:00:00"}).status_code == 200
+    changed = client.get(f"{USERS}/1",
+                         headers={"If-None-Match": item.headers["etag"]})
+    assert changed.status_code == 200
+    assert changed.json()["name"] == "renamed"
+    assert changed.headers["etag"] != item.headers["etag"]
+    changed = client.get(f"{USERS}/", params={"_sort": "age"},
+                         headers={"If-None-Match": page.headers["etag"]})
+    assert changed.status_code == 200
+    assert [item["name"] for item in changed.json()["page_data"]["items"]] \
+        == ["beta", "renamed", "gamma"]
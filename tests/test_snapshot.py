@@ -0,0 +1,76 @@
+import json
+import os
+import pytest
+from fast_json_server.snapshot import iter_chunks, load_file, read_compact, \
+    sniff_data
+
+RECORDS = [
+    {"id": 1, "name": "a \"quoted\" name", "tags": ["x", "y"]},
+    {"id": 2, "name": "brackets ]} in {[ a string", "tags": []},
+    {"id": 3, "name": "a trailing backslash \\", "tags": ["\\\""]},
+    {"id": 4, "name": "nested", "tags": [{"deep": [1, [2, {"k": "}"}]]}]},
+    {"id": 5, "name": "unicode é中", "tags": ["\\\\"]},
+]
+
+
+@pytest.fixture
+def records_file(tmp_path):
+    path = tmp_path / "records.json"
+    path.write_text(json.dumps(RECORDS, indent=2, ensure_ascii=False),
+                    encoding="utf-8")
+    return str(path)
+
+
+@pytest.mark.parametrize("chunk_rows", [1, 2, 5, 10])
+@pytest.mark.parametrize("chunk_bytes", [1, 3, 7, 64, 1024 * 1024])
+def test_iter_chunks(records_file, chunk_rows, chunk_bytes):
+    chunks = [json.loads(text) for text in
+              iter_chunks(records_file, chunk_rows, chunk_bytes)]
+    assert [len(chunk) for chunk in chunks[:-1]] == \
+        [chunk_rows] * (len(chunks) - 1)
+    assert [record for chunk in chunks for record in chunk] == RECORDS
+
+
+@pytest.mark.parametrize("text", ["[]", "", "  [\n]\n"])
+def test_iter_chunks_of_no_records(tmp_path, text):
+    path = tmp_path / "empty.json"
+    path.write_text(text)
+    assert list(iter_chunks(str(path), 10)) == []
+
+
+def test_read_compact(tmp_path):
+    path = tmp_path / "users.json"
+    path.write_text(json.dumps(
+        [{"id": i, "city": ["paris", "rome"][i % 2], "note": f"n{i}"}
+         for i in range(1, 101)]))
+    data = read_compact(str(path), chunk_rows=30)
+    assert data["id"].tolist() == list(range(1, 101))
+    assert data["city"].dtype == "category"
+    assert data["city"].tolist()[:3] == ["rome", "paris", "rome"]
+    assert data["note"].tolist()[-1] == "n100"
+
+
+def test_sniff_data(records_file):
+    data = sniff_data(records_file, rows=2)
+    assert data["id"].tolist() == [1, 2]
+    assert data["name"].tolist()[1] == "brackets ]} in {[ a string"
+
+
+def test_snapshot_is_reused_until_the_file_changes(records_file):
+    data, source, _ = load_file(records_file)
+    assert source == "json"
+    assert load_file(records_file)[1] == "snapshot"
+    # touched, same content: checked by hash and still reused
+    stat = os.stat(records_file)
+    os.utime(records_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    reused, source, _ = load_file(records_file)
+    assert source == "snapshot"
+    assert reused["id"].tolist() == data["id"].tolist()
+    # same size, other content
+    with open(records_file, "r+b") as f:
+        f.seek(f.read().index(b"nested"))
+        f.write(b"NESTED")
+    changed, source, _ = load_file(records_file)
+    assert source == "json"
+    assert changed["name"].tolist()[3] == "NESTED"
+    assert load_file(records_file)[1] == "snapshot"
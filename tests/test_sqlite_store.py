@@ -0,0 +1,98 @@
+import json
+import threading
+import pytest
+from fast_json_server.sqlite_store import SqliteCollection
+from fast_json_server.snapshot import read_data
+
+
+@pytest.fixture
+def store(data_file):
+    return SqliteCollection("users", data_file)
+
+
+def test_writes_and_reads(store):
+    assert store.create({"name": "delta", "age": 20,
+                         "joined_at": "2021-01-01T00:00:00"}) == 4
+    assert store.update(1, {"name": "renamed"})
+    assert store.delete(2)
+    assert not store.delete(2)
+    assert store.get(1)["name"] == "renamed"
+    assert store.get(2) is None
+    with store.read():
+        assert store.count() == 3
+        assert store.select({}, [("age", "gte", 25)], sort="age")[
+            "id"].tolist() == [1, 3]
+        assert store.select({"name": "delta"}).index.tolist() == [4]
+
+
+@pytest.mark.parametrize("indexed", [[], ["name", "age"]])
+def test_filters_search_and_cursors(store, indexed):
+    store.build_indexes(indexed)
+    store.build_search_index(["name"])
+    for age in (25, 30, 50):
+        store.create({"name": f"alpha n{age}", "age": age,
+                      "joined_at": "2021-01-01T00:00:00"})
+    with store.read():
+        assert store.select({}, search="alpha").index.tolist() == [1, 4, 5, 6]
+        expected = store.select({}, sort="age", order="desc").index.tolist()
+    walked, after = list(), None
+    while True:
+        with store.read():
+            page = store.select({}, sort="age", order="desc", limit=2,
+                                after=after)
+            if page.empty:
+                break
+            walked.extend(page.index.tolist())
+            after = store.cursors(page.iloc[-1:], "age", "desc")[0]
+    assert walked == expected
+
+
+def test_bulk_is_one_transaction(store):
+    results = store.bulk([
+        {"op": "create", "record": {"name": "delta", "age": 20,
+                                    "joined_at": "2021-01-01T00:00:00"}},
+        {"op": "update", "id": 9, "record": {"name": "nobody"}},
+        {"op": "delete", "id": 1},
+        {"op": "bogus"},
+    ])
+    assert [result["status"] for result in results] == [200, 404, 200, 422]
+    with store.read():
+        assert store.count() == 3
+    with pytest.raises(Exception):
+        store.bulk([{"op": "delete", "id": 2},
+                    {"op": "update", "id": 3, "record": {"age": "abc"}}])
+    assert store.get(2)["name"] == "beta"
+
+
+def test_written_back_and_imported_again(data_file, store):
+    store.create({"name": "delta", "age": 20,
+                  "joined_at": "2021-01-01T00:00:00"})
+    store.delete(1)
+    store.write()
+    assert read_data(data_file)["id"].tolist() == [2, 3, 4]
+    # an edit of the file is imported on the next open
+    records = json.loads(open(data_file).read())
+    records[0]["name"] = "edited"
+    with open(data_file, "w") as f:
+        json.dump(records, f)
+    reopened = SqliteCollection("users", data_file)
+    assert reopened.get(2)["name"] == "edited"
+    assert reopened.get(4)["name"] == "delta"
+
+
+def test_concurrent_creates_take_distinct_ids(store):
+    ids = list()
+
+    def create():
+        for _ in range(20):
+            ids.append(store.create({"name": "w", "age": 1,
+                                     "joined_at": "2021-01-01T00:00:00"}))
+
+    threads = [threading.Thread(target=create) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(ids) == list(range(4, 84))
+    with store.read():
+        assert store.count() == 83